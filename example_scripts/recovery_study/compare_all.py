@@ -1,5 +1,6 @@
 import logging
 import math
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
@@ -12,35 +13,46 @@ from compare_ferguson_dataset import compare_ferguson_dataset
 from compare_weigend_dataset import compare_weigend_dataset
 
 
-def grand_comparison(hz=10) -> pd.DataFrame:
+def grand_comparison(hz=10, workers: int = 1) -> pd.DataFrame:
     """
     compares W'bal and hydraulic models on all data sets.
     W'bart to Hyd_weig on Caen, Chidnok, Ferguson
     W'skib, W'weig to Hyd_weig on Bartram, Caen, Chidnok, Ferguson
     W'weig to Hyd_weig on all data sets.
     :param hz: simulation precision. 10 hz is a dt of 0.1
+    :param workers: number of worker processes for simulations. None uses all available cores.
     :return: all prediction errors and metric scores in a dataframe
     """
+    if workers == 1:
+        return _grand_comparison(hz=hz, executor=None)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return _grand_comparison(hz=hz, executor=executor)
+
+
+def _grand_comparison(hz, executor) -> pd.DataFrame:
+    """
+    runs grand_comparison with simulations distributed by given executor
+    """
 
     # run all simulations...
     logging.info("Begin Bartram Data Set")
-    bart_res = compare_bartram_dataset(hz=hz)
+    bart_res = compare_bartram_dataset(hz=hz, executor=executor)
     bart_res = pd.DataFrame.from_dict(bart_res, orient='index')
 
     logging.info("Begin Weigend Data Set")
-    weig_res = compare_weigend_dataset(hz=hz)
+    weig_res = compare_weigend_dataset(hz=hz, executor=executor)
     weig_res = pd.DataFrame.from_dict(weig_res, orient='index')
 
     logging.info("Begin Caen Data Set")
-    caen_res = compare_caen_2021_dataset(hz=hz)
+    caen_res = compare_caen_2021_dataset(hz=hz, executor=executor)
     caen_res = pd.DataFrame.from_dict(caen_res, orient='index')
 
     logging.info("Begin Chidnok Data Set")
-    chid_res = compare_chidnok_dataset(hz=hz)
+    chid_res = compare_chidnok_dataset(hz=hz, executor=executor)
     chid_res = pd.DataFrame.from_dict(chid_res, orient='index')
 
     logging.info("Begin Ferguson Data Set")
-    ferg_res = compare_ferguson_dataset(hz=hz)
+    ferg_res = compare_ferguson_dataset(hz=hz, executor=executor)
     ferg_res = pd.DataFrame.from_dict(ferg_res, orient='index')
 
     # get column labels
@@ -115,5 +127,5 @@ if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO,
                         format="%(asctime)s %(levelname)-5s %(name)s - %(message)s. "
                                "[file=%(filename)s:%(lineno)d]")
-    total = grand_comparison()
+    total = grand_comparison(workers=None)
     print(total.to_string())
@@ -14,11 +14,12 @@ from pypermod.simulator.study_simulator import StudySimulator
 import pypermod.config as pypconfig
 
 
-def compare_bartram_dataset(plot: bool = False, hz: int = 1) -> dict:
+def compare_bartram_dataset(plot: bool = False, hz: int = 1, executor=None) -> dict:
     """
     Runs the whole comparison on observations by Bartram et al.
     :param plot: whether the overview should be plotted or not
     :param hz: Simulation computations per second. 1/hz defines delta t for used agents
+    :param executor: optional executor, e.g., a ProcessPoolExecutor, to run simulations in parallel
     :return: predicted and ground truth measurements in a dict
     """
 
@@ -66,10 +67,8 @@ def compare_bartram_dataset(plot: bool = False, hz: int = 1) -> dict:
     agents = [skib, weig, hyd, bart]
 
     # run simulations for all dcp conditions
-    dcp_results = []
-    for p_rec in p_recs:
-        result = StudySimulator.standard_comparison(agents=agents, p_work=p_work, p_rec=p_rec, rec_times=plot_rec_times)
-        dcp_results.append(result)
+    dcp_results = StudySimulator.standard_comparisons(agents=agents, conditions=[(p_work, p_rec) for p_rec in p_recs],
+                                                      rec_times=plot_rec_times, executor=executor)
 
     # create overview plot if required
     if plot:
@@ -14,11 +14,12 @@ from pypermod.simulator.study_simulator import StudySimulator
 import pypermod.config as pypconfig
 
 
-def compare_caen_2021_dataset(plot: bool = False, hz: int = 1) -> dict:
+def compare_caen_2021_dataset(plot: bool = False, hz: int = 1, executor=None) -> dict:
     """
     Runs the whole comparison on observations by Caen et al.
     :param plot: whether the overview should be plotted or not
     :param hz: Simulation computations per second. 1/hz defines delta t for used agents
+    :param executor: optional executor, e.g., a ProcessPoolExecutor, to run simulations in parallel
     :return: predicted and ground truth measurements in a dict
     """
 
@@ -69,7 +70,8 @@ def compare_caen_2021_dataset(plot: bool = False, hz: int = 1) -> dict:
     results = StudySimulator.standard_comparison(agents=agents,
                                                  p_work=p_work,
                                                  p_rec=p_rec,
-                                                 rec_times=plot_rec_times)
+                                                 rec_times=plot_rec_times,
+                                                 executor=executor)
 
     if plot:
         # set up the figure
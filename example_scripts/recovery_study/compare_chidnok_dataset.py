@@ -16,11 +16,12 @@ from fitting_tau_chidnok import fit_taus_chidnok
 import pypermod.config as pypconfig
 
 
-def compare_chidnok_dataset(plot: bool = False, hz: int = 1) -> dict:
+def compare_chidnok_dataset(plot: bool = False, hz: int = 1, executor=None) -> dict:
     """
     Runs the whole comparison on observations by Chidnok et al.
     :param plot: whether the overview should be plotted or not
     :param hz: Simulation computations per second. 1/hz defines delta t for used agents
+    :param executor: optional executor, e.g., a ProcessPoolExecutor, to run simulations in parallel
     :return: predicted and ground truth measurements in a dict
     """
 
@@ -80,12 +81,12 @@ def compare_chidnok_dataset(plot: bool = False, hz: int = 1) -> dict:
                             the=p[5], gam=p[6], phi=p[7])
     agents = [skib, weig, hyd, bart]
 
-    dcp_results = []
+    # run simulations for all dcp conditions
+    dcp_results = StudySimulator.standard_comparisons(agents=agents, conditions=[(p_work, p_rec) for p_rec in p_recs],
+                                                      rec_times=plot_rec_times, executor=executor)
+
     ground_truth_v = []
     for i, p_rec in enumerate(p_recs):
-        result = StudySimulator.standard_comparison(agents=agents, p_work=p_work, p_rec=p_rec, rec_times=plot_rec_times)
-        dcp_results.append(result)
-
         fix_tau = WbalODEAgentFixTau(w_p=w_p, cp=cp, hz=hz, tau=ground_truth_fitted[i])
         gt_ratio = StudySimulator.get_recovery_ratio_wb1_wb2(fix_tau, p_work=p_work, p_rec=p_rec, t_rec=t_rec)
         ground_truth_v.append(gt_ratio)
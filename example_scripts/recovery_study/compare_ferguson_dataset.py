@@ -13,11 +13,12 @@ from pypermod.simulator.study_simulator import StudySimulator
 import pypermod.config as pypconfig
 
 
-def compare_ferguson_dataset(plot: bool = False, hz: int = 1) -> dict:
+def compare_ferguson_dataset(plot: bool = False, hz: int = 1, executor=None) -> dict:
     """
     Runs the whole comparison on observations by Ferguson et al.
     :param plot: whether the overview should be plotted or not
     :param hz: Simulation computations per second. 1/hz defines delta t for used agents
+    :param executor: optional executor, e.g., a ProcessPoolExecutor, to run simulations in parallel
     :return: predicted and ground truth measurements in a dict
     """
 
@@ -66,7 +67,8 @@ def compare_ferguson_dataset(plot: bool = False, hz: int = 1) -> dict:
     agents = [agent_bartram, agent_skiba_2015, agent_fit_caen, agent_hyd]
 
     # run the simulations
-    sims = StudySimulator.standard_comparison(agents=agents, p_work=p_work, p_rec=p_rec, rec_times=plot_rec_times)
+    sims = StudySimulator.standard_comparison(agents=agents, p_work=p_work, p_rec=p_rec, rec_times=plot_rec_times,
+                                              executor=executor)
     # display overview plot if required
     if plot:
         # set up the figure
@@ -14,12 +14,13 @@ from pypermod.simulator.study_simulator import StudySimulator
 import pypermod.config as pypconfig
 
 
-def compare_weigend_dataset(plot: bool = False, hz: int = 1) -> dict:
+def compare_weigend_dataset(plot: bool = False, hz: int = 1, executor=None) -> dict:
     """
     Runs the whole comparison on observations by Weigend et al. 2021
     derived from Caen et al. 2019.
     :param plot: whether the overview should be plotted or not
     :param hz: Simulation computations per second. 1/hz defines delta t for used agents
+    :param executor: optional executor, e.g., a ProcessPoolExecutor, to run simulations in parallel
     :return: predicted and ground truth measurements in a dict
     """
     # data is in the recovery_study subdirectory of data_storage
@@ -70,14 +71,9 @@ def compare_weigend_dataset(plot: bool = False, hz: int = 1) -> dict:
     agents = [agent_bartram, agent_skiba_2015, agent_fit_caen, agent_hyd]
 
     # run simulations for all four conditions
-    results_p4_cp_33 = StudySimulator.standard_comparison(agents=agents, p_work=p240, p_rec=cp_33,
-                                                          rec_times=plot_rec_times)
-    results_p4_cp_66 = StudySimulator.standard_comparison(agents=agents, p_work=p240, p_rec=cp_66,
-                                                          rec_times=plot_rec_times)
-    results_p8_cp_33 = StudySimulator.standard_comparison(agents=agents, p_work=p480, p_rec=cp_33,
-                                                          rec_times=plot_rec_times)
-    results_p8_cp_66 = StudySimulator.standard_comparison(agents=agents, p_work=p480, p_rec=cp_66,
-                                                          rec_times=plot_rec_times)
+    conditions = [(p240, cp_33), (p240, cp_66), (p480, cp_33), (p480, cp_66)]
+    results_p4_cp_33, results_p4_cp_66, results_p8_cp_33, results_p8_cp_66 = StudySimulator.standard_comparisons(
+        agents=agents, conditions=conditions, rec_times=plot_rec_times, executor=executor)
 
     # plot overview if required
     if plot:
@@ -1,6 +1,7 @@
 import logging
 
 import matplotlib.pyplot as plt
+import numpy as np
 from pypermod.agents.wbal_agents.wbal_ode_agent_fix_tau import WbalODEAgentFixTau
 from pypermod.fitter.tau_fit import TauFitter
 from pypermod.utility import PlotLayout
@@ -56,9 +57,9 @@ def fit_taus_chidnok(plot: bool = False):
 
         # verify that resulting time to exhaustion of increased(plus) and decreased(minus) tau
         # are further away from targeted time to exhaustion
-        tte_fit = bal.index(0) + 1  # plus 1 because time step 0 is the first second
-        tte_plus = bal_plus.index(0) + 1
-        tte_minus = bal_minus.index(0) + 1
+        tte_fit = np.flatnonzero(bal == 0)[0] + 1  # plus 1 because time step 0 is the first second
+        tte_plus = np.flatnonzero(bal_plus == 0)[0] + 1
+        tte_minus = np.flatnonzero(bal_minus == 0)[0] + 1
         tte_gt = ground_truth_v[i]  # ground truth
 
         # check if fitted tau is an actual local minimum
@@ -73,15 +74,15 @@ def fit_taus_chidnok(plot: bool = False):
             fig = plt.figure(figsize=(8, 5))
             PlotLayout.set_rc_params()
             ax = fig.add_subplot(1, 1, 1)
-            ax.plot(bal_minus[:bal_minus.index(0) + 1], linewidth=5, color="tab:orange",
+            ax.plot(bal_minus[:tte_minus], linewidth=5, color="tab:orange",
                     label="$W'_{bal-ode}\;with\;\mathcal{T} = $" + str(round(tau - 0.5, 2)))
-            ax.plot(bal[:bal.index(0) + 1], linewidth=2, color="tab:blue",
+            ax.plot(bal[:tte_fit], linewidth=2, color="tab:blue",
                     label="$W'_{bal-ode}\;with\;\mathcal{T} = $" + str(round(tau, 2)))
-            ax.plot(bal_plus[:bal_plus.index(0) + 1], linewidth=3, color="tab:green",
+            ax.plot(bal_plus[:tte_plus], linewidth=3, color="tab:green",
                     label="$W'_{bal-ode}\;with\;\mathcal{T} = $" + str(round(tau + 0.5, 2)))
-            ax.scatter([bal.index(0), bal_plus.index(0), bal_minus.index(0)], [0, 0, 0],
+            ax.scatter([tte_fit - 1, tte_plus - 1, tte_minus - 1], [0, 0, 0],
                        label="points of exhaustion", color="red")
-            ax.set_xticks([0, 59, 89, bal_plus.index(0), ground_truth_v[i] - 1, bal.index(0)])
+            ax.set_xticks([0, 59, 89, tte_plus - 1, ground_truth_v[i] - 1, tte_fit - 1])
             ax.set_xticklabels([1, 60, 90, tte_plus, tte_gt, tte_fit], rotation=-45)
             ax.axvline(ground_truth_v[i], label="target ground truth", color="grey", linestyle="--")
             ax.set_title("Chidnok protocol with recovery intensity {} watts".format(t[1]))
@@ -91,14 +92,14 @@ def fit_taus_chidnok(plot: bool = False):
 
             # small zoomed-in detail window
             insert_ax = ax.inset_axes([0.55, 0.50, 0.4, 0.4])
-            insert_ax.scatter([bal.index(0), bal_minus.index(0)], [0, 0],
+            insert_ax.scatter([tte_fit - 1, tte_minus - 1], [0, 0],
                               label="points of exhaustion", color="red",
                               s=60)
             insert_ax.plot(bal[:tte_fit], color="tab:blue", linewidth=3)
             insert_ax.plot(bal_minus[:tte_minus], color="tab:orange", linewidth=5)
             insert_ax.set_xlim((tte_fit - 2, tte_fit + 1))
             insert_ax.set_ylim((0, bal[tte_fit - 2]))
-            insert_ax.set_xticks([bal.index(0), bal_minus.index(0)])
+            insert_ax.set_xticks([tte_fit - 1, tte_minus - 1])
             insert_ax.set_xticklabels([tte_fit, tte_minus])
             insert_ax.set_title("detail view")
 
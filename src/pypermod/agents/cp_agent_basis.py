@@ -30,6 +30,20 @@ class CpAgentBasis:
         """
         pass
 
+    def get_state(self) -> dict:
+        """
+        Snapshot of all variable parameters including step counter and time. Constants are not part of it.
+        :return: a flat dictionary that can be passed to set_state
+        """
+        return {}
+
+    def set_state(self, state: dict):
+        """
+        restores variable parameters from a snapshot of get_state
+        :param state: snapshot dictionary
+        """
+        pass
+
     def get_name(self) -> str:
         """
         :return: a descriptive name
@@ -57,12 +57,37 @@ class HydAgentBasis:
         # power output params
         self._pow = 0
 
+    def get_state(self) -> dict:
+        """
+        Snapshot of all variable parameters including step counter and time. Constants are not part of it.
+        :return: a flat dictionary that can be passed to set_state
+        """
+        return {"step": self._step, "hz_t": self._hz_t, "pow": self._pow}
+
+    def set_state(self, state: dict):
+        """
+        restores variable parameters from a snapshot of get_state
+        :param state: snapshot dictionary
+        """
+        self._step = state["step"]
+        self._hz_t = state["hz_t"]
+        self._pow = state["pow"]
+
     def get_time(self) -> float:
         """
         :return: time in seconds considering the agent's hz setting
         """
         return self._hz_t
 
+    def advance_time(self, steps: int = 1):
+        """
+        increases step counter and time by given number of steps. Used by batch step functions and solvers
+        that update the fill levels of the agent themselves.
+        :param steps: number of performed steps
+        """
+        self._step = self._step + steps
+        self._hz_t = self._step / self._hz
+
     def perform_one_step(self) -> float:
         """
         Updates power output and internal W' balance parameters.
@@ -1,6 +1,7 @@
 from pypermod import config
 
 from pypermod.agents.hyd_agents.hyd_agent_basis import HydAgentBasis
+from pypermod.agents.hyd_agents.three_comp_hyd_kernel import simulate_three_comp_steps
 
 
 class ThreeCompHydAgent(HydAgentBasis):
@@ -58,6 +59,7 @@ class ThreeCompHydAgent(HydAgentBasis):
         self.__p_u = 0.0  # flow from U to LF
         self.__p_l = 0.0  # flow from LS to LF (bi-directional)
         self.__m_flow = 0.0  # maximal flow through pg according to liquid diffs
+        self._exhausted = False
 
     def __str__(self):
         """
@@ -189,6 +191,46 @@ class ThreeCompHydAgent(HydAgentBasis):
 
         return self._pow
 
+    def perform_power_steps(self, powers, stop_at_exhaustion: bool = False):
+        """
+        Performs one step per given power demand in a single kernel call. The kernel is compiled with Numba
+        if it is installed and config.three_comp_jit is set. Results equal calling set_power and
+        perform_one_step for every power demand.
+        :param powers: list or array of power demands in Watts
+        :param stop_at_exhaustion: whether to stop at the first step with an empty LF
+        :return: arrays of h and g after every performed step
+        """
+        h_hist, g_hist, _, _, _ = self.perform_power_steps_detail(powers, stop_at_exhaustion=stop_at_exhaustion)
+        return h_hist, g_hist
+
+    def perform_power_steps_detail(self, powers, stop_at_exhaustion: bool = False):
+        """
+        Same as perform_power_steps but returns the flows of every step as well
+        :param powers: list or array of power demands in Watts
+        :param stop_at_exhaustion: whether to stop at the first step with an empty LF
+        :return: arrays of h, g, p_u, p_l, and m_flow after every performed step
+        """
+        (h_hist, g_hist, p_u_hist, p_l_hist, m_flow_hist), m_flow, error = simulate_three_comp_steps(
+            powers, h=self.__h, g=self.__g, m_flow=self.__m_flow, hz=self._hz,
+            lf=self.__lf, ls=self.__ls, m_u=self.__m_u, m_ls=self.__m_ls, m_lf=self.__m_lf,
+            theta=self.__theta, gamma=self.__gamma, phi=self.__phi,
+            stop_at_exhaustion=stop_at_exhaustion, use_jit=config.three_comp_jit)
+
+        steps = len(h_hist)
+        if steps > 0:
+            self.__h, self.__g = float(h_hist[-1]), float(g_hist[-1])
+            self.__p_u, self.__p_l = float(p_u_hist[-1]), float(p_l_hist[-1])
+            self.__m_flow = m_flow
+            self._exhausted = self.__h >= 1.0
+            self._pow = powers[steps - 1]
+            self.advance_time(steps)
+
+        if error:
+            # the regular step raises the detailed report of the unhandled state
+            self.set_power(powers[steps])
+            self.perform_one_step()
+        return h_hist, g_hist, p_u_hist, p_l_hist, m_flow_hist
+
     def is_exhausted(self) -> bool:
         """
         exhaustion is reached when level in LF cannot sustain power demand
@@ -218,6 +260,28 @@ class ThreeCompHydAgent(HydAgentBasis):
         self.__g = 0  # state of depletion of vessel LS
         self.__p_u = 0  # flow from U to LF
         self.__p_l = 0  # flow from LS to LF
+        self.__m_flow = 0  # maximal flow through pg according to liquid diffs
+        self._exhausted = False
+
+    def get_state(self) -> dict:
+        """
+        :return: snapshot of fill-levels, flows, power, step counter and time
+        """
+        state = super().get_state()
+        state.update(h=self.__h, g=self.__g, p_u=self.__p_u, p_l=self.__p_l, m_flow=self.__m_flow)
+        return state
+
+    def set_state(self, state: dict):
+        """
+        restores fill-levels, flows, power, step counter and time from a snapshot of get_state
+        :param state: snapshot dictionary
+        """
+        super().set_state(state)
+        self.__h = state["h"]
+        self.__g = state["g"]
+        self.__p_u = state["p_u"]
+        self.__p_l = state["p_l"]
+        self.__m_flow = state["m_flow"]
 
     def get_w_p_ratio(self):
         """
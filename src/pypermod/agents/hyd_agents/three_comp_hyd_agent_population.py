@@ -0,0 +1,239 @@
+import numpy as np
+from pypermod import config
+from pypermod.agents.hyd_agents.three_comp_hyd_agent import ThreeCompHydAgent
+
+
+class ThreeCompHydAgentPopulation:
+    """
+    Holds N configurations of the three component hydraulic model and their tank states in NumPy arrays and
+    steps all of them in lockstep. The branches of ThreeCompHydAgent._estimate_possible_power_output are
+    evaluated as masks, so that every configuration follows exactly the path of a single agent.
+    Configurations that run into an unhandled fill-level state don't raise an error as a single agent would.
+    They are marked as failed instead and are not stepped any further.
+    """
+
+    def __init__(self, hz: int, configs):
+        """
+        :param hz: calculations per second
+        :param configs: N x 8 array with one configuration [lf, ls, m_u, m_ls, m_lf, theta, gamma, phi] per row
+        """
+        np_configs = np.atleast_2d(np.asarray(configs, dtype=float))
+        if np_configs.ndim != 2 or np_configs.shape[1] != 8:
+            raise UserWarning("Configurations need 8 parameters per row, got {}".format(np_configs.shape))
+
+        self._hz = hz
+
+        # constants
+        self._lf, self._ls, self._m_u, self._m_ls, self._m_lf, self._theta, self._gamma, self._phi = \
+            [np_configs[:, i].copy() for i in range(8)]
+        self._height_ls = 1 - self._theta - self._gamma
+        # derived constants that are reused in every step
+        self._u_exit = 1 - self._phi
+        self._ls_exit = 1 - self._gamma
+        self._inv_areas = (1 / self._ls) + (1 / self._lf)
+
+        # the LS tank has to have a positive size
+        if np.any(self._height_ls <= 0):
+            raise UserWarning("LS has negative height in configurations {}".format(
+                np.flatnonzero(self._height_ls <= 0)))
+        # the optional LS tank constraint
+        if config.three_comp_phi_constraint is True:
+            if np.any(self._phi > self._gamma):
+                raise UserWarning("phi not smaller gamma in configurations {}".format(
+                    np.flatnonzero(self._phi > self._gamma)))
+
+        # variable parameters
+        n = len(np_configs)
+        self._h = np.zeros(n)  # state of depletion of vessel LF
+        self._g = np.zeros(n)  # state of depletion of vessel LS
+        self._p_u = np.zeros(n)  # flow from U to LF
+        self._p_l = np.zeros(n)  # flow from LS to LF (bi-directional)
+        self._m_flow = np.zeros(n)  # maximal flow through pg according to liquid diffs
+        self._failed = np.zeros(n, dtype=bool)  # ran into an unhandled fill-level state
+
+        # simulation management parameters. Every configuration counts its own steps.
+        self._steps = np.zeros(n, dtype=int)
+        self._pow = np.zeros(n)
+
+    @staticmethod
+    def from_agents(agents: list):
+        """
+        creates a population with the configurations of given agents. Their states are not copied.
+        :param agents: list of ThreeCompHydAgents
+        :return: population instance
+        """
+        hzs = set([agent.hz for agent in agents])
+        if len(hzs) != 1:
+            raise UserWarning("All agents of a population have to operate at the same hz, got {}".format(hzs))
+        configs = [[a.lf, a.ls, a.m_u, a.m_ls, a.m_lf, a.theta, a.gamma, a.phi] for a in agents]
+        return ThreeCompHydAgentPopulation(hz=agents[0].hz, configs=configs)
+
+    def __len__(self):
+        """:return: number of configurations in the population"""
+        return len(self._h)
+
+    @property
+    def hz(self) -> int:
+        """
+        :return: number of obs per second
+        """
+        return self._hz
+
+    @property
+    def configs(self) -> np.ndarray:
+        """
+        :return: N x 8 array of configurations [lf, ls, m_u, m_ls, m_lf, theta, gamma, phi]
+        """
+        return np.stack([self._lf, self._ls, self._m_u, self._m_ls, self._m_lf,
+                         self._theta, self._gamma, self._phi], axis=1)
+
+    def get_agent(self, i: int) -> ThreeCompHydAgent:
+        """
+        :return: a single agent with the i-th configuration
+        """
+        return ThreeCompHydAgent(self._hz, *self.configs[i])
+
+    def reset(self):
+        """
+        reset internal values of all configurations to default
+        """
+        self._h = np.zeros(len(self))
+        self._g = np.zeros(len(self))
+        self._p_u = np.zeros(len(self))
+        self._p_l = np.zeros(len(self))
+        self._failed = np.zeros(len(self), dtype=bool)
+        self._steps = np.zeros(len(self), dtype=int)
+        self._pow = np.zeros(len(self))
+
+    def get_time(self) -> np.ndarray:
+        """
+        :return: time in seconds of every configuration considering the hz setting
+        """
+        return self._steps / self._hz
+
+    def set_power(self, power):
+        """
+        set power demands
+        :param power: one power in Watts for all configurations or an array with one power per configuration
+        """
+        self._pow = np.broadcast_to(np.asarray(power, dtype=float), (len(self),)).copy()
+
+    def get_power(self) -> np.ndarray:
+        """
+        :return: power demands in Watts
+        """
+        return self._pow
+
+    def get_h(self) -> np.ndarray:
+        """
+        :return: states of depletion of vessels LF
+        """
+        return self._h
+
+    def set_h(self, h):
+        """
+        setter for states of depletion of vessels LF
+        """
+        self._h = np.broadcast_to(np.asarray(h, dtype=float), (len(self),)).copy()
+
+    def get_g(self) -> np.ndarray:
+        """
+        :return: states of depletion of vessels LS
+        """
+        return self._g
+
+    def set_g(self, g):
+        """
+        setter for states of depletion of vessels LS
+        """
+        self._g = np.broadcast_to(np.asarray(g, dtype=float), (len(self),)).copy()
+
+    def get_w_p_ratio(self) -> np.ndarray:
+        """
+        :return: wp estimations between 0 and 1 for comparison to CP models
+        """
+        return 1.0 - self._h
+
+    def is_exhausted(self) -> np.ndarray:
+        """
+        exhaustion is reached when level in LF cannot sustain power demand
+        :return: boolean array
+        """
+        return self._h >= 1.0
+
+    def is_failed(self) -> np.ndarray:
+        """
+        :return: boolean array of configurations that ran into an unhandled fill-level state
+        """
+        return self._failed
+
+    def perform_one_step(self, mask=None):
+        """
+        Updates tank fill-levels and flows of all configurations by one step.
+        :param mask: optional boolean array of configurations to step. Others keep their state and time.
+        """
+        active = ~self._failed
+        if mask is not None:
+            active = active & mask
+
+        h, g = self._h, self._g
+        lf, ls, theta, height_ls = self._lf, self._ls, self._theta, self._height_ls
+        u_exit, ls_exit = self._u_exit, self._ls_exit
+
+        # step 1: drop level in LF according to power demand
+        h = h + self._pow / lf / self._hz
+
+        # step 2 a: determine oxygen energy flow (P_U)
+        u_scaled = (0 <= h) & (h < u_exit)
+        u_max = u_exit <= h
+        failed = ~(u_scaled | u_max)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p_u = np.where(u_scaled, self._m_u * h / u_exit, self._m_u)
+        p_u = p_u / self._hz
+
+        # step 2 b: determine the slow component energy flow (P_L)
+        no_change = ((h <= theta) & (g == 0)) | \
+                    ((h >= ls_exit) & (g == height_ls)) | \
+                    (h == (g + theta))
+        restore = ~no_change & (h < g + theta) & (g > 0)
+        utilise = ~no_change & ~restore & ((g + theta) < h) & (h < ls_exit)
+        utilise_max = ~no_change & ~restore & ~utilise & (ls_exit <= h) & (g < height_ls)
+        failed |= ~no_change & ~(restore | utilise | utilise_max)
+
+        p_l = np.zeros(len(self))
+        p_l[restore] = -self._m_lf[restore] * (g[restore] + theta[restore] - h[restore]) / ls_exit[restore]
+        p_l[utilise] = self._m_ls[utilise] * (h[utilise] - g[utilise] - theta[utilise]) / height_ls[utilise]
+        p_l[utilise_max] = self._m_ls[utilise_max] * (height_ls[utilise_max] - g[utilise_max]) / \
+                           height_ls[utilise_max]
+
+        # the level swap guard is only updated where LS contributes
+        flows = ~no_change
+        m_flow = np.where(flows, (h - (g + theta)) / self._inv_areas, self._m_flow)
+
+        # consider delta t before extreme values get capped
+        p_l = np.where(flows, p_l / self._hz, p_l)
+
+        # Cap flow according to estimated limits
+        neg = flows & (p_l < 0)
+        p_l = np.where(neg, np.maximum(np.maximum(p_l, m_flow), -g * ls), p_l)
+        pos = flows & (p_l > 0)
+        p_l = np.where(pos, np.minimum(np.minimum(p_l, m_flow), (height_ls - g) * ls), p_l)
+
+        # level LS is adapted to estimated change
+        g = g + p_l / ls
+        # refill or deplete LF according to LS flow and Power demand
+        h = h - (p_u + p_l) / lf
+
+        # step 3: apply limits so that tanks cannot be fuller than full or emptier than empty
+        g = np.minimum(np.maximum(g, 0.0), height_ls)
+        h = np.minimum(np.maximum(h, 0.0), 1.0)
+
+        # configurations in unhandled states keep their last valid state
+        self._failed = self._failed | (active & failed)
+        active = active & ~failed
+        self._h = np.where(active, h, self._h)
+        self._g = np.where(active, g, self._g)
+        self._p_u = np.where(active, p_u, self._p_u)
+        self._p_l = np.where(active, p_l, self._p_l)
+        self._m_flow = np.where(active, m_flow, self._m_flow)
+        self._steps = self._steps + active
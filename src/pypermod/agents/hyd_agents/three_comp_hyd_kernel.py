@@ -0,0 +1,138 @@
+import numpy as np
+
+# Numba is optional. Without it the kernel runs as plain Python on floats.
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _three_comp_steps(powers, h, g, m_flow, hz, lf, ls, m_u, m_ls, m_lf, theta, gamma, phi,
+                      stop_at_exhaustion, h_hist, g_hist, p_u_hist, p_l_hist, m_flow_hist):
+    """
+    Advances the three component hydraulic model through given power demands. This is a flat copy of
+    ThreeCompHydAgent._estimate_possible_power_output and has to be kept in sync with it. States of every
+    step are written into the given history arrays.
+    :return: number of performed steps, m_flow after the last step, and a flag whether the step after the
+    performed ones ran into an unhandled fill-level state
+    """
+    height_ls = 1 - theta - gamma
+    for i in range(len(powers)):
+        # an exhausted agent doesn't step any further
+        if stop_at_exhaustion and h >= 1.0:
+            return i, m_flow, False
+
+        h_prev = h
+        g_prev = g
+        m_flow_prev = m_flow
+
+        # step 1: drop level in LF according to power demand
+        h += powers[i] / lf / hz
+
+        # step 2 a: determine oxygen energy flow (P_U)
+        if 0 <= h < (1 - phi):
+            p_u = m_u * h / (1 - phi)
+        elif (1 - phi) <= h:
+            p_u = m_u
+        else:
+            return i, m_flow_prev, True
+        p_u = p_u / hz
+
+        # step 2 b: determine the slow component energy flow (P_L)
+        if h <= theta and g == 0:
+            p_l = 0.0
+        elif h >= (1 - gamma) and g == height_ls:
+            p_l = 0.0
+        elif h == (g + theta):
+            p_l = 0.0
+        else:
+            if h < g + theta and g > 0:
+                p_l = -m_lf * (g + theta - h) / (1 - gamma)
+            elif (g + theta) < h < (1 - gamma):
+                p_l = m_ls * (h - g - theta) / height_ls
+            elif (1 - gamma) <= h and g < height_ls:
+                p_l = m_ls * (height_ls - g) / height_ls
+            else:
+                return i, m_flow_prev, True
+
+            # guard against flows that cause level height swaps between LS and LF
+            m_flow = ((h - (g + theta)) / ((1 / ls) + (1 / lf)))
+
+            p_l = p_l / hz
+
+            # Cap flow according to estimated limits
+            if p_l < 0:
+                p_l = max(p_l, m_flow)
+                p_l = max(p_l, -g * ls)
+            elif p_l > 0:
+                p_l = min(p_l, m_flow)
+                p_l = min(p_l, (height_ls - g) * ls)
+
+        g += p_l / ls
+        h -= (p_u + p_l) / lf
+
+        # step 3: apply limits so that tanks cannot be fuller than full or emptier than empty
+        g = max(g, 0.0)
+        g = min(g, height_ls)
+        h = max(h, 0.0)
+        h = min(h, 1.0)
+
+        h_hist[i] = h
+        g_hist[i] = g
+        p_u_hist[i] = p_u
+        p_l_hist[i] = p_l
+        m_flow_hist[i] = m_flow
+
+    return len(powers), m_flow, False
+
+
+if njit is not None:
+    _three_comp_steps_jit = njit(cache=True)(_three_comp_steps)
+else:
+    _three_comp_steps_jit = None
+
+
+def jit_available() -> bool:
+    """
+    :return: whether the Numba compiled kernel is available
+    """
+    return _three_comp_steps_jit is not None
+
+
+def simulate_three_comp_steps(powers, h: float, g: float, m_flow: float, hz: int,
+                              lf: float, ls: float, m_u: float, m_ls: float, m_lf: float,
+                              theta: float, gamma: float, phi: float,
+                              stop_at_exhaustion: bool = False, use_jit: bool = True):
+    """
+    Advances a three component hydraulic model from given fill-levels through an array of power demands.
+    Uses a Numba compiled kernel if Numba is installed and a pure Python loop otherwise. Both reproduce
+    ThreeCompHydAgent step by step.
+    :param powers: array of power demands in Watts. One per step.
+    :param h: initial state of depletion of LF
+    :param g: initial state of depletion of LS
+    :param m_flow: initial maximal flow through pg from liquid height diffs
+    :param hz: calculations per second
+    :param stop_at_exhaustion: whether to stop at the first step with an empty LF
+    :param use_jit: whether the compiled kernel should be used if it is available
+    :return: (h, g, p_u, p_l, m_flow) histories of performed steps, m_flow after the last step, and a flag
+    whether the next step ran into an unhandled fill-level state
+    """
+    np_powers = np.ascontiguousarray(powers, dtype=float)
+    h_hist = np.empty(len(np_powers))
+    g_hist = np.empty(len(np_powers))
+    p_u_hist = np.empty(len(np_powers))
+    p_l_hist = np.empty(len(np_powers))
+    m_flow_hist = np.empty(len(np_powers))
+
+    args = (float(h), float(g), float(m_flow), float(hz), float(lf), float(ls), float(m_u), float(m_ls),
+            float(m_lf), float(theta), float(gamma), float(phi), bool(stop_at_exhaustion))
+    if use_jit and _three_comp_steps_jit is not None:
+        steps, m_flow, error = _three_comp_steps_jit(np_powers, *args, h_hist, g_hist, p_u_hist, p_l_hist,
+                                                     m_flow_hist)
+    else:
+        # python floats are faster to operate on than NumPy scalars
+        steps, m_flow, error = _three_comp_steps(np_powers.tolist(), *args, h_hist, g_hist, p_u_hist, p_l_hist,
+                                                 m_flow_hist)
+
+    hists = (h_hist[:steps], g_hist[:steps], p_u_hist[:steps], p_l_hist[:steps], m_flow_hist[:steps])
+    return hists, m_flow, error
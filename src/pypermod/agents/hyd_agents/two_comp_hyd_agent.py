@@ -1,3 +1,6 @@
+import math
+
+import numpy as np
 from pypermod.agents.hyd_agents.hyd_agent_basis import HydAgentBasis
 
 
@@ -49,6 +52,30 @@ class TwoCompHydAgent(HydAgentBasis):
         """:return max flow through R1"""
         return self.__cp
 
+    def reset(self):
+        """power parameters"""
+        super().reset()
+        # variable parameters
+        self.__h = 0  # state of depletion of vessel W'
+        self.__p_ae = 0  # flow from Ae
+
+    def get_state(self) -> dict:
+        """
+        :return: snapshot of the fill-level of An, the flow from Ae, power, step counter and time
+        """
+        state = super().get_state()
+        state.update(h=self.__h, p_ae=self.__p_ae)
+        return state
+
+    def set_state(self, state: dict):
+        """
+        restores fill-level, flow, power, step counter and time from a snapshot of get_state
+        :param state: snapshot dictionary
+        """
+        super().set_state(state)
+        self.__h = state["h"]
+        self.__p_ae = state["p_ae"]
+
     def get_w_p_balance(self):
         """:return remaining energy in W' tank"""
         return (1.0 - self.psi - self.__h) / (1.0 - self.psi) * self.__an
@@ -66,36 +93,245 @@ class TwoCompHydAgent(HydAgentBasis):
         Update internal capacity estimations by one step.
         :return: the amount of power that the athlete was able to put out
         """
+        self.__h, self.__p_ae = self.__get_next_state(self.__h, self._pow)
+        return self._pow
+
+    def __get_next_state(self, h: float, p: float):
+        """
+        Estimates the state of the model after one step at given power output.
+        :param h: current fill-level of An
+        :param p: power output in Watts
+        :return: fill-level of An and flow from Ae after the step
+        """
 
         # the change on fill-level of An by flow from tap
-        self.__h += (1.0 - self.psi) * self._pow / self.__an / self._hz
+        h += (1.0 - self.psi) * p / self.__an / self._hz
 
         # level An above pipe exit. Scale flow according to h level
-        if (self.__h + self.__psi) <= (1.0 - self.__phi):
-            self.__p_ae = self.__cp * (self.__h + self.__psi) / (1.0 - self.__phi)
+        if (h + self.__psi) <= (1.0 - self.__phi):
+            p_ae = self.__cp * (h + self.__psi) / (1.0 - self.__phi)
 
         # at maximum rate because level h is below pipe exit of p_Ae
         else:
-            self.__p_ae = self.__cp
+            p_ae = self.__cp
 
         # consider hz (delta t)
-        self.__p_ae = self.__p_ae / self._hz
+        p_ae = p_ae / self._hz
 
         # due to psi there might be pressure on p_ae even though the tap is closed and An is full
-        if self.__p_ae > self.get_w_p_balance():
-            self.__p_ae = self.get_w_p_balance()
+        w_bal = (1.0 - self.psi - h) / (1.0 - self.psi) * self.__an
+        if p_ae > w_bal:
+            p_ae = w_bal
 
         # the change on fill-level of An by flow from Ae
-        self.__h -= (1.0 - self.psi) * self.__p_ae / self.__an
+        h -= (1.0 - self.psi) * p_ae / self.__an
 
         # also W' cannot be fuller than full
-        if self.__h < 0:
-            self.__h = 0
+        if h < 0:
+            h = 0
         # ...or emptier than empty
-        elif self.__h > 1.0 - self.psi:
-            self.__h = 1.0 - self.psi
+        elif h > 1.0 - self.psi:
+            h = 1.0 - self.psi
 
-        return self._pow
+        return h, p_ae
+
+    def perform_constant_power_steps(self, power: float, steps: int, stop_at_exhaustion: bool = False) -> int:
+        """
+        Advances the agent by multiple steps of constant power as if the power was set before every step.
+        Within a constant power segment the fill-level of An follows a closed form as long as the flow from Ae
+        stays either scaled by the level of An or at its maximum. The segment is jumped over and only steps at the
+        edges of these regimes are performed one by one.
+        :param power: constant power in Watts
+        :param steps: number of steps to perform
+        :param stop_at_exhaustion: whether the segment should end as soon as the agent is exhausted
+        :return: number of performed steps
+        """
+        return len(self.__get_constant_power_levels(power, steps, stop_at_exhaustion))
+
+    def perform_power_steps(self, powers, stop_at_exhaustion: bool = False) -> np.ndarray:
+        """
+        Advances the agent by one step per given power. Segments of constant power are solved with
+        perform_constant_power_steps.
+        :param powers: list or array of power demands in Watts. One for each step.
+        :param stop_at_exhaustion: whether the simulation should stop as soon as the agent is exhausted
+        :return: fill-levels of An after every performed step
+        """
+        np_powers = np.asarray(powers, dtype=float)
+        if len(np_powers) == 0:
+            return np.array([])
+        # a new segment starts wherever the power changes
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(np_powers)) + 1))
+        counts = np.diff(np.concatenate((starts, [len(np_powers)])))
+
+        h_hist = []
+        for power, count in zip(np_powers[starts], counts):
+            levels = self.__get_constant_power_levels(float(power), int(count), stop_at_exhaustion)
+            h_hist.append(levels)
+            if stop_at_exhaustion and len(levels) < count:
+                break
+        return np.concatenate(h_hist)
+
+    def __get_constant_power_levels(self, p: float, steps: int, stop_at_exhaustion: bool) -> np.ndarray:
+        """
+        Performs steps at constant power and updates the state of the agent.
+        :param p: constant power in Watts
+        :param steps: number of steps
+        :param stop_at_exhaustion: whether to stop after the step that empties An
+        :return: fill-levels of An after every performed step
+        """
+        empty = 1.0 - self.__psi
+        # change in fill-level per step caused by power output
+        c = empty * p / self.__an / self._hz
+        # change in fill-level per step caused by the maximal flow from Ae
+        d = empty * self.__cp / self.__an / self._hz
+        # the last fill-level before the tap pushes An above the pipe exit of Ae
+        t_a = 1.0 - self.__phi - self.__psi - c
+        # above the pipe exit the change per step is h' = a * h + b
+        r = d / (1.0 - self.__phi)
+        a = 1.0 - r
+        b = c * a - r * self.__psi
+
+        levels = np.empty(max(steps, 0))
+        h = self.__h
+        done = 0
+        while done < steps:
+            if stop_at_exhaustion and h == empty:
+                break
+
+            # closed form candidates for all but the last remaining step
+            ks = np.arange(1, steps - done)
+            if h <= t_a:
+                if r == 0:
+                    hs = h + ks * b
+                else:
+                    h_fix = b / r
+                    hs = h_fix + (h - h_fix) * np.power(a, ks)
+                prev = np.concatenate(([h], hs))[:-1]
+                p_ae = r * (prev + c + self.__psi)
+                valid = prev <= t_a
+            else:
+                hs = h + ks * (c - d)
+                prev = np.concatenate(([h], hs))[:-1]
+                p_ae = d
+                valid = prev > t_a
+            # the closed form is only valid if Ae isn't limited by W'bal and the tank limits aren't reached
+            valid &= (p_ae <= empty - (prev + c)) & (hs >= 0) & (hs <= empty)
+            n = len(valid) if np.all(valid) else int(np.argmin(valid))
+            if n > 0:
+                levels[done:done + n] = hs[:n]
+                h = float(hs[n - 1])
+                done += n
+
+            # steps at regime edges are performed one by one
+            h_next, self.__p_ae = self.__get_next_state(h, p)
+            levels[done] = h_next
+            done += 1
+            if h_next == h and not (stop_at_exhaustion and h == empty):
+                # the fill-level doesn't change anymore
+                levels[done:] = h
+                done = steps
+            h = h_next
+
+        self.__h = h
+        self._pow = p
+        self.advance_time(done)
+        return levels[:done]
+
+    def time_to_exhaustion(self, power: float, from_current_state: bool = True) -> float:
+        """
+        Estimates the time until exhaustion at given constant power without stepping through every
+        observation. Stretches of steps in which the flow from Ae is either scaled by the level of An or
+        at its maximum are jumped over in closed form. Only steps at the edges of these regimes are
+        performed one by one. The result equals the time it takes to step the agent until
+        is_exhausted() is True.
+        :param power: constant power in Watts
+        :param from_current_state: whether to start from the current fill-level of An or from a full An
+        :return: time in seconds or math.inf if exhaustion is never reached
+        """
+        h = self.__h if from_current_state else 0
+        return self.__get_steps_until_exhaustion(h, power) / self._hz
+
+    def __get_steps_until_exhaustion(self, h: float, p: float):
+        """
+        Counts the steps at constant power until the An tank is empty.
+        :param h: fill-level of An to start from
+        :param p: constant power in Watts
+        :return: number of steps or math.inf if exhaustion is never reached
+        """
+        empty = 1.0 - self.__psi
+        # change in fill-level per step caused by power output
+        c = empty * p / self.__an / self._hz
+        # change in fill-level per step caused by the maximal flow from Ae
+        d = empty * self.__cp / self.__an / self._hz
+        # the last fill-level before the tap pushes An above the pipe exit of Ae
+        t_a = 1.0 - self.__phi - self.__psi - c
+        # above the pipe exit the change per step is h' = a * h + b
+        r = d / (1.0 - self.__phi)
+        a = 1.0 - r
+        b = c * a - r * self.__psi
+
+        if h != empty and p <= 0:
+            # without power output An is not emptied
+            return math.inf
+
+        steps = 0
+        while h != empty:
+            if h <= t_a:
+                # level scaled flow from Ae converges towards fixed point h_fix
+                if a <= 0 or a >= 1:
+                    jump = 0
+                else:
+                    h_fix = b / r
+                    if h_fix <= t_a:
+                        # the level stays above the pipe exit and An is never emptied
+                        return math.inf
+                    # number of steps until the level drops below the pipe exit
+                    jump = int(math.floor(math.log((h_fix - t_a) / (h_fix - h)) / math.log(a))) + 1
+                    jump = self.__correct_jump(jump, lambda k: h_fix + (h - h_fix) * pow(a, k) > t_a)
+                    h_jump = h_fix + (h - h_fix) * pow(a, jump - 1)
+                    # the closed form is only valid if Ae isn't limited by the remaining W'
+                    if jump > 1 and self.__get_next_state(h_jump, p)[1] == self.__get_p_ae_uncapped(h_jump, p):
+                        h = h_jump
+                        steps += jump - 1
+            elif c <= d:
+                # at maximal flow from Ae the level does not drop
+                return math.inf
+            else:
+                # at maximal flow from Ae the level drops linearly until W'bal limits the flow from Ae
+                jump = int(math.floor((empty - d - c - h) / (c - d))) + 1
+                jump = self.__correct_jump(jump, lambda k: h + k * (c - d) + c > empty - d)
+                if jump > 0:
+                    h = h + jump * (c - d)
+                    steps += jump
+
+            # steps at regime edges are performed one by one
+            h = self.__get_next_state(h, p)[0]
+            steps += 1
+        return steps
+
+    def __get_p_ae_uncapped(self, h: float, p: float):
+        """
+        :return: flow from Ae after the tap changed the fill-level h if it isn't limited by W'bal
+        """
+        h += (1.0 - self.psi) * p / self.__an / self._hz
+        if (h + self.__psi) <= (1.0 - self.__phi):
+            return self.__cp * (h + self.__psi) / (1.0 - self.__phi) / self._hz
+        return self.__cp / self._hz
+
+    @staticmethod
+    def __correct_jump(jump: int, is_beyond) -> int:
+        """
+        corrects a number of steps estimated with logarithms for floating point errors
+        :param jump: estimated number of steps until is_beyond turns True
+        :param is_beyond: monotonic condition of the number of steps
+        :return: smallest number of steps that satisfies is_beyond
+        """
+        jump = max(jump, 0)
+        while jump > 0 and is_beyond(jump - 1):
+            jump -= 1
+        while not is_beyond(jump):
+            jump += 1
+        return jump
 
     def is_exhausted(self) -> bool:
         """
@@ -4,14 +4,168 @@ from abc import abstractmethod
 
 import numpy as np
 from pypermod.agents.cp_agent_basis import CpAgentBasis
+from scipy.signal import lfilter
 
 
 class WbalIntAgent(CpAgentBasis):
     """
     The virtual agent model. Integral agents need the entire exercise to be
     known before estimations can be made. A convolutional integral is applied.
+
+    Alternatively, a streaming mode with set_power and perform_one_step is available. It carries the convolution
+    forward as an exponentially decayed running sum with constant cost per step. Because the entire exercise is not
+    known in streaming mode, DCP is approximated online by the running mean of all sub-CP powers observed so far.
+    Tau is updated whenever that mean changes and W'exp accumulated before is decayed with the current tau.
+    With a fixed tau and hz=1, the streamed W'bal equals the W'bal of estimate_w_p_bal_to_data. The streaming mode
+    scales expended energy and decay by the step length of the agent's hz setting, while estimate_w_p_bal_to_data
+    treats every data point as one second. With other hz settings both only approximate each other.
     """
 
+    def __init__(self, w_p: float, cp: float, hz: int = 1, recursive: bool = True):
+        """
+        constructor with basic constants
+        :param w_p: W'
+        :param cp: CP
+        :param hz: the time steps per second the agent operates in
+        :param recursive: if True, the convolution sum is carried forward recursively in O(n). Otherwise, the full
+        sum is recomputed for every time step in O(n^2). Both engines produce the same W'bal histories. Differences
+        are floating point rounding errors only, which stay below 1e-6 Joules for courses of several hours.
+        """
+        super().__init__(w_p=w_p, cp=cp, hz=hz)
+        self._recursive = recursive
+
+        # fully rested, balance equals w_p
+        self._w_bal = w_p
+
+        # streaming mode parameters
+        self._step = 0
+        self._hz_t = 0.0
+        self._pow = 0.0
+        self._exp_sum = 0.0  # exponentially decayed sum of expended energy
+        self._rec_p_sum = 0.0  # sum of sub-CP powers for the running mean DCP
+        self._rec_p_count = 0
+        self._stream_dcp = None  # DCP that the current decay factor was estimated for
+        self._stream_decay = 1.0
+
+    @property
+    def recursive(self) -> bool:
+        """:return: whether the recursive O(n) engine is used to process data"""
+        return self._recursive
+
+    def reset(self):
+        """
+        reset streaming mode values to default
+        """
+        self._step = 0
+        self._hz_t = 0.0
+        self._pow = 0.0
+        self._w_bal = self._w_p
+        self._exp_sum = 0.0
+        self._rec_p_sum = 0.0
+        self._rec_p_count = 0
+        self._stream_dcp = None
+        self._stream_decay = 1.0
+
+    def get_state(self) -> dict:
+        """
+        :return: snapshot of the streaming mode values including step counter and time
+        """
+        state = super().get_state()
+        state.update(step=self._step, hz_t=self._hz_t, pow=self._pow, w_bal=self._w_bal,
+                     exp_sum=self._exp_sum, rec_p_sum=self._rec_p_sum, rec_p_count=self._rec_p_count,
+                     stream_dcp=self._stream_dcp, stream_decay=self._stream_decay)
+        return state
+
+    def set_state(self, state: dict):
+        """
+        restores streaming mode values from a snapshot of get_state
+        :param state: snapshot dictionary
+        """
+        super().set_state(state)
+        self._step = state["step"]
+        self._hz_t = state["hz_t"]
+        self._pow = state["pow"]
+        self._w_bal = state["w_bal"]
+        self._exp_sum = state["exp_sum"]
+        self._rec_p_sum = state["rec_p_sum"]
+        self._rec_p_count = state["rec_p_count"]
+        self._stream_dcp = state["stream_dcp"]
+        self._stream_decay = state["stream_decay"]
+
+    def set_power(self, power: float):
+        """
+        set power output for the next step of the streaming mode
+        :param power: power in Watts
+        """
+        self._pow = power
+
+    def get_power(self) -> float:
+        """
+        :return: power in Watts
+        """
+        return self._pow
+
+    def get_time(self) -> float:
+        """
+        :return: time in seconds considering the agent's hz setting
+        """
+        return self._hz_t
+
+    def get_w_p_balance(self) -> float:
+        """
+        :return: current W'bal of the streaming mode
+        """
+        return self._w_bal
+
+    def is_exhausted(self) -> bool:
+        """
+        simple exhaustion check using W' balance
+        :return: boolean
+        """
+        return self._w_bal <= 0
+
+    def is_recovered(self) -> bool:
+        """
+        simple recovery check using W' balance
+        :return: boolean
+        """
+        return self._w_bal >= self._w_p
+
+    def perform_one_step(self) -> float:
+        """
+        Updates the decayed sum of expended energy and W' balance with the set power.
+        Costs are constant per step.
+        :return: power in Watts
+        """
+        # increase time counter
+        self._step = self._step + 1
+        self._hz_t = float(self._step / self._hz)
+
+        p = self._pow
+        # sub-CP powers update the online DCP estimation
+        if p < self._cp:
+            self._rec_p_sum += p
+            self._rec_p_count += 1
+
+        if self._rec_p_count > 0:
+            dcp = self._cp - self._rec_p_sum / self._rec_p_count
+        else:
+            # no recovery observed yet. DCP is 0 as in estimate_w_p_bal_to_data
+            dcp = 0
+
+        # tau only has to be estimated again if DCP changed
+        if dcp != self._stream_dcp:
+            tau = self._get_tau_to_dcp(dcp)
+            self._stream_decay = pow(math.e, -self._delta_t / tau)
+            self._stream_dcp = dcp
+
+        # recursive form of EQ (2) in Skiba et al. 2012
+        self._exp_sum = self._exp_sum * self._stream_decay + max(p - self._cp, 0) * self._delta_t
+
+        # apply limits
+        self._w_bal = self._w_p - min(self._exp_sum, self._w_p)
+        return p
+
     @abstractmethod
     def _get_tau_to_dcp(self, dcp: float):
         """
@@ -49,19 +203,46 @@ class WbalIntAgent(CpAgentBasis):
         :param p_exp: constant exercise intensity in Watts
         :return: tte in seconds
         """
-        dynamics = self.get_expenditure_dynamics(p_exp=p_exp)
-        # dynamics skip time step 0. Therefore, total time in seconds conforms to length of dynamics
-        return len(dynamics)
+        # no expenditure below or at CP
+        if p_exp <= self._cp:
+            logging.warning("Not possible to model expenditure for p <= CP")
+            return np.nan
+
+        # DCP is 0 because it is a TTE
+        tau = self._get_tau_to_dcp(0)
+        # dynamics skip time step 0. Therefore, total time in seconds conforms to the number of steps
+        return self._get_tte_steps(p_exp=p_exp, tau=tau)
 
-    def get_recovery_dynamics(self, p_rec: float, max_steps: int):
+    def get_recovery_dynamics(self, p_rec, max_steps: int):
         """
         Returns recovery dynamics given recovery power p. Position 0 in the resulting array is the initial w'bal of 0.
         The integral approach does not consider changes in p_rec during recovery estimations.
-        :param p_rec: recovery bout intensity in Watts
+        The whole curve W' - W'exp * e^(-t/tau) is computed in one array operation. If an array of recovery intensities
+        is given, all curves are computed at once and returned as rows of a 2-D array with max_steps columns.
+        :param p_rec: recovery bout intensity in Watts or an array of recovery bout intensities
         :param max_steps: when to stop
         :return: W'bal history. Position 0 in the resulting array is the initial W'bal of 0 at time step 0.
+        For an array of intensities, rows of intensities at or above CP are filled with NaN.
         """
 
+        # at initial time step 0 the agent is fully exhausted
+        w_exp = self._w_p
+        ts = np.arange(1, max_steps + 1)
+
+        if np.ndim(p_rec) > 0:
+            np_p_rec = np.asarray(p_rec, dtype=float)
+            valid = np_p_rec < self._cp
+            if not np.all(valid):
+                logging.warning("Not possible to model recovery for p >= CP")
+
+            taus = np.full(np_p_rec.shape, np.nan)
+            taus[valid] = self._get_tau_to_dcp(self._cp - np_p_rec[valid])
+
+            # EQ (2) in Skiba et al. 2012 for all intensities and time steps
+            sums = w_exp * np.exp(-ts[np.newaxis, :] / taus[:, np.newaxis])
+            # apply limits
+            return self._w_p - np.minimum(sums, self._w_p)
+
         if p_rec >= self._cp:
             logging.warning("Not possible to model recovery for p >= CP")
             return np.nan
@@ -69,27 +250,24 @@ class WbalIntAgent(CpAgentBasis):
         dcp = self._cp - p_rec
         tau = self._get_tau_to_dcp(dcp)
 
-        # at initial time step 0 the agent is fully exhausted
-        w_bal_hist = [0]
-        w_exp = self._w_p
-
         # EQ (2) in Skiba et al. 2012
-        t = 1
-        while t <= max_steps and w_bal_hist[-1] < self._w_p:
-            sum_t = w_exp * pow(math.e, -t / tau)
+        sums = w_exp * np.exp(-ts / tau)
 
-            # apply limits
-            sum_t = min(sum_t, self._w_p)
-            w_bal = self._w_p - sum_t
-            w_bal_hist.append(w_bal)
-            t += 1
+        # apply limits
+        w_bal_hist = self._w_p - np.minimum(sums, self._w_p)
 
-        # skip time step 0 to conform to equation by Skiba and Clarke (2021)
-        return w_bal_hist[1:]
+        # stop after W'bal reached W'
+        full = np.flatnonzero(w_bal_hist >= self._w_p)
+        if len(full) > 0:
+            w_bal_hist = w_bal_hist[:full[0] + 1]
+
+        # time step 0 is not part of the result to conform to equation by Skiba and Clarke (2021)
+        return w_bal_hist.tolist()
 
     def estimate_w_p_bal_to_data(self, data):
         """
-        initiate processing data and kick off W'bal history estimation
+        initiate processing data and kick off W'bal history estimation. Every data point is one second
+        regardless of the hz setting.
         :param data:
         :return resulting W'bal history
         """
@@ -111,6 +289,42 @@ class WbalIntAgent(CpAgentBasis):
         :param tau: recovery time constant to use
         :return: W'bal history. Pos 0 is time step 1
         """
+        if self._recursive:
+            return self._process_data_recursive(data, tau)
+        else:
+            return self._process_data_convolution(data, tau)
+
+    def _process_data_recursive(self, data: np.array, tau: float):
+        """
+        Creates the W'bal history with a recursive formulation of EQ (2) in Skiba et al. 2012. The kernel is a single
+        exponential, therefore the sum of time step t is the sum of time step t-1 decayed by one step plus the new
+        expended energy: sum_t = sum_{t-1} * e^(-1/tau) + W'exp_t
+        :param data: power demand data to simulate
+        :param tau: recovery time constant to use
+        :return: W'bal history. Pos 0 is time step 1
+        """
+        # ensure type
+        np_data = np.array(data, dtype=float)
+
+        # Wexp is the expended energy above CP or 0 if below CP
+        np_exp = np.where((np_data - self._cp) > 0, np_data - self._cp, 0)
+
+        # the recursion is a first order IIR filter, which runs in compiled code
+        decay = pow(math.e, -1 / tau)
+        sums = lfilter([1.0], [1.0, -decay], np_exp)
+
+        # apply limits. Time step 0 is not part of the result
+        w_bal_hist = self._w_p - np.minimum(sums, self._w_p)
+        return w_bal_hist.tolist()
+
+    def _process_data_convolution(self, data: np.array, tau: float):
+        """
+        walks through data and creates the corresponding W'bal history by recomputing
+        the whole convolution sum for every time step
+        :param data: power demand data to simulate
+        :param tau: recovery time constant to use
+        :return: W'bal history. Pos 0 is time step 1
+        """
 
         # ensure type
         np_data = np.array(data)
@@ -132,33 +346,53 @@ class WbalIntAgent(CpAgentBasis):
         # skip time step 0 to conform to equation by Skiba and Clarke (2021)
         return w_bal_hist[1:]
 
-    def _get_expenditure_dynamics(self, p_exp: float, tau: float):
+    def _get_expenditure_sums(self, p_exp: float, tau: float, steps):
         """
-        returns expenditure dynamics given intensity p.
+        With a constant W'exp the convolution sum of EQ (2) in Skiba et al. 2012 is a geometric series:
+        sum_t = W'exp * (1 - e^(-(t+1)/tau)) / (1 - e^(-1/tau))
         :param p_exp: constant exercise intensity in Watts
-        :return: W'bal history. Pos 0 is time step 1
+        :param tau: recovery time constant to use
+        :param steps: number of summed up time steps (t+1). Can be a numpy array.
+        :return: the expended energy sum after given steps
         """
-        # Wexp is the expended energy above CP (here a constant)
-        np_exp = p_exp - self._cp
+        # expm1 keeps precision for large tau where e^(-1/tau) is close to 1
+        return (p_exp - self._cp) * np.expm1(-np.asarray(steps) / tau) / np.expm1(-1 / tau)
 
-        #  at time step 0, W'balance is at max
-        w_bal_hist = [self._w_p]
-        t = 0
+    def _get_tte_steps(self, p_exp: float, tau: float) -> int:
+        """
+        Solves the geometric series for the number of time steps until W' is fully expended
+        :param p_exp: constant exercise intensity in Watts
+        :param tau: recovery time constant to use
+        :return: number of steps until exhaustion
+        """
+        # the series converges to W'exp / (1 - e^(-1/tau)). Exhaustion is never reached if that is not above W'
+        ratio = self._w_p * -np.expm1(-1 / tau) / (p_exp - self._cp)
+        if ratio >= 1:
+            raise UserWarning("exhaustion not reached")
 
-        max_steps = 5000
-        # EQ (2) in Skiba et al. 2012
-        while w_bal_hist[-1] > 0 and t < max_steps:
-            sum_t = 0.0
-            for u in range(0, t + 1):
-                sum_t += np_exp * pow(math.e, -(t - u) / tau)
+        # sum >= W' <=> e^(-steps/tau) <= 1 - ratio
+        steps = max(1, int(math.ceil(-tau * math.log1p(-ratio))))
 
-            # apply limits and append
-            sum_t = min(sum_t, self._w_p)
-            w_bal_hist.append(self._w_p - sum_t)
-            t += 1
+        # correct floating point effects at the boundary with the same formula used for the dynamics
+        while self._get_expenditure_sums(p_exp, tau, steps) < self._w_p:
+            steps += 1
+        while steps > 1 and self._get_expenditure_sums(p_exp, tau, steps - 1) >= self._w_p:
+            steps -= 1
+        return steps
 
-        if t >= max_steps:
-            raise UserWarning("exhaustion not reached")
+    def _get_expenditure_dynamics(self, p_exp: float, tau: float):
+        """
+        returns expenditure dynamics given intensity p. The geometric series is evaluated in closed form
+        for all time steps until exhaustion at once.
+        :param p_exp: constant exercise intensity in Watts
+        :param tau: recovery time constant to use
+        :return: W'bal history. Pos 0 is time step 1
+        """
+        steps = self._get_tte_steps(p_exp=p_exp, tau=tau)
 
-        # skip time step 0 to conform to equation by Skiba and Clarke (2021)
-        return w_bal_hist[1:]
+        # EQ (2) in Skiba et al. 2012 for time steps 1 to tte
+        sums = self._get_expenditure_sums(p_exp, tau, np.arange(1, steps + 1))
+
+        # apply limits
+        w_bal_hist = self._w_p - np.minimum(sums, self._w_p)
+        return w_bal_hist.tolist()
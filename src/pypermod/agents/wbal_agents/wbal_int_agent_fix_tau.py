@@ -1,4 +1,8 @@
+import math
+
+import numpy as np
 from pypermod.agents.wbal_agents.wbal_int_agent import WbalIntAgent
+from scipy.signal import lfilter
 
 
 class WbalIntAgentFixTau(WbalIntAgent):
@@ -7,15 +11,16 @@ class WbalIntAgentFixTau(WbalIntAgent):
     This agent version allows to set a fix tau different from the fitted tau/dcp relationship from Skiba 2012
     """
 
-    def __init__(self, w_p: float, cp: float, tau: float = 100.0, hz: int = 1):
+    def __init__(self, w_p: float, cp: float, tau: float = 100.0, hz: int = 1, recursive: bool = True):
         """
         constructor with basic constants
         :param cp: CP
         :param w_p: W'
         :param tau: the recovery time constant tau used by this agent
         :param hz: the time steps per second the agent operates in
+        :param recursive: whether the recursive O(n) engine is used to process data
         """
-        super().__init__(w_p=w_p, cp=cp, hz=hz)
+        super().__init__(w_p=w_p, cp=cp, hz=hz, recursive=recursive)
         self._tau = tau
 
     def get_tau(self):
@@ -30,6 +35,31 @@ class WbalIntAgentFixTau(WbalIntAgent):
         :param new_tau:
         """
         self._tau = new_tau
+        # the decay factor of the streaming mode has to be estimated again
+        self._stream_dcp = None
+
+    def estimate_w_p_bal_for_taus(self, data, taus) -> np.ndarray:
+        """
+        Estimates W'bal histories of given data for a whole array of taus at once. The result equals
+        estimate_w_p_bal_to_data with each tau set, but data is only prepared once and every tau
+        is processed in one compiled recursive pass.
+        :param data: power demand data to simulate
+        :param taus: array of K time constants
+        :return: K x T array of W'bal histories. Row k uses taus[k]. Column 0 is time step 1.
+        """
+        np_data = np.array(data, dtype=float)
+        np_taus = np.atleast_1d(np.asarray(taus, dtype=float))
+
+        # Wexp is the expended energy above CP or 0 if below CP
+        np_exp = np.where((np_data - self._cp) > 0, np_data - self._cp, 0)
+
+        # recursive form of EQ (2) in Skiba et al. 2012 for every tau
+        sums = np.empty((len(np_taus), len(np_data)))
+        for i, tau in enumerate(np_taus):
+            sums[i] = lfilter([1.0], [1.0, -pow(math.e, -1 / tau)], np_exp)
+
+        # apply limits
+        return self._w_p - np.minimum(sums, self._w_p)
 
     def _get_tau_to_dcp(self, dcp: float):
         """
@@ -1,3 +1,4 @@
+import numpy as np
 from pypermod.agents.wbal_agents.wbal_ode_agent_exponential import WbalODEAgentExponential
 
 
@@ -14,3 +15,10 @@ class WbalODEAgentBartram(WbalODEAgentExponential):
         :return: tau estimation according to Bartram et al.
         """
         return 2287.2 * pow(dcp, -0.688)
+
+    @staticmethod
+    def _get_taus_to_dcp(dcp: np.ndarray) -> np.ndarray:
+        """
+        :return: tau estimations according to Bartram et al. for an array of DCPs
+        """
+        return 2287.2 * np.power(dcp, -0.688)
@@ -1,6 +1,8 @@
 import math
 from abc import abstractmethod
 
+import numpy as np
+
 from pypermod.agents.wbal_agents.wbal_ode_agent_linear import CpODEAgentBasisLinear
 
 
@@ -22,12 +24,32 @@ class WbalODEAgentExponential(CpODEAgentBasisLinear):
         """
         super().__init__(w_p=w_p, cp=cp, hz=hz)
 
+        # per-watt decay factors of expended W'. Built lazily for the parameters in the key
+        self._decay_table = None
+        self._decay_table_key = None
+
     @abstractmethod
     def _get_tau_to_dcp(self, dcp: float):
         """
         :return: tau estimation according using DCP
         """
 
+    def _get_tau_parameters(self) -> dict:
+        """
+        :return: the parameters of this agent that _get_taus_to_dcp requires as keyword arguments
+        """
+        return {}
+
+    @staticmethod
+    def _get_taus_to_dcp(dcp: np.ndarray, **params):
+        """
+        Vectorized tau estimation of populations. Parameters of _get_tau_parameters are given as arrays with one
+        entry per DCP. Agent types without an implementation are evaluated agent by agent.
+        :param dcp: array of differences to CP
+        :return: array of taus or None if not implemented
+        """
+        return None
+
     def _recover(self, p: float):
         """
         recovering happens for p < cp. It reduces W' exp and increases W' balance
@@ -36,9 +58,51 @@ class WbalODEAgentExponential(CpODEAgentBasisLinear):
 
         # restore W' if some was expended
         if self._w_bal < self._w_p - 0.1:
-            dcp = self._cp - p
-            tau = self._get_tau_to_dcp(dcp=dcp)
             # according to Eq. 12 in Skiba and Clarke 2021
-            self._w_bal = self._w_p - ((self._w_p - self._w_bal) * pow(math.e, (- 1 / tau) * self._delta_t))
+            self._w_bal = self._w_p - ((self._w_p - self._w_bal) * self._get_decay(p))
         else:
             self._w_bal = self._w_p
+
+    def _get_decay(self, p: float) -> float:
+        """
+        Per-step decay factor e^(-dt/tau) of expended W' while recovering at power p. Factors of integer
+        powers are looked up in a table that is built once for current W', CP and hz.
+        :param p: power demand in watts below CP
+        :return: decay factor
+        """
+        if self._decay_table_key != (self._w_p, self._cp, self._delta_t):
+            self.__build_decay_table()
+        w = int(p)
+        if w == p and 0 <= w < len(self._decay_table):
+            return self._decay_table[w]
+        return self.__calc_decay(p)
+
+    def __calc_decay(self, p: float) -> float:
+        """
+        :return: decay factor of expended W' per step at power p
+        """
+        tau = self._get_tau_to_dcp(dcp=self._cp - p)
+        return pow(math.e, (- 1 / tau) * self._delta_t)
+
+    def __build_decay_table(self):
+        """
+        computes decay factors for all integer powers from 0 up to CP
+        """
+        self._decay_table = [self.__calc_decay(w) for w in range(0, int(math.ceil(self._cp)))]
+        self._decay_table_key = (self._w_p, self._cp, self._delta_t)
+
+    def _get_recover_w_bal_after_steps(self, power: float, ks):
+        """
+        closed form of _recover repeated ks times. The expended W' decays with a constant factor per step.
+        """
+        ks = np.asarray(ks)
+        w_exp = self._w_p - self._w_bal
+        if w_exp <= 0.1:
+            # the first step already restores W' entirely
+            return np.where(ks > 0, self._w_p, self._w_bal)
+
+        decay = self._get_decay(power)
+        # the first step that starts above the recovery threshold sets W'bal to W'
+        k_full = int(math.ceil(math.log(0.1 / w_exp) / math.log(decay))) + 1
+        w_bal = self._w_p - w_exp * np.power(decay, ks)
+        return np.where(ks >= k_full, self._w_p, w_bal)
@@ -1,3 +1,6 @@
+import math
+
+import numpy as np
 from pypermod.agents.wbal_agents.wbal_ode_agent_exponential import WbalODEAgentExponential
 
 
@@ -33,6 +36,37 @@ class WbalODEAgentFixTau(WbalODEAgentExponential):
         :param new_tau:
         """
         self._tau = new_tau
+        # decay factors depend on tau
+        self._decay_table_key = None
+
+    def estimate_w_p_bal_for_taus(self, course_data, taus) -> np.ndarray:
+        """
+        Simulates given course for a whole array of taus at once. All taus are stepped in lockstep with NumPy.
+        Every row equals the W'bal history of a reset agent with the corresponding tau stepping through the course.
+        The internal state of this agent is not changed.
+        :param course_data: list or array of intensities in Watts
+        :param taus: array of K time constants
+        :return: K x T array of W'bal histories. Row k uses taus[k]. Column 0 is time step 1.
+        """
+        np_taus = np.atleast_1d(np.asarray(taus, dtype=float))
+        # recovery decay factors per step as in _recover
+        decays = np.array([pow(math.e, (- 1 / tau) * self._delta_t) for tau in np_taus])
+
+        w_bal = np.full(len(np_taus), float(self._w_p))
+        w_bal_hist = np.empty((len(np_taus), len(course_data)))
+        for t, p in enumerate(course_data):
+            if p < self._cp:
+                # restore W' if some was expended, according to Eq. 12 in Skiba and Clarke 2021
+                w_bal = np.where(w_bal < self._w_p - 0.1,
+                                 self._w_p - ((self._w_p - w_bal) * decays),
+                                 self._w_p)
+            else:
+                # linear expenditure. Agents without enough balance are exhausted
+                anaer_p = (p - self._cp) * self._delta_t
+                w_bal = np.where(w_bal < anaer_p, 0.0,
+                                 np.clip(w_bal - anaer_p, 0.0, self._w_p))
+            w_bal_hist[:, t] = w_bal
+        return w_bal_hist
 
     def _get_tau_to_dcp(self, dcp: float):
         """
@@ -40,3 +74,17 @@ class WbalODEAgentFixTau(WbalODEAgentExponential):
         :return: stored tau
         """
         return self._tau
+
+    def _get_tau_parameters(self) -> dict:
+        """
+        :return: the fix tau as the parameter of the tau estimation
+        """
+        return {"tau": self._tau}
+
+    @staticmethod
+    def _get_taus_to_dcp(dcp: np.ndarray, tau: np.ndarray) -> np.ndarray:
+        """
+        Ignores DCPs and returns the fix taus
+        :return: array of taus
+        """
+        return np.broadcast_to(np.asarray(tau, dtype=float), np.shape(dcp))
@@ -1,3 +1,6 @@
+import math
+
+import numpy as np
 from pypermod.agents.cp_agent_basis import CpAgentBasis
 
 
@@ -84,6 +87,25 @@ class CpODEAgentBasisLinear(CpAgentBasis):
         self._pow = 0.0
         self._w_bal = self._w_p
 
+    def get_state(self) -> dict:
+        """
+        :return: snapshot of W'bal, power, step counter and time
+        """
+        state = super().get_state()
+        state.update(step=self._step, hz_t=self._hz_t, pow=self._pow, w_bal=self._w_bal)
+        return state
+
+    def set_state(self, state: dict):
+        """
+        restores W'bal, power, step counter and time from a snapshot of get_state
+        :param state: snapshot dictionary
+        """
+        super().set_state(state)
+        self._step = state["step"]
+        self._hz_t = state["hz_t"]
+        self._pow = state["pow"]
+        self._w_bal = state["w_bal"]
+
     def set_power(self, power: float):
         """
         set power output directly to skip acceleration phases
@@ -164,3 +186,162 @@ class CpODEAgentBasisLinear(CpAgentBasis):
             self._w_bal = min(self._w_p, self._w_bal)
         else:
             self._w_bal = self._w_p
+
+    def perform_constant_power_steps(self, power: float, steps: int, stop_at_exhaustion: bool = False) -> int:
+        """
+        Advances the agent by multiple steps of constant power as if the power was set before every step.
+        Linear expenditure and recovery have exact closed forms within a constant power segment.
+        Therefore, the whole segment is jumped over and points of exhaustion are located exactly.
+        :param power: constant power in Watts
+        :param steps: number of steps to perform
+        :param stop_at_exhaustion: whether the segment should end as soon as the agent is exhausted
+        :return: number of performed steps
+        """
+        if stop_at_exhaustion:
+            steps = min(steps, self._get_steps_until_exhaustion(power))
+        if steps <= 0:
+            return 0
+
+        # agents with custom expenditure or recovery kinetics are stepped
+        if not self._has_closed_form():
+            for _ in range(steps):
+                self.set_power(power)
+                self.perform_one_step()
+            return steps
+
+        # the power output of the last step is reduced if it ran out of W'bal
+        w_bal_prev = self._get_w_bal_after_steps(power, steps - 1)
+        if power >= self._cp and w_bal_prev < (power - self._cp) * self._delta_t:
+            self._pow = w_bal_prev + self._cp
+        else:
+            self._pow = power
+        self._w_bal = float(self._get_w_bal_after_steps(power, steps))
+
+        # increase time counter
+        self._step = self._step + steps
+        self._hz_t = float(self._step / self._hz)
+        return steps
+
+    def _has_closed_form(self) -> bool:
+        """
+        Closed forms are only valid if expenditure and recovery are implemented by the same
+        classes as the corresponding closed forms.
+        :return: boolean
+        """
+        for impl, closed in [("_spend_capacity", "_get_spend_w_bal_after_steps"),
+                             ("_recover", "_get_recover_w_bal_after_steps")]:
+            impl_owner = next(c for c in type(self).__mro__ if impl in c.__dict__)
+            closed_owner = next(c for c in type(self).__mro__ if closed in c.__dict__)
+            if impl_owner is not closed_owner:
+                return False
+        return True
+
+    def time_to_exhaustion(self, power: float, from_current_state: bool = True) -> float:
+        """
+        Estimates the time until exhaustion at given constant power without stepping the agent.
+        The result equals the time it takes to step the agent until is_exhausted() is True, because
+        steps are counted with the rounding of stepped expenditure (see _replay_spend_steps).
+        :param power: constant power in Watts
+        :param from_current_state: whether to start from the current W'bal or from a fully recovered W'
+        :return: time in seconds or math.inf if exhaustion is never reached
+        """
+        w_bal = self._w_bal if from_current_state else self._w_p
+        return self._get_steps_until_exhaustion(power, w_bal=w_bal) / self._hz
+
+    def _get_steps_until_exhaustion(self, power: float, w_bal: float = None):
+        """
+        Number of steps at constant power until W'bal is depleted. A step with a balance smaller than or
+        equal to the expended energy of the step leaves W'bal at 0. Equals the number of steps of _spend_capacity.
+        :param power: constant power in Watts
+        :param w_bal: W'bal to start from. Default is the current W'bal.
+        :return: number of steps or math.inf if exhaustion is never reached
+        """
+        if w_bal is None:
+            w_bal = self._w_bal
+        if w_bal == 0:
+            return 0
+        anaer_p = (power - self._cp) * self._delta_t
+        if anaer_p <= 0:
+            return math.inf
+        return self._replay_spend_steps(w_bal, anaer_p, math.inf)[0]
+
+    @staticmethod
+    def _replay_spend_steps(w_bal: float, anaer_p: float, steps):
+        """
+        Replays repeated subtractions of anaer_p as in _spend_capacity including floating point rounding, because
+        the rounding errors of thousands of steps decide whether the last step leaves a tiny balance or exhausts.
+        While W'bal stays within a binade, i.e. between two powers of 2, every subtraction removes the same multiple
+        of the binade's spacing. Thus, all steps within a binade are jumped over at once.
+        :param w_bal: W'bal to start from
+        :param anaer_p: expended energy per step
+        :param steps: maximal number of steps. Can be math.inf
+        :return: tuple of performed steps and the W'bal after them. Stops early at exhaustion with W'bal 0.
+        """
+        done = 0
+        while done < steps:
+            if w_bal <= anaer_p:
+                # not enough balance or exactly depleted
+                return done + 1, 0.0
+            # W'bal and anaer_p in units of the spacing of floats in the binade of W'bal
+            _, exp = math.frexp(w_bal)
+            spacing = math.ldexp(1.0, exp - 53)
+            units = int(w_bal / spacing)
+            n, frac = divmod(anaer_p / spacing, 1)
+            n = int(n)
+            if frac == 0.5:
+                if units % 2 == 1:
+                    # rounding of ties to even makes the first of these steps differ from the following ones
+                    w_bal = w_bal - anaer_p
+                    done += 1
+                    continue
+                dec = n + n % 2
+            else:
+                dec = n + int(frac > 0.5)
+            if dec == 0:
+                # the subtraction is rounded away. Exhaustion is never reached
+                return steps, w_bal
+            # steps whose results stay above the lower bound of the binade
+            k = min(max(0, (units - (1 << 52) - 1) // dec), steps - done)
+            if k == 0:
+                # this step leaves the binade
+                w_bal = w_bal - anaer_p
+                done += 1
+            else:
+                w_bal = (units - k * dec) * spacing
+                done += k
+        return done, w_bal
+
+    def _get_w_bal_after_steps(self, power: float, ks):
+        """
+        W'bal after given numbers of steps at constant power from the current state
+        :param power: constant power in Watts
+        :param ks: number of steps. Can be a numpy array.
+        :return: W'bal after ks steps
+        """
+        if power < self._cp:
+            return self._get_recover_w_bal_after_steps(power, ks)
+        else:
+            return self._get_spend_w_bal_after_steps(power, ks)
+
+    def _get_spend_w_bal_after_steps(self, power: float, ks):
+        """
+        closed form of _spend_capacity repeated ks times
+        """
+        ks = np.asarray(ks)
+        anaer_p = (power - self._cp) * self._delta_t
+        if anaer_p <= 0:
+            return np.full(ks.shape, self._w_bal)
+        # balance decreases linearly until it is depleted
+        replay = np.vectorize(lambda k: self._replay_spend_steps(self._w_bal, anaer_p, k)[1], otypes=[float])
+        return replay(ks)
+
+    def _get_recover_w_bal_after_steps(self, power: float, ks):
+        """
+        closed form of _recover repeated ks times
+        """
+        ks = np.asarray(ks)
+        diff = (self._cp - power) * self._delta_t
+        # the first step that starts above the recovery threshold sets W'bal to W'
+        k_full = max(1, int(math.ceil((self._w_p - 0.01 - self._w_bal) / diff)) + 1)
+        w_bal = np.minimum(self._w_bal + ks * diff, self._w_p)
+        return np.where((ks >= k_full), self._w_p, np.where(ks > 0, w_bal, self._w_bal))
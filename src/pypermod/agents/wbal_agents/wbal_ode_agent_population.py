@@ -0,0 +1,257 @@
+import logging
+import math
+
+import numpy as np
+from pypermod.agents.wbal_agents.wbal_ode_agent_exponential import WbalODEAgentExponential
+from pypermod.agents.wbal_agents.wbal_ode_agent_linear import CpODEAgentBasisLinear
+
+
+class WbalODEAgentPopulation:
+    """
+    Holds W', CP, recovery parameters and W'bal states of N differential agents in NumPy arrays and
+    steps all of them in lockstep. Agents can be of any mix of CpODEAgentBasisLinear and
+    WbalODEAgentExponential subclasses (WbalODEAgentSkiba, WbalODEAgentBartram, WbalODEAgentWeigend,
+    WbalODEAgentFixTau). Linear expenditure, linear or exponential recovery, and clamping of W'bal
+    are reproduced as implemented by the single agents.
+    """
+
+    def __init__(self, agents: list):
+        """
+        constructor
+        :param agents: list of differential agents. Their parameters are copied, their states are not changed.
+        """
+        if len(agents) == 0:
+            raise UserWarning("A population requires at least one agent")
+
+        hzs = set([agent.hz for agent in agents])
+        if len(hzs) > 1:
+            raise UserWarning("All agents of a population have to operate at the same hz, got {}".format(hzs))
+
+        for agent in agents:
+            if not isinstance(agent, CpODEAgentBasisLinear):
+                raise UserWarning("No population procedure implemented for agent type {}".format(agent))
+            if type(agent)._recover not in [CpODEAgentBasisLinear._recover, WbalODEAgentExponential._recover]:
+                raise UserWarning("Custom recovery of agent type {} is not supported".format(agent))
+
+        # constants
+        self._hz = agents[0].hz
+        self._delta_t = float(1 / self._hz)
+        self._names = [agent.get_name() for agent in agents]
+        self._w_p = np.array([agent.w_p for agent in agents], dtype=float)
+        self._cp = np.array([agent.cp for agent in agents], dtype=float)
+        self._exponential = np.array([isinstance(agent, WbalODEAgentExponential) for agent in agents])
+
+        # agents of the same type share the same tau estimation. Types without a vectorized tau estimation
+        # are evaluated agent by agent.
+        self._tau_groups = []
+        self._looped_types = []
+        for agent_type in set([type(agent) for agent in agents if isinstance(agent, WbalODEAgentExponential)]):
+            idx = np.array([i for i, agent in enumerate(agents) if type(agent) is agent_type])
+            group = [agents[i] for i in idx]
+            stacked = self.__stack_parameters(group)
+            if agent_type._get_taus_to_dcp(np.ones(len(group)), **stacked) is None:
+                logging.warning("{} has no vectorized tau estimation. Its taus are estimated "
+                                "agent by agent".format(agent_type.__name__))
+                self._looped_types.append(agent_type)
+            self._tau_groups.append((agent_type, idx, group, stacked))
+
+        # fully rested, balance equals w_p
+        self._w_bal = self._w_p.copy()
+
+        # simulation management parameters
+        self._step = 0
+        self._hz_t = 0.0
+        self._pow = np.zeros(len(agents))
+
+    def __len__(self):
+        """:return: number of agents in the population"""
+        return len(self._w_p)
+
+    @staticmethod
+    def __stack_parameters(group: list) -> dict:
+        """
+        Stacks the tau estimation parameters of agents of the same type into arrays.
+        :param group: agents of the same type
+        :return: dict with the keyword arguments of _get_taus_to_dcp and arrays as values
+        """
+        params = [agent._get_tau_parameters() for agent in group]
+        return {key: np.array([p[key] for p in params], dtype=float) for key in params[0]}
+
+    @property
+    def hz(self) -> int:
+        """
+        :return: number of obs per second
+        """
+        return self._hz
+
+    @property
+    def looped_types(self) -> list:
+        """:return: agent types without a vectorized tau estimation, whose taus are estimated agent by agent"""
+        return self._looped_types
+
+    @property
+    def names(self) -> list:
+        """:return: the names of all agents in the population"""
+        return self._names
+
+    @property
+    def w_p(self) -> np.ndarray:
+        """:return: anaerobic capacities of all agents"""
+        return self._w_p
+
+    @property
+    def cp(self) -> np.ndarray:
+        """:return: critical powers of all agents"""
+        return self._cp
+
+    def reset(self):
+        """
+        reset internal values of all agents to default
+        """
+        self._step = 0
+        self._hz_t = 0.0
+        self._pow = np.zeros(len(self))
+        self._w_bal = self._w_p.copy()
+
+    def get_time(self) -> float:
+        """
+        :return: time in seconds considering the agents' hz setting
+        """
+        return self._hz_t
+
+    def set_power(self, power):
+        """
+        set power outputs of all agents
+        :param power: one power in Watts for all agents or an array with one power per agent
+        """
+        self._pow = np.broadcast_to(np.asarray(power, dtype=float), (len(self),)).copy()
+
+    def get_power(self) -> np.ndarray:
+        """
+        :return: power outputs of all agents in Watts
+        """
+        return self._pow
+
+    def get_w_p_balance(self) -> np.ndarray:
+        """
+        :return: current W'bal of all agents
+        """
+        return self._w_bal
+
+    def set_w_p_balance(self, w_bal):
+        """
+        sets W'bal of all agents and ensures it's in-between 0 and W'
+        :param w_bal: one W'bal for all agents or an array with one W'bal per agent
+        """
+        w_bal = np.broadcast_to(np.asarray(w_bal, dtype=float), (len(self),)).copy()
+        if np.any(w_bal < 0) or np.any(w_bal > self._w_p):
+            raise UserWarning("W'balance has an illegal value. It must be between 0 and W'")
+        self._w_bal = w_bal
+
+    def is_exhausted(self) -> np.ndarray:
+        """
+        simple exhaustion check using W' balance
+        :return: boolean array
+        """
+        return self._w_bal == 0
+
+    def get_steps_until_exhaustion(self, power=None) -> np.ndarray:
+        """
+        Number of steps until exhaustion of every agent if the given powers are kept. Steps are counted with
+        the rounding of stepped expenditure as in CpODEAgentBasisLinear._get_steps_until_exhaustion.
+        :param power: one power in Watts for all agents or an array with one power per agent.
+        Default are the current powers.
+        :return: array of steps. 0 for exhausted agents and np.inf where exhaustion is never reached.
+        """
+        if power is None:
+            power = self._pow
+        power = np.broadcast_to(np.asarray(power, dtype=float), (len(self),))
+        anaer_p = (power - self._cp) * self._delta_t
+        steps = np.full(len(self), np.inf)
+        for i in range(len(self)):
+            if self._w_bal[i] == 0:
+                steps[i] = 0
+            elif anaer_p[i] > 0:
+                steps[i] = CpODEAgentBasisLinear._replay_spend_steps(float(self._w_bal[i]), float(anaer_p[i]),
+                                                                     math.inf)[0]
+        return steps
+
+    def perform_one_step(self) -> np.ndarray:
+        """
+        Updates power outputs and W' balances of all agents by one step.
+        :return: expended powers
+        """
+        # increase time counter
+        self._step = self._step + 1
+        self._hz_t = float(self._step / self._hz)
+
+        p = self._pow.copy()
+        w_bal = self._w_bal
+        recover = p < self._cp
+
+        # linear recovery with the threshold of CpODEAgentBasisLinear
+        lin = recover & ~self._exponential
+        if np.any(lin):
+            rec = np.minimum(w_bal[lin] + (self._cp[lin] - p[lin]) * self._delta_t, self._w_p[lin])
+            w_bal[lin] = np.where(w_bal[lin] < self._w_p[lin] - 0.01, rec, self._w_p[lin])
+
+        # exponential recovery with the threshold of WbalODEAgentExponential
+        exp = recover & self._exponential
+        if np.any(exp):
+            taus = self.__get_taus(dcp=self._cp - p, mask=exp)
+            # according to Eq. 12 in Skiba and Clarke 2021
+            rec = self._w_p[exp] - ((self._w_p[exp] - w_bal[exp]) * np.power(math.e, (- 1 / taus) * self._delta_t))
+            w_bal[exp] = np.where(w_bal[exp] < self._w_p[exp] - 0.1, rec, self._w_p[exp])
+
+        # linear expenditure
+        spend = ~recover
+        if np.any(spend):
+            anaer_p = (p[spend] - self._cp[spend]) * self._delta_t
+            # not enough balance to perform on requested power
+            empty = w_bal[spend] < anaer_p
+            p[spend] = np.where(empty, w_bal[spend] + self._cp[spend], p[spend])
+            w_bal[spend] = np.where(empty, 0.0, np.clip(w_bal[spend] - anaer_p, 0.0, self._w_p[spend]))
+
+        self._pow = p
+        return p
+
+    def __get_taus(self, dcp: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """
+        Estimates tau for all masked agents. Each agent type's _get_taus_to_dcp is evaluated once on arrays
+        of its agents' parameters. Types in looped_types are evaluated agent by agent.
+        :param dcp: differences to CP of all agents
+        :param mask: boolean mask of agents to estimate tau for
+        :return: taus of masked agents
+        """
+        taus = np.empty(len(self))
+        for agent_type, idx, group, stacked in self._tau_groups:
+            sel = mask[idx]
+            if not np.any(sel):
+                continue
+            if agent_type in self._looped_types:
+                taus[idx[sel]] = [group[i]._get_tau_to_dcp(dcp[idx[i]]) for i in np.flatnonzero(sel)]
+            else:
+                params = {k: v[sel] for k, v in stacked.items()}
+                taus[idx[sel]] = agent_type._get_taus_to_dcp(dcp[idx[sel]], **params)
+        return taus[mask]
+
+    def simulate_course(self, course_data) -> np.ndarray:
+        """
+        Resets all agents and makes them predict W'bal for every time step of the given course.
+        :param course_data: array of T intensities in Watts shared by all agents or an N x T array
+        with one course per agent
+        :return: N x T array of W'bal histories. Column 0 is time step 1.
+        """
+        self.reset()
+        np_course = np.asarray(course_data, dtype=float)
+        if np_course.ndim == 1:
+            np_course = np.broadcast_to(np_course, (len(self), len(np_course)))
+        if np_course.shape[0] != len(self):
+            raise UserWarning("Course data needs one row per agent, got {}".format(np_course.shape))
+
+        w_bal_hist = np.empty(np_course.shape)
+        for t in range(np_course.shape[1]):
+            self.set_power(np_course[:, t])
+            self.perform_one_step()
+            w_bal_hist[:, t] = self._w_bal
+        return w_bal_hist
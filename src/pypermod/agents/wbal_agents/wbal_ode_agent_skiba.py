@@ -1,3 +1,4 @@
+import numpy as np
 from pypermod.agents.wbal_agents.wbal_ode_agent_exponential import WbalODEAgentExponential
 
 
@@ -15,3 +16,16 @@ class WbalODEAgentSkiba(WbalODEAgentExponential):
         :return: tau estimation according to Skiba et al. 2021
         """
         return self._w_p / dcp
+
+    def _get_tau_parameters(self) -> dict:
+        """
+        :return: W' as the parameter of the tau estimation
+        """
+        return {"w_p": self._w_p}
+
+    @staticmethod
+    def _get_taus_to_dcp(dcp: np.ndarray, w_p: np.ndarray) -> np.ndarray:
+        """
+        :return: tau estimations according to Skiba et al. 2021 for arrays of DCPs and W's
+        """
+        return w_p / dcp
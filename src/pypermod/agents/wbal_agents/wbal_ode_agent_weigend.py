@@ -19,3 +19,10 @@ class WbalODEAgentWeigend(WbalODEAgentExponential):
         :return: value for tau
         """
         return 1274.4492469669608 * np.exp(dcp * -0.030807662658070646) + 266.64757177314107
+
+    @staticmethod
+    def _get_taus_to_dcp(dcp: np.ndarray) -> np.ndarray:
+        """
+        :return: tau estimations according to Weigend et al. 2021 for an array of DCPs
+        """
+        return 1274.4492469669608 * np.exp(dcp * -0.030807662658070646) + 266.64757177314107
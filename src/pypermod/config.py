@@ -9,4 +9,7 @@ paths = {
 black_and_white = False
 
 # an additional constraint on the three component hydraulic model that limits the interval for phi
-three_comp_phi_constraint = False
\ No newline at end of file
+three_comp_phi_constraint = False
+
+# whether three component hydraulic agents use a Numba compiled step kernel if Numba is installed
+three_comp_jit = True
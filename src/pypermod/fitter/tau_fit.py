@@ -62,27 +62,29 @@ class TauFitter:
         # create whole test protocol
         whole_test = ([p_exp] * 60 * hz + [p_rec] * 30 * hz) * 20
 
-        # simulate protocol until exhaustion
-        bal = []
-        while not agent.is_exhausted() and len(whole_test) > 0:
-            agent.set_power(whole_test.pop(0))
-            agent.perform_one_step()
-            bal.append(agent.get_w_p_balance())
+        # simulate protocol until exhaustion or expected time of exhaustion. Bouts are jumped over analytically.
+        SimulatorBasis.simulate_course_piecewise(agent, whole_test[:act_tte], stop_at_exhaustion=True, reset=False)
 
-        if not agent.is_exhausted():
-            # if agent not exhausted after 20 intervals
-            end_t = 0  # worst case -> maximal distance to tte
-        else:
-            # otherwise note time of exhaustion
+        if agent.is_exhausted():
             end_t = agent.get_time()
-
-        if end_t >= act_tte:
-            # minimise w'bal at expected time of exhaustion
-            return bal[act_tte - 1]
-        else:
+            if end_t >= act_tte:
+                # w'bal at expected time of exhaustion is 0
+                return agent.get_w_p_balance()
             # minimise distance to time to exhaustion
             return agent.w_p * (act_tte - end_t)
 
+        # w'bal at expected time of exhaustion
+        bal_at_tte = agent.get_w_p_balance()
+
+        # check whether the agent is exhausted in the remaining protocol
+        SimulatorBasis.simulate_course_piecewise(agent, whole_test[act_tte:], stop_at_exhaustion=True, reset=False)
+        if not agent.is_exhausted():
+            # if agent not exhausted after 20 intervals -> maximal distance to tte
+            return agent.w_p * act_tte
+        else:
+            # minimise w'bal at expected time of exhaustion
+            return bal_at_tte
+
     @staticmethod
     def f_chidnok_int(tau: float, agent: WbalIntAgentFixTau, p_exp: float, p_rec: float, act_tte: int):
         """
@@ -110,9 +112,10 @@ class TauFitter:
 
         # estimate wbal and find point of exhaustion
         bal = SimulatorBasis.simulate_course(agent, whole_test)
-        try:
-            end_t = bal.index(0)
-        except ValueError:
+        exhausted = np.flatnonzero(bal == 0)
+        if len(exhausted) > 0:
+            end_t = int(exhausted[0])
+        else:
             end_t = 60 * 30 * 20
 
         if end_t >= act_tte:
@@ -143,3 +146,54 @@ class TauFitter:
                                   bounds=(100, 500),
                                   method='bounded')
         return fit_tau["x"]
+
+    @staticmethod
+    def f_chidnok_for_taus(taus, agent, p_exp: float, p_rec: float, act_tte: int) -> np.ndarray:
+        """
+        Batched version of f_chidnok_ode and f_chidnok_int. The Chidnok et al. protocol is simulated for
+        all given taus in one call and the difference measure of the corresponding function is returned for each.
+        :param taus: array of K taus
+        :param agent: WbalODEAgentFixTau or WbalIntAgentFixTau with w' and cp and hz setting
+        :param p_exp: intensity for work bouts
+        :param p_rec: intensity for recovery bouts
+        :param act_tte: expected ground truth time to exhaustion
+        :return: array of K difference measures
+        """
+        # one estimation per second was found to be sufficient
+        hz = 1
+        if agent.hz != hz:
+            raise UserWarning("Agent hz has to be set to {}".format(hz))
+
+        whole_test = ([p_exp] * 60 * hz + [p_rec] * 30 * hz) * 20
+
+        if isinstance(agent, WbalODEAgentFixTau):
+            bal = agent.estimate_w_p_bal_for_taus(whole_test, taus)
+            exhausted = np.any(bal == 0, axis=1)
+            # time of exhaustion or 0 if agent not exhausted after 20 intervals
+            end_t = np.where(exhausted, np.argmax(bal == 0, axis=1) + 1, 0)
+        elif isinstance(agent, WbalIntAgentFixTau):
+            # the protocol has a max length of TTE
+            bal = agent.estimate_w_p_bal_for_taus(whole_test[:act_tte], taus)
+            exhausted = np.any(bal == 0, axis=1)
+            # index of exhaustion as in f_chidnok_int
+            end_t = np.where(exhausted, np.argmax(bal == 0, axis=1), 60 * 30 * 20)
+        else:
+            raise UserWarning("Agent type has to be {} or {}".format(WbalIntAgentFixTau, WbalODEAgentFixTau))
+
+        # minimise w'bal at expected time of exhaustion or distance to time to exhaustion
+        bal_at_tte = bal[:, min(act_tte, bal.shape[1]) - 1]
+        return np.where(end_t >= act_tte, bal_at_tte, agent.w_p * (act_tte - end_t))
+
+    @staticmethod
+    def get_tau_for_chidnok_grid(agent, p_exp: float, p_rec: float, tte: int, taus=None):
+        """
+        fits a time constant tau to given chidnok trial setup with a grid search. All candidate taus
+        are evaluated in a single batched simulation.
+        :param taus: candidate taus. Default are taus from 100 to 500 in steps of 0.5
+        :return: best found tau
+        """
+        if taus is None:
+            taus = np.arange(100, 500.5, 0.5)
+        taus = np.asarray(taus, dtype=float)
+        diffs = TauFitter.f_chidnok_for_taus(taus, agent, p_exp, p_rec, tte)
+        return taus[np.argmin(diffs)]
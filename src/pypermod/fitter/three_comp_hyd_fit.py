@@ -0,0 +1,246 @@
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from pypermod import config
+from pypermod.agents.hyd_agents.three_comp_hyd_agent_population import ThreeCompHydAgentPopulation
+from pypermod.data_structure.activities.activity_types import ActivityTypes
+from pypermod.data_structure.activities.protocol_types import ProtocolTypes
+from pypermod.data_structure.helper.simple_time_power_pairs import SimpleTimePowerPairs
+from pypermod.simulator.three_comp_hyd_population_simulator import ThreeCompHydPopulationSimulator
+
+
+def _evaluate_configs(configs: np.ndarray, hz: int, ttes: list, recovery_trials: list,
+                      t_max: float, phi_constraint: bool) -> np.ndarray:
+    """
+    Loss of every configuration. Module level function to be usable by worker processes.
+    :param configs: N x 8 array of configurations [lf, ls, m_u, m_ls, m_lf, theta, gamma, phi]
+    :param hz: calculations per second of the simulated agents
+    :param ttes: list of (time, power) pairs of observed times to exhaustion
+    :param recovery_trials: list of (p_work, p_rec, t_rec, ratio) tuples of observed recovery ratios
+    :param t_max: maximal time in seconds to simulate a single exhaustion
+    :param phi_constraint: whether phi has to be smaller than gamma
+    :return: losses. Invalid configurations get ThreeCompHydFitter.penalty
+    """
+    losses = np.full(len(configs), ThreeCompHydFitter.penalty)
+
+    # configurations the model does not accept
+    valid = (1 - configs[:, 5] - configs[:, 6]) > 0
+    if phi_constraint:
+        valid &= configs[:, 7] <= configs[:, 6]
+    if not np.any(valid):
+        return losses
+
+    population = ThreeCompHydAgentPopulation(hz=hz, configs=configs[valid])
+    errors = np.zeros(len(population))
+
+    # relative errors of times to exhaustion
+    for time, power in ttes:
+        pred = ThreeCompHydPopulationSimulator.tte(population, p_work=power, t_max=t_max)
+        errors += ((pred - time) / time) ** 2
+    # errors of recovery ratios in percent
+    for p_work, p_rec, t_rec, ratio in recovery_trials:
+        pred = ThreeCompHydPopulationSimulator.get_recovery_ratio_wb1_wb2(population, p_work=p_work, p_rec=p_rec,
+                                                                          t_rec=t_rec, t_max=t_max)
+        errors += ((pred - ratio) / 100.0) ** 2
+
+    errors /= len(ttes) + len(recovery_trials)
+    # configurations that didn't reach exhaustion get NaN predictions
+    losses[valid] = np.where(np.isnan(errors), ThreeCompHydFitter.penalty, errors)
+    return losses
+
+
+class ThreeCompHydFitter:
+    """
+    Fits the 8 parameters [lf, ls, m_u, m_ls, m_lf, theta, gamma, phi] of the three component hydraulic model to
+    observed times to exhaustion and recovery ratios. Uses a differential evolution (rand/1/bin) optimizer. Fitness
+    evaluations of every generation are split across a process pool. The state of the search is saved as a
+    checkpoint after every generation and a fitting resumes from an existing checkpoint.
+    """
+
+    # loss of configurations that are invalid or don't reach exhaustion
+    penalty = 1e6
+
+    # default lower and upper limits of [lf, ls, m_u, m_ls, m_lf, theta, gamma, phi]
+    default_bounds = [(5000, 500000), (5000, 500000), (1, 2000), (1, 2000), (1, 2000), (0, 1), (0, 1), (0, 1)]
+
+    def __init__(self, ttes: SimpleTimePowerPairs, recovery_trials: list = None, hz: int = 1,
+                 bounds: list = None, pop_size: int = 40, mutation: float = 0.5, crossover: float = 0.7,
+                 workers: int = 1, seed: int = None, checkpoint_path: str = None):
+        """
+        :param ttes: observed times to exhaustion and their constant powers
+        :param recovery_trials: optional list of (p_work, p_rec, t_rec, ratio) tuples with observed recovery ratios
+        in percent according to the WB1 -> RB -> WB2 protocol
+        :param hz: calculations per second of the simulated agents
+        :param bounds: list of 8 (lower, upper) limits. Default is ThreeCompHydFitter.default_bounds
+        :param pop_size: number of configurations per generation
+        :param mutation: differential weight of the mutation
+        :param crossover: crossover probability
+        :param workers: number of worker processes for fitness evaluations
+        :param seed: seed of the random number generator
+        :param checkpoint_path: optional path of an .npz file to save and resume the search state
+        """
+        if len(ttes) == 0:
+            raise UserWarning("At least one time to exhaustion is required for a fitting")
+        if pop_size < 4:
+            raise UserWarning("Differential evolution requires a population size of at least 4")
+
+        self._ttes = list(ttes.iterate_pairs())
+        self._recovery_trials = [] if recovery_trials is None else [tuple(x) for x in recovery_trials]
+        self._hz = hz
+        self._bounds = np.array(self.default_bounds if bounds is None else bounds, dtype=float)
+        if self._bounds.shape != (8, 2):
+            raise UserWarning("Bounds need a (lower, upper) limit for each of the 8 parameters")
+        self._pop_size = pop_size
+        self._mutation = mutation
+        self._crossover = crossover
+        self._workers = workers
+        self._seed = seed
+        self._checkpoint_path = checkpoint_path
+
+        # simulations stop after this time if exhaustion is not reached
+        self._t_max = max(ttes.times) * 3 + 60
+
+    def evaluate(self, configs, executor: ProcessPoolExecutor = None) -> np.ndarray:
+        """
+        Estimates losses of given configurations. Configurations are split evenly across worker processes.
+        :param configs: N x 8 array of configurations
+        :param executor: optional process pool to reuse. A new one is created if workers > 1 and none is given.
+        :return: losses
+        """
+        np_configs = np.atleast_2d(np.asarray(configs, dtype=float))
+        args = (self._hz, self._ttes, self._recovery_trials, self._t_max, config.three_comp_phi_constraint)
+        if self._workers <= 1:
+            return _evaluate_configs(np_configs, *args)
+        if executor is None:
+            with ProcessPoolExecutor(max_workers=self._workers) as executor:
+                return self.evaluate(np_configs, executor=executor)
+
+        chunks = np.array_split(np_configs, min(self._workers, len(np_configs)))
+        results = executor.map(_evaluate_configs, chunks, *[[arg] * len(chunks) for arg in args])
+        return np.concatenate(list(results))
+
+    def __save_checkpoint(self, generation: int, population: np.ndarray, losses: np.ndarray,
+                          rng: np.random.Generator):
+        """
+        stores the search state after given generation
+        """
+        if self._checkpoint_path is None:
+            return
+        # write to a temporary file first, so that an interrupted save does not corrupt the checkpoint
+        tmp_path = self._checkpoint_path + ".tmp.npz"
+        np.savez(tmp_path, generation=generation, population=population, losses=losses,
+                 rng_state=json.dumps(rng.bit_generator.state), bounds=self._bounds)
+        os.replace(tmp_path, self._checkpoint_path)
+
+    def __load_checkpoint(self):
+        """
+        :return: generation, population, losses, and rng of a stored checkpoint or None if there is none
+        """
+        if self._checkpoint_path is None or not os.path.exists(self._checkpoint_path):
+            return None
+        with np.load(self._checkpoint_path) as data:
+            if not np.array_equal(data["bounds"], self._bounds) or len(data["population"]) != self._pop_size:
+                raise UserWarning("Checkpoint {} was created with different settings".format(self._checkpoint_path))
+            rng = np.random.default_rng()
+            rng.bit_generator.state = json.loads(str(data["rng_state"]))
+            return int(data["generation"]), data["population"], data["losses"], rng
+
+    def fit(self, generations: int = 100):
+        """
+        Runs the differential evolution. Resumes from the checkpoint if one exists.
+        :param generations: total number of generations including those of a resumed checkpoint
+        :return: best configuration as a list and its loss
+        """
+        # one process pool is kept alive for all generations
+        if self._workers > 1:
+            with ProcessPoolExecutor(max_workers=self._workers) as executor:
+                return self.__fit(generations, executor)
+        return self.__fit(generations, None)
+
+    def __fit(self, generations: int, executor):
+        """
+        the differential evolution loop of fit
+        """
+        lower, upper = self._bounds[:, 0], self._bounds[:, 1]
+
+        checkpoint = self.__load_checkpoint()
+        if checkpoint is not None:
+            generation, population, losses, rng = checkpoint
+            logging.info("resume fitting from generation {}".format(generation))
+        else:
+            rng = np.random.default_rng(self._seed)
+            population = self.__sample_valid_configs(rng)
+            losses = self.evaluate(population, executor=executor)
+            generation = 0
+            self.__save_checkpoint(generation, population, losses, rng)
+
+        while generation < generations:
+            # rand/1 mutation with three distinct partners per configuration
+            partners = np.array([rng.choice([j for j in range(self._pop_size) if j != i], 3, replace=False)
+                                 for i in range(self._pop_size)])
+            mutants = population[partners[:, 0]] + self._mutation * (
+                    population[partners[:, 1]] - population[partners[:, 2]])
+            mutants = np.clip(mutants, lower, upper)
+
+            # binomial crossover with at least one parameter of the mutant
+            cross = rng.random((self._pop_size, 8)) < self._crossover
+            cross[np.arange(self._pop_size), rng.integers(0, 8, self._pop_size)] = True
+            trials = np.where(cross, mutants, population)
+
+            # greedy selection
+            trial_losses = self.evaluate(trials, executor=executor)
+            better = trial_losses <= losses
+            population = np.where(better[:, None], trials, population)
+            losses = np.where(better, trial_losses, losses)
+
+            generation += 1
+            self.__save_checkpoint(generation, population, losses, rng)
+            logging.info("generation {} best loss {}".format(generation, losses.min()))
+
+        best = int(np.argmin(losses))
+        if losses[best] >= self.penalty:
+            raise UserWarning("No configuration reached exhaustion in all trials. Consider wider bounds.")
+        return population[best].tolist(), float(losses[best])
+
+    def __sample_valid_configs(self, rng: np.random.Generator) -> np.ndarray:
+        """
+        samples the initial population uniformly within bounds and redraws configurations with an LS tank of
+        negative height or, if the constraint is set, a phi larger than gamma
+        """
+        lower, upper = self._bounds[:, 0], self._bounds[:, 1]
+        population = lower + rng.random((self._pop_size, 8)) * (upper - lower)
+        for _ in range(1000):
+            invalid = (1 - population[:, 5] - population[:, 6]) <= 0
+            if config.three_comp_phi_constraint:
+                invalid |= population[:, 7] > population[:, 6]
+            if not np.any(invalid):
+                break
+            population[invalid] = lower + rng.random((int(invalid.sum()), 8)) * (upper - lower)
+        return population
+
+    @staticmethod
+    def fit_athlete(athlete, a_type: ActivityTypes, p_type: ProtocolTypes = ProtocolTypes.TTE,
+                    recovery_trials: list = None, generations: int = 100, **kwargs):
+        """
+        Fits a hydraulic configuration to the times to exhaustion of the athlete's CP fitting and stores it with
+        Athlete.set_hydraulic_fitting_of_type_and_protocol.
+        :param athlete: athlete with a stored CP fitting of given type and protocol
+        :param a_type: activity type of the CP fitting and the stored hydraulic configuration
+        :param p_type: protocol type of the CP fitting and the stored hydraulic configuration
+        :param recovery_trials: optional list of (p_work, p_rec, t_rec, ratio) tuples with observed recovery ratios
+        :param generations: number of generations of the differential evolution
+        :param kwargs: further settings of ThreeCompHydFitter, e.g., workers, seed, or checkpoint_path
+        :return: the fitted configuration
+        """
+        cpmf = athlete.get_cp_fitting_of_type_and_protocol(a_type=a_type, p_type=p_type)
+        if cpmf is None or not cpmf.has_time_power_pairs():
+            raise UserWarning("athlete {} has no times to exhaustion for {} {}".format(athlete.id, a_type.name,
+                                                                                      p_type.name))
+        fitter = ThreeCompHydFitter(ttes=cpmf.get_times(), recovery_trials=recovery_trials, **kwargs)
+        best, loss = fitter.fit(generations=generations)
+        logging.info("fitted hydraulic configuration {} with loss {}".format(best, loss))
+        athlete.set_hydraulic_fitting_of_type_and_protocol(config=best, a_type=a_type, p_type=p_type)
+        return best
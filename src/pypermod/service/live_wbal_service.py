@@ -0,0 +1,373 @@
+import asyncio
+import json
+import logging
+import math
+
+import numpy as np
+from pypermod.agents.hyd_agents.three_comp_hyd_agent import ThreeCompHydAgent
+from pypermod.agents.hyd_agents.three_comp_hyd_agent_population import ThreeCompHydAgentPopulation
+from pypermod.agents.wbal_agents.wbal_ode_agent_linear import CpODEAgentBasisLinear
+from pypermod.agents.wbal_agents.wbal_ode_agent_population import WbalODEAgentPopulation
+from pypermod.agents.wbal_agents.wbal_ode_agent_skiba import WbalODEAgentSkiba
+from pypermod.data_structure.activities.activity_types import ActivityTypes
+from pypermod.data_structure.activities.protocol_types import ProtocolTypes
+from pypermod.simulator.three_comp_hyd_population_simulator import ThreeCompHydPopulationSimulator
+
+
+class LiveWbalService:
+    """
+    Hosts differential and three component hydraulic agents of many athletes and estimates their W'bal live.
+    Power samples are ingested over a local TCP or Unix socket as newline delimited JSON messages:
+    * {"athlete": id, "power": watts} sets the power of a single athlete
+    * {"powers": {id: watts, ...}} sets the powers of multiple athletes
+    * {"subscribe": true} subscribes the connection to publications
+    Agents of an athlete keep the last received power until a new sample arrives. Every tick steps all agents of a
+    type at once as a WbalODEAgentPopulation or ThreeCompHydAgentPopulation. Publications are JSON lines of the
+    form {"time": seconds, "athletes": {id: {"power": watts, "w_bal": balance, "tte": seconds}}}.
+    Differential agents publish W'bal in Joules and hydraulic agents the fill-level ratio 1 - h.
+    The predicted TTE is the time until exhaustion if the current power is kept. It is None if exhaustion is not
+    reached within the TTE horizon.
+    """
+
+    def __init__(self, hz: int = 1, publish_interval: float = 1.0, tte_horizon: float = 600):
+        """
+        :param hz: ticks per second. All hosted agents have to operate at this hz.
+        :param publish_interval: seconds between publications of run()
+        :param tte_horizon: maximal predicted time to exhaustion in seconds
+        """
+        self._hz = hz
+        self._publish_interval = publish_interval
+        self._tte_horizon = tte_horizon
+
+        # agents by athlete ID in order of adding
+        self._ode_agents = {}
+        self._hyd_agents = {}
+        # populations are rebuilt at the next tick if athletes were added or removed
+        self._ode_pop = None
+        self._hyd_pop = None
+        self._ode_pow = np.zeros(0)
+        self._hyd_pow = np.zeros(0)
+        self._index = {}  # athlete ID -> (is hydraulic, position in population)
+        self._outdated = True
+
+        self._step = 0
+        self._subscribers = set()
+        self._servers = []
+
+    @property
+    def hz(self) -> int:
+        """:return: number of ticks per second"""
+        return self._hz
+
+    @property
+    def athlete_ids(self) -> list:
+        """:return: IDs of all hosted athletes"""
+        return list(self._ode_agents) + list(self._hyd_agents)
+
+    def get_time(self) -> float:
+        """:return: time in seconds since the service started ticking"""
+        return self._step / self._hz
+
+    def add_agent(self, athlete_id: str, agent):
+        """
+        Hosts an agent for given athlete. The agent's current W'bal or fill-levels are the starting state.
+        :param athlete_id: ID to address the athlete in messages
+        :param agent: differential agent (CpODEAgentBasisLinear subclass) or ThreeCompHydAgent
+        """
+        if agent.hz != self._hz:
+            raise UserWarning("Agent of {} operates at {} hz but the service at {} hz".format(athlete_id,
+                                                                                             agent.hz, self._hz))
+        if not isinstance(agent, CpODEAgentBasisLinear) and not isinstance(agent, ThreeCompHydAgent):
+            raise UserWarning("No live procedure implemented for agent type {}".format(agent))
+        self.remove_athlete(athlete_id)
+        if isinstance(agent, CpODEAgentBasisLinear):
+            self._ode_agents[athlete_id] = agent
+        else:
+            self._hyd_agents[athlete_id] = agent
+
+    def add_athlete(self, athlete, a_type: ActivityTypes, p_type: ProtocolTypes = ProtocolTypes.TTE,
+                    hydraulic: bool = False, agent_type=WbalODEAgentSkiba):
+        """
+        Hosts an agent with the stored fittings of given athlete. The athlete ID is used to address it.
+        :param athlete: Athlete with a stored CP or hydraulic fitting
+        :param a_type: activity type of the fitting
+        :param p_type: protocol type of the fitting
+        :param hydraulic: whether to host a ThreeCompHydAgent with the hydraulic fitting instead of a differential
+        agent with the best 2 parameter CP fitting
+        :param agent_type: class of the differential agent. Constructed with w_p, cp, and hz.
+        """
+        if hydraulic:
+            conf = athlete.get_hydraulic_fitting_of_type_and_protocol(a_type=a_type, p_type=p_type)
+            if conf is None:
+                raise UserWarning("athlete {} has no hydraulic fitting for {} {}".format(athlete.id, a_type.name,
+                                                                                        p_type.name))
+            self.add_agent(athlete.id, ThreeCompHydAgent(self._hz, *conf))
+        else:
+            cpmf = athlete.get_cp_fitting_of_type_and_protocol(a_type=a_type, p_type=p_type)
+            if cpmf is None:
+                raise UserWarning("athlete {} has no CP fitting for {} {}".format(athlete.id, a_type.name,
+                                                                                 p_type.name))
+            best = cpmf.get_best_2p_fit()
+            if best is None:
+                raise UserWarning("athlete {} has no valid 2p CP fitting".format(athlete.id))
+            self.add_agent(athlete.id, agent_type(w_p=best["w_p"], cp=best["cp"], hz=self._hz))
+
+    def remove_athlete(self, athlete_id: str):
+        """
+        stops hosting the agent of given athlete
+        """
+        self.__update_agents()
+        self._ode_agents.pop(athlete_id, None)
+        self._hyd_agents.pop(athlete_id, None)
+        self._outdated = True
+
+    def __update_agents(self):
+        """
+        writes the states of the populations back into the hosted agents
+        """
+        if self._outdated:
+            return
+        for athlete_id, agent in self._ode_agents.items():
+            agent.set_w_p_balance(float(self._ode_pop.get_w_p_balance()[self._index[athlete_id][1]]))
+        for athlete_id, agent in self._hyd_agents.items():
+            i = self._index[athlete_id][1]
+            agent.set_h(float(self._hyd_pop.get_h()[i]))
+            agent.set_g(float(self._hyd_pop.get_g()[i]))
+
+    def __rebuild(self):
+        """
+        creates populations of all hosted agents with their current states and powers
+        """
+        powers = {athlete_id: self.get_power(athlete_id) for athlete_id in self._index}
+
+        ode = list(self._ode_agents.values())
+        self._ode_pop = WbalODEAgentPopulation(ode) if len(ode) > 0 else None
+        if self._ode_pop is not None:
+            self._ode_pop.set_w_p_balance([a.get_w_p_balance() for a in ode])
+
+        hyd = list(self._hyd_agents.values())
+        self._hyd_pop = ThreeCompHydAgentPopulation.from_agents(hyd) if len(hyd) > 0 else None
+        if self._hyd_pop is not None:
+            self._hyd_pop.set_h([a.get_h() for a in hyd])
+            self._hyd_pop.set_g([a.get_g() for a in hyd])
+
+        self._index = {athlete_id: (False, i) for i, athlete_id in enumerate(self._ode_agents)}
+        self._index.update({athlete_id: (True, i) for i, athlete_id in enumerate(self._hyd_agents)})
+        self._ode_pow = np.array([powers.get(a, 0.0) for a in self._ode_agents], dtype=float)
+        self._hyd_pow = np.array([powers.get(a, 0.0) for a in self._hyd_agents], dtype=float)
+        self._outdated = False
+
+    def ingest(self, athlete_id: str, power: float) -> bool:
+        """
+        sets the power of given athlete for the following ticks
+        :return: False if the athlete is not hosted
+        """
+        if self._outdated:
+            self.__rebuild()
+        if athlete_id not in self._index:
+            return False
+        hydraulic, i = self._index[athlete_id]
+        if hydraulic:
+            self._hyd_pow[i] = power
+        else:
+            self._ode_pow[i] = power
+        return True
+
+    def get_power(self, athlete_id: str) -> float:
+        """
+        :return: current power of given athlete
+        """
+        if athlete_id not in self._index:
+            return 0.0
+        hydraulic, i = self._index[athlete_id]
+        return float(self._hyd_pow[i] if hydraulic else self._ode_pow[i])
+
+    def tick(self):
+        """
+        steps all hosted agents by one step with their current powers
+        """
+        if self._outdated:
+            self.__rebuild()
+        self._step += 1
+        if self._ode_pop is not None:
+            self._ode_pop.set_power(self._ode_pow)
+            self._ode_pop.perform_one_step()
+        if self._hyd_pop is not None:
+            self._hyd_pop.set_power(self._hyd_pow)
+            self._hyd_pop.perform_one_step()
+
+    def snapshot(self) -> dict:
+        """
+        :return: current power, W'bal, and predicted time to exhaustion of every hosted athlete
+        """
+        if self._outdated:
+            self.__rebuild()
+        athletes = {}
+
+        if self._ode_pop is not None:
+            w_bal = self._ode_pop.get_w_p_balance()
+            # linear expenditure of differential agents is counted without stepping
+            ttes = self._ode_pop.get_steps_until_exhaustion(self._ode_pow) / self._hz
+            for athlete_id in self._ode_agents:
+                i = self._index[athlete_id][1]
+                athletes[athlete_id] = self.__entry(self._ode_pow[i], w_bal[i], ttes[i])
+
+        if self._hyd_pop is not None:
+            h, g = self._hyd_pop.get_h().copy(), self._hyd_pop.get_g().copy()
+            # hydraulic agents are exhausted from their current fill-levels in a separate population
+            tte_pop = ThreeCompHydAgentPopulation(self._hz, self._hyd_pop.configs)
+            ttes = ThreeCompHydPopulationSimulator.tte(tte_pop, p_work=self._hyd_pow, start_h=h, start_g=g,
+                                                       t_max=self._tte_horizon)
+            for athlete_id in self._hyd_agents:
+                i = self._index[athlete_id][1]
+                athletes[athlete_id] = self.__entry(self._hyd_pow[i], 1.0 - h[i], ttes[i])
+
+        return {"time": self.get_time(), "athletes": athletes}
+
+    def __entry(self, power, w_bal, tte) -> dict:
+        """
+        :return: publication entry of a single athlete with JSON compatible values
+        """
+        tte = float(tte)
+        if math.isnan(tte) or tte > self._tte_horizon:
+            tte = None
+        return {"power": float(power), "w_bal": float(w_bal), "tte": tte}
+
+    async def publish(self):
+        """
+        sends a snapshot to all subscribed connections. Closed connections are unsubscribed.
+        """
+        if len(self._subscribers) == 0:
+            return
+        line = (json.dumps(self.snapshot()) + "\n").encode()
+        for writer in list(self._subscribers):
+            try:
+                writer.write(line)
+                await writer.drain()
+            except (ConnectionError, RuntimeError):
+                self._subscribers.discard(writer)
+
+    def __handle_message(self, msg: dict, writer):
+        """
+        applies a single message of a connection. Messages are validated entirely before any of their
+        samples is applied.
+        :raises ValueError, TypeError: if the message is malformed
+        """
+        if not isinstance(msg, dict):
+            raise TypeError("message has to be an object")
+        samples = []
+        if "athlete" in msg and "power" in msg:
+            samples.append((str(msg["athlete"]), float(msg["power"])))
+        powers = msg.get("powers", {})
+        if not isinstance(powers, dict):
+            raise TypeError("powers have to be an object of athlete IDs and powers")
+        samples.extend([(str(athlete_id), float(power)) for athlete_id, power in powers.items()])
+
+        if msg.get("subscribe", False):
+            self._subscribers.add(writer)
+        for athlete_id, power in samples:
+            if not self.ingest(athlete_id, power):
+                logging.warning("received power of unknown athlete {}".format(athlete_id))
+
+    async def __handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        reads messages of a connection until it is closed
+        """
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError as e:
+                    # the line exceeds the stream limit and was dropped from the buffer
+                    logging.warning("received oversized message: {}".format(e))
+                    continue
+                if not line:
+                    break
+                try:
+                    self.__handle_message(json.loads(line), writer)
+                except (ValueError, TypeError) as e:
+                    logging.warning("received invalid message {}: {}".format(line, e))
+        except ConnectionError:
+            pass
+        finally:
+            self._subscribers.discard(writer)
+            writer.close()
+
+    async def start_tcp_server(self, host: str = "127.0.0.1", port: int = 0):
+        """
+        accepts connections on a local TCP socket
+        :param port: port to listen on. 0 picks a free port.
+        :return: the port the server listens on
+        """
+        server = await asyncio.start_server(self.__handle_connection, host=host, port=port)
+        self._servers.append(server)
+        return server.sockets[0].getsockname()[1]
+
+    async def start_unix_server(self, path: str):
+        """
+        accepts connections on a Unix socket at given path
+        """
+        server = await asyncio.start_unix_server(self.__handle_connection, path=path)
+        self._servers.append(server)
+
+    async def run(self, duration: float = None):
+        """
+        ticks with the hz of the service and publishes snapshots every publish interval. Ticks are scheduled
+        against the event loop clock, so that delays don't accumulate.
+        :param duration: optional time in seconds after which the loop ends. Runs until cancelled if None.
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        ticks_per_publish = max(1, int(round(self._publish_interval * self._hz)))
+        n = 0
+        while duration is None or n < duration * self._hz:
+            n += 1
+            await asyncio.sleep(max(0.0, start + n / self._hz - loop.time()))
+            self.tick()
+            if n % ticks_per_publish == 0:
+                await self.publish()
+
+    async def close(self):
+        """
+        closes all servers and subscribed connections
+        """
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+        for writer in list(self._subscribers):
+            writer.close()
+        self._subscribers.clear()
+
+
+async def replay_courses(courses: dict, hz: int = 1, speed: float = None, host: str = "127.0.0.1",
+                         port: int = None, path: str = None):
+    """
+    A local replay client that sends recorded courses of multiple athletes to a LiveWbalService
+    :param courses: dict of athlete ID -> list of power samples
+    :param hz: samples per second of the courses
+    :param speed: replay speed relative to real time. Samples are sent as fast as possible if None.
+    :param host: host of a TCP service
+    :param port: port of a TCP service
+    :param path: path of a Unix socket service. Used instead of host and port if given.
+    :return: number of sent messages
+    """
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    length = max([len(c) for c in courses.values()], default=0)
+    for t in range(length):
+        # samples of all athletes of a time step are sent as a single message
+        msg = {"powers": {a: float(c[t]) for a, c in courses.items() if t < len(c)}}
+        writer.write((json.dumps(msg) + "\n").encode())
+        if speed is not None:
+            await writer.drain()
+            await asyncio.sleep(max(0.0, start + (t + 1) / (hz * speed) - loop.time()))
+    await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+    return length
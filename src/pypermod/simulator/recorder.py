@@ -0,0 +1,157 @@
+import numpy as np
+
+
+class SimulationRecorder:
+    """
+    Collects state variables of a simulation column by column. Only selected channels are kept and every
+    `decimation` consecutive steps are summarised into one sample with the given aggregate. In ring buffer mode
+    only the latest `ring_size` samples are kept, so that memory is bounded independent of the course length.
+    Steps are recorded in blocks with record(). Windows of the decimation can span multiple blocks.
+    """
+
+    # available aggregates of decimation windows
+    aggregates = ("last", "mean", "min", "max")
+
+    def __init__(self, channels, decimation: int = 1, aggregate: str = "last", ring_size: int = None):
+        """
+        :param channels: names of the state variables to record
+        :param decimation: number of steps that are summarised into one sample
+        :param aggregate: how steps are summarised. One of SimulationRecorder.aggregates.
+        :param ring_size: optional maximal number of samples to keep. Older samples are overwritten.
+        """
+        if len(channels) == 0:
+            raise UserWarning("At least one channel has to be recorded")
+        if decimation < 1:
+            raise UserWarning("Decimation has to be at least 1, got {}".format(decimation))
+        if aggregate not in self.aggregates:
+            raise UserWarning("Unknown aggregate {}. Use one of {}".format(aggregate, self.aggregates))
+        if ring_size is not None and ring_size < 1:
+            raise UserWarning("Ring size has to be at least 1, got {}".format(ring_size))
+
+        self._channels = tuple(channels)
+        self._decimation = decimation
+        self._aggregate = aggregate
+        self._ring_size = ring_size
+        self.reset()
+
+    def reset(self):
+        """
+        removes all recorded samples
+        """
+        # one row per channel and a last row with the step number of every sample
+        rows = len(self._channels) + 1
+        self._buffer = np.empty((rows, 1024 if self._ring_size is None else self._ring_size))
+        self._size = 0  # number of stored samples
+        self._head = 0  # ring buffer position of the next sample
+        self._pending = np.empty((rows, 0))  # steps of an incomplete decimation window
+        self._steps = 0  # number of recorded steps
+
+    @property
+    def channels(self) -> tuple:
+        """:return: names of recorded state variables"""
+        return self._channels
+
+    @property
+    def decimation(self) -> int:
+        """:return: number of steps per sample"""
+        return self._decimation
+
+    def __len__(self):
+        """:return: number of stored samples"""
+        return self._size
+
+    def record(self, columns: dict):
+        """
+        Records a block of consecutive steps
+        :param columns: dict with an array of values for every recorded channel. Further entries are ignored.
+        """
+        missing = [c for c in self._channels if c not in columns]
+        if len(missing) > 0:
+            raise UserWarning("Values of channels {} are missing".format(missing))
+
+        block = np.array([np.asarray(columns[c], dtype=float) for c in self._channels], ndmin=2)
+        n = block.shape[1]
+        steps = np.arange(self._steps + 1, self._steps + n + 1, dtype=float)
+        self._steps += n
+
+        data = np.concatenate((self._pending, np.vstack((block, steps))), axis=1)
+        full = (data.shape[1] // self._decimation) * self._decimation
+        self._pending = data[:, full:]
+        if full > 0:
+            windows = data[:, :full].reshape(data.shape[0], -1, self._decimation)
+            self.__store(self.__summarise(windows))
+
+    def flush(self):
+        """
+        summarises the steps of an incomplete decimation window into a sample. Call at the end of a simulation.
+        """
+        if self._pending.shape[1] > 0:
+            self.__store(self.__summarise(self._pending[:, None, :]))
+            self._pending = np.empty((self._pending.shape[0], 0))
+
+    def __summarise(self, windows: np.ndarray) -> np.ndarray:
+        """
+        :param windows: array of shape (rows, samples, steps per window)
+        :return: array of shape (rows, samples)
+        """
+        if self._aggregate == "last":
+            values = windows[:, :, -1]
+        elif self._aggregate == "mean":
+            values = windows.mean(axis=2)
+        elif self._aggregate == "min":
+            values = windows.min(axis=2)
+        else:
+            values = windows.max(axis=2)
+        # samples are labelled with the last step of their window
+        values[-1] = windows[-1, :, -1]
+        return values
+
+    def __store(self, values: np.ndarray):
+        """
+        appends samples to the buffer
+        :param values: array of shape (rows, samples)
+        """
+        k = values.shape[1]
+        if self._ring_size is None:
+            # grow the buffer by doubling its capacity
+            if self._size + k > self._buffer.shape[1]:
+                capacity = max(self._buffer.shape[1] * 2, self._size + k)
+                buffer = np.empty((self._buffer.shape[0], capacity))
+                buffer[:, :self._size] = self._buffer[:, :self._size]
+                self._buffer = buffer
+            self._buffer[:, self._size:self._size + k] = values
+            self._size += k
+            return
+
+        # in ring buffer mode only the latest samples fit
+        if k > self._ring_size:
+            values = values[:, -self._ring_size:]
+            k = self._ring_size
+        first = min(k, self._ring_size - self._head)
+        self._buffer[:, self._head:self._head + first] = values[:, :first]
+        self._buffer[:, :k - first] = values[:, first:]
+        self._head = (self._head + k) % self._ring_size
+        self._size = min(self._size + k, self._ring_size)
+
+    def __get_row(self, row: int) -> np.ndarray:
+        """
+        :return: stored samples of given buffer row in chronological order
+        """
+        if self._ring_size is None or self._size < self._ring_size:
+            return self._buffer[row, :self._size].copy()
+        return np.concatenate((self._buffer[row, self._head:], self._buffer[row, :self._head]))
+
+    def get(self, channel: str) -> np.ndarray:
+        """
+        :param channel: name of a recorded state variable
+        :return: stored samples of the channel in chronological order
+        """
+        if channel not in self._channels:
+            raise UserWarning("Channel {} is not recorded. Recorded are {}".format(channel, self._channels))
+        return self.__get_row(self._channels.index(channel))
+
+    def get_steps(self) -> np.ndarray:
+        """
+        :return: number of the last step of every stored sample. Step 1 is the first recorded step.
+        """
+        return self.__get_row(len(self._channels)).astype(int)
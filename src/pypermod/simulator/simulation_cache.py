@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+from importlib import metadata
+
+import numpy as np
+
+
+class SimulationCache:
+    """
+    A persistent cache of simulation results on disk. Results are stored as .npy files named after a content hash
+    of the simulation function, the type and parameters of the agent, further arguments, and the course data.
+    Hits are returned as read-only memory-mapped arrays. The total size of stored results is bounded and the least
+    recently used results are evicted first.
+    Enable it for SimulatorBasis simulations with SimulatorBasis.cache = SimulationCache(path).
+    Keys include the cache format and the installed pypermod version, so that results of older code are not reused.
+    """
+
+    # increase if simulation results change without a new package version
+    format_version = 1
+    # looked up once
+    __package_version = None
+
+    def __init__(self, path: str, max_bytes: int = 2 ** 30):
+        """
+        :param path: directory of the stored results. Created if it doesn't exist.
+        :param max_bytes: maximal total size of stored results in bytes
+        """
+        self._path = path
+        self._max_bytes = max_bytes
+        os.makedirs(self._path, exist_ok=True)
+
+        # the number of lookups that were found or not found since creation
+        self.hits = 0
+        self.misses = 0
+
+        # key -> file size of stored results from least to most recently used. Files of previous runs are
+        # ordered by their modification times.
+        stored = []
+        for name in os.listdir(self._path):
+            if name.endswith(".npy") and not name.endswith(".tmp.npy"):
+                stat = os.stat(os.path.join(self._path, name))
+                stored.append((stat.st_mtime, name[:-4], stat.st_size))
+        self._entries = {key: size for _, key, size in sorted(stored)}
+
+    @property
+    def path(self) -> str:
+        """:return: directory of the stored results"""
+        return self._path
+
+    def __len__(self):
+        """:return: number of stored results"""
+        return len(self._entries)
+
+    def get_size(self) -> int:
+        """:return: total size of stored results in bytes"""
+        return sum(self._entries.values())
+
+    @staticmethod
+    def fingerprint(agent) -> dict:
+        """
+        Parameters of an agent that determine simulation results. Call on a reset agent, so that state variables
+        are at their defaults. Only boolean, string, and number attributes are considered, so that lazily
+        filled lookup tables of agents don't change the fingerprint. Numbers are compared as floats.
+        :return: dict with the agent type and its scalar attributes
+        """
+        params = {}
+        for key, value in sorted(vars(agent).items()):
+            if isinstance(value, bool) or isinstance(value, str):
+                params[key] = value
+            elif isinstance(value, (int, float, np.integer, np.floating)):
+                params[key] = repr(float(value))
+        return {"type": "{}.{}".format(type(agent).__module__, type(agent).__qualname__), "params": params}
+
+    @staticmethod
+    def get_package_version() -> str:
+        """:return: the installed pypermod version or "unknown" if it isn't installed as a package"""
+        if SimulationCache.__package_version is None:
+            try:
+                SimulationCache.__package_version = metadata.version("pypermod")
+            except metadata.PackageNotFoundError:
+                SimulationCache.__package_version = "unknown"
+        return SimulationCache.__package_version
+
+    @staticmethod
+    def get_key(function: str, agent, args: tuple = (), course_data=None) -> str:
+        """
+        :param function: name of the simulation function
+        :param agent: reset agent of the simulation
+        :param args: further JSON serialisable arguments that determine the result
+        :param course_data: optional list or array of intensities
+        :return: stable hash of the simulation
+        """
+        digest = hashlib.sha256()
+        description = {"format": SimulationCache.format_version, "version": SimulationCache.get_package_version(),
+                       "function": function, "agent": SimulationCache.fingerprint(agent), "args": list(args)}
+        digest.update(json.dumps(description, sort_keys=True).encode())
+        if course_data is not None:
+            digest.update(np.ascontiguousarray(np.asarray(course_data, dtype=float)).tobytes())
+        return digest.hexdigest()
+
+    def __file(self, key: str) -> str:
+        """:return: path of the result file of given key"""
+        return os.path.join(self._path, key + ".npy")
+
+    def get(self, key: str):
+        """
+        :return: the stored result of given key as a read-only memory-mapped array or None if there is none
+        """
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        try:
+            result = np.load(self.__file(key), mmap_mode="r")
+        except (OSError, ValueError):
+            # removed or corrupted by another process
+            self._entries.pop(key)
+            self.misses += 1
+            return None
+        # the modification time tracks the last use across runs
+        os.utime(self.__file(key))
+        self._entries[key] = self._entries.pop(key)
+        self.hits += 1
+        return result
+
+    def put(self, key: str, result):
+        """
+        stores a result and evicts the least recently used results if the size limit is exceeded
+        :param key: hash of the simulation
+        :param result: array or scalar
+        """
+        # write to a temporary file first, so that other processes never load a partial result
+        tmp_path = self.__file(key) + ".tmp.npy"
+        np.save(tmp_path, np.asarray(result))
+        os.replace(tmp_path, self.__file(key))
+        self._entries.pop(key, None)
+        self._entries[key] = os.path.getsize(self.__file(key))
+        self.__evict()
+
+    def __evict(self):
+        """
+        removes least recently used results until the size limit is met
+        """
+        size = self.get_size()
+        for key in list(self._entries):
+            if size <= self._max_bytes:
+                break
+            size -= self._entries.pop(key)
+            try:
+                os.remove(self.__file(key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """
+        removes all stored results and resets the counters
+        """
+        for key in list(self._entries):
+            try:
+                os.remove(self.__file(key))
+            except FileNotFoundError:
+                pass
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
@@ -1,9 +1,15 @@
 import logging
+import math
 
+import numpy as np
+from pypermod import config
 from pypermod.agents.hyd_agents.three_comp_hyd_agent import ThreeCompHydAgent
+from pypermod.agents.hyd_agents.three_comp_hyd_agent_population import ThreeCompHydAgentPopulation
+from pypermod.agents.hyd_agents.three_comp_hyd_kernel import jit_available
 from pypermod.agents.hyd_agents.two_comp_hyd_agent import TwoCompHydAgent
 from pypermod.agents.wbal_agents.wbal_ode_agent_linear import CpODEAgentBasisLinear
 from pypermod.agents.wbal_agents.wbal_int_agent import WbalIntAgent
+from pypermod.simulator.three_comp_hyd_population_simulator import ThreeCompHydPopulationSimulator
 
 
 class SimulatorBasis:
@@ -13,6 +19,41 @@ class SimulatorBasis:
     """
     # the maximal number of steps for a single simulation run
     step_limit = 5000
+    # number of sections per round of the power search of power_for_tte with lockstep hydraulic populations
+    power_search_sections = 8
+    # an optional SimulationCache for results of simulate_course, get_tte_dynamics, and get_recovery_ratio_wb1_wb2
+    cache = None
+
+    @staticmethod
+    def _get_cache_key(function: str, agent, args: tuple = (), course_data=None) -> str:
+        """
+        :return: key of a simulation in SimulatorBasis.cache. The step limit is part of every key.
+        """
+        return SimulatorBasis.cache.get_key(function, agent, args=args + (SimulatorBasis.step_limit,),
+                                            course_data=course_data)
+
+    @staticmethod
+    def _cached(function: str, agent, compute, args: tuple = (), course_data=None):
+        """
+        Looks up the result of a simulation in SimulatorBasis.cache and computes and stores it if it is missing.
+        Without a cache the result is computed directly. On hits the agent is not simulated and stays reset.
+        :param function: name of the simulation function
+        :param agent: reset agent of the simulation
+        :param compute: function without arguments that runs the simulation
+        :param args: further arguments that determine the result
+        :param course_data: optional course data that determines the result
+        :return: result of the simulation. Hits are read-only memory-mapped arrays.
+        """
+        cache = SimulatorBasis.cache
+        if cache is None:
+            return compute()
+        key = SimulatorBasis._get_cache_key(function, agent, args=args, course_data=course_data)
+        result = cache.get(key)
+        if result is None:
+            result = compute()
+            if result is not None:
+                cache.put(key, result)
+        return result
 
     @staticmethod
     def get_tte_dynamics(agent, p_work: float):
@@ -22,47 +63,308 @@ class SimulatorBasis:
         For hydraulic agents it returns a history of a remaining liquid appriximation at each time step.
         :param agent: the agent tasked with simulating the TTE
         :param p_work: exercise intensity of the TTE in Watts
-        :return: a history of remaining energy values. One for each time step of the simulation. Pos 0 is time step 1.
+        :return: an array of remaining energy values. One for each time step of the simulation. Pos 0 is time step 1.
         """
 
         agent.reset()
+        return SimulatorBasis._cached("get_tte_dynamics", agent,
+                                      lambda: SimulatorBasis.__get_tte_dynamics(agent, p_work),
+                                      args=(float(p_work),))
 
+    @staticmethod
+    def __get_tte_dynamics(agent, p_work: float):
+        """
+        get_tte_dynamics of a reset agent without the cache
+        """
         # ... integral agents
         if isinstance(agent, WbalIntAgent):
             w_bal_hist = agent.get_expenditure_dynamics(p_work)
-            return w_bal_hist
+            return np.asarray(w_bal_hist, dtype=float)
 
         # ... differential agent
         elif isinstance(agent, CpODEAgentBasisLinear):
+            # no need to step if the query says exhaustion is out of reach
+            if agent.time_to_exhaustion(p_work) * agent.hz > SimulatorBasis.step_limit:
+                raise UserWarning("Exhaustion not reached")
             agent.set_power(p_work)
             step = 0
-            w_bal_hist = []
+            w_bal_hist = np.empty(SimulatorBasis.step_limit)
             while not agent.is_exhausted() and step < SimulatorBasis.step_limit:
                 agent.perform_one_step()
-                w_bal_hist.append(agent.get_w_p_balance())
+                w_bal_hist[step] = agent.get_w_p_balance()
                 step += 1
             if not agent.is_exhausted():
                 raise UserWarning("Exhaustion not reached")
-            return w_bal_hist
+            return w_bal_hist[:step]
 
         # ... hydraulic agent
         elif isinstance(agent, ThreeCompHydAgent):
-            agent.set_power(p_work)
-            step = 0
-            w_bal_hist = []
-            while not agent.is_exhausted() and step < SimulatorBasis.step_limit:
-                agent.perform_one_step()
-                w_bal_hist.append(agent.get_w_p_ratio())
-                step += 1
+            h_hist, _ = agent.perform_power_steps([p_work] * SimulatorBasis.step_limit, stop_at_exhaustion=True)
             if not agent.is_exhausted():
                 raise UserWarning("Exhaustion not reached")
-            return w_bal_hist
+            return 1.0 - h_hist
 
         # unknown type warning
         raise UserWarning("No procedure implemented for agent type {}".format(agent))
 
     @staticmethod
-    def get_recovery_ratio_wb1_wb2(agent, p_work, p_rec, t_rec):
+    def tte_curve(agent, powers, t_max: float = None) -> np.ndarray:
+        """
+        Times to exhaustion at multiple constant powers in a single call, e.g., to plot the power-duration
+        relationship of an agent. Integral and two component hydraulic agents are solved in closed form and
+        differential agents count their steps with the rounding of stepped expenditure. Three component hydraulic
+        agents run the compiled step kernel if it is available and are stepped in lockstep as a
+        ThreeCompHydAgentPopulation otherwise. Results equal the lengths of get_tte_dynamics divided by hz.
+        :param agent: the agent tasked with simulating the TTEs
+        :param powers: list or array of constant exercise intensities in Watts
+        :param t_max: maximal time in seconds. Default is the time of SimulatorBasis.step_limit steps.
+        :return: array of times to exhaustion in seconds. NaN where exhaustion is not reached within t_max.
+        """
+        np_powers = np.asarray(powers, dtype=float)
+        step_limit = SimulatorBasis.step_limit if t_max is None else int(math.ceil(t_max * agent.hz))
+        steps = np.full(len(np_powers), np.nan)
+
+        agent.reset()
+        # ... integral agents
+        if isinstance(agent, WbalIntAgent):
+            # DCP is 0 because it is a TTE
+            tau = agent._get_tau_to_dcp(0)
+            for i, p in enumerate(np_powers):
+                if p > agent.cp:
+                    try:
+                        steps[i] = agent._get_tte_steps(p_exp=p, tau=tau)
+                    except UserWarning:
+                        pass
+
+        # ... differential agents
+        elif isinstance(agent, CpODEAgentBasisLinear):
+            for i, p in enumerate(np_powers):
+                steps[i] = agent._get_steps_until_exhaustion(p, w_bal=agent.w_p)
+
+        # ... hydraulic agents
+        elif isinstance(agent, TwoCompHydAgent):
+            for i, p in enumerate(np_powers):
+                agent.reset()
+                done = agent.perform_constant_power_steps(p, step_limit, stop_at_exhaustion=True)
+                if agent.is_exhausted():
+                    steps[i] = done
+        elif isinstance(agent, ThreeCompHydAgent):
+            if config.three_comp_jit and jit_available():
+                # the compiled kernel is faster than lockstep NumPy operations
+                for i, p in enumerate(np_powers):
+                    agent.reset()
+                    h_hist, _ = agent.perform_power_steps(np.full(step_limit, p), stop_at_exhaustion=True)
+                    if agent.is_exhausted():
+                        steps[i] = len(h_hist)
+            else:
+                population = ThreeCompHydAgentPopulation.from_agents([agent] * len(np_powers))
+                ttes = ThreeCompHydPopulationSimulator.tte(population, p_work=np_powers,
+                                                           t_max=step_limit / agent.hz)
+                steps = np.round(ttes * agent.hz)
+        else:
+            raise UserWarning("No procedure implemented for agent type {}".format(agent))
+
+        agent.reset()
+        with np.errstate(invalid="ignore"):
+            steps = np.where(steps <= step_limit, steps, np.nan)
+        return steps / agent.hz
+
+    @staticmethod
+    def power_for_tte(agent, ttes, state: dict = None, tolerance: float = 0.01) -> np.ndarray:
+        """
+        Inverse of tte_curve. Estimates the constant powers that exhaust the agent in given times. Differential and
+        integral agents are inverted analytically. Hydraulic agents are solved with a bisection of all targets at
+        once. Every probe of the bisection simulates all targets from the start state, three component hydraulic
+        agents as a ThreeCompHydAgentPopulation. The agent is reset afterwards.
+        :param agent: the agent to exhaust
+        :param ttes: list or array of target times to exhaustion in seconds
+        :param state: optional snapshot of agent.get_state() to start from. Default is a fully recovered agent.
+        Integral agents only support the default.
+        :param tolerance: maximal width in Watts of the final bisection interval of hydraulic agents
+        :return: array of powers in Watts. Hydraulic agents return the upper end of the final interval, which
+        exhausts the agent within the target time. NaN for targets shorter than a single time step.
+        """
+        np_ttes = np.asarray(ttes, dtype=float)
+        agent.reset()
+        if state is not None:
+            if isinstance(agent, WbalIntAgent):
+                raise UserWarning("Integral agents only estimate TTEs of fully recovered agents")
+            agent.set_state(state)
+        # targets as number of time steps
+        steps = np.round(np_ttes * agent.hz)
+        valid = steps >= 1
+
+        # ... differential agents expend linearly: steps = W'bal / ((p - CP) * delta t)
+        if isinstance(agent, CpODEAgentBasisLinear):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                powers = agent.cp + agent.get_w_p_balance() * agent.hz / steps
+            powers = SimulatorBasis.__round_up_powers(powers, steps, valid, agent._get_steps_until_exhaustion)
+
+        # ... integral agents: the geometric series of W'exp reaches W' after the targeted steps
+        elif isinstance(agent, WbalIntAgent):
+            # DCP is 0 because it is a TTE
+            tau = agent._get_tau_to_dcp(0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                powers = agent.cp + agent.w_p * np.expm1(-1 / tau) / np.expm1(-steps / tau)
+            powers = SimulatorBasis.__round_up_powers(powers, steps, valid,
+                                                      lambda p: agent._get_tte_steps(p_exp=p, tau=tau))
+
+        # ... hydraulic agents
+        elif isinstance(agent, TwoCompHydAgent) or isinstance(agent, ThreeCompHydAgent):
+            start = agent.get_state()
+            ks = np.where(valid, steps, 1).astype(int)
+            if isinstance(agent, ThreeCompHydAgent) and not (config.three_comp_jit and jit_available()):
+                # every target probes multiple powers per round in a single population
+                sections = SimulatorBasis.power_search_sections
+                population = ThreeCompHydAgentPopulation.from_agents([agent] * (len(ks) * (sections - 1)))
+                limits = np.repeat(ks, sections - 1) / agent.hz
+
+                def exhausts(probe_powers):
+                    population.reset()
+                    population.set_h(start["h"])
+                    population.set_g(start["g"])
+                    population.set_power(probe_powers.ravel())
+                    # every probe is only stepped until the time of its target
+                    active = np.ones(len(population), dtype=bool)
+                    while np.any(active):
+                        population.perform_one_step(mask=active)
+                        active &= ~population.is_exhausted() & ~population.is_failed() & \
+                                  (population.get_time() < limits)
+                    return (population.is_exhausted() & ~population.is_failed()).reshape(probe_powers.shape)
+            else:
+                # closed form segments of two component agents and the compiled kernel of three component
+                # agents are fastest with one probe per target and round
+                sections = 2
+
+                def exhausts(probe_powers):
+                    result = np.zeros(probe_powers.shape, dtype=bool)
+                    for i, k in enumerate(ks):
+                        agent.set_state(start)
+                        if isinstance(agent, TwoCompHydAgent):
+                            agent.perform_constant_power_steps(probe_powers[i, 0], int(k), stop_at_exhaustion=True)
+                        else:
+                            agent.perform_power_steps(np.full(k, probe_powers[i, 0]), stop_at_exhaustion=True)
+                        result[i, 0] = agent.is_exhausted()
+                    return result
+
+            powers = SimulatorBasis.__search_powers(exhausts, len(ks), sections, tolerance)
+        else:
+            raise UserWarning("No procedure implemented for agent type {}".format(agent))
+
+        agent.reset()
+        return np.where(valid, powers, np.nan)
+
+    @staticmethod
+    def __round_up_powers(powers: np.ndarray, steps: np.ndarray, valid: np.ndarray, get_steps) -> np.ndarray:
+        """
+        Analytic inverses can miss the targeted number of steps by one because of floating point effects, e.g.,
+        the rounding of thousands of stepped subtractions. Such powers are increased by amounts that start at the
+        spacing of floats and double until the target is reached.
+        :param get_steps: function that returns the number of steps until exhaustion at a given power
+        """
+        powers = powers.copy()
+        for i in np.flatnonzero(valid):
+            power, delta = powers[i], np.spacing(powers[i])
+            while get_steps(float(powers[i])) > steps[i]:
+                powers[i] = power + delta
+                delta *= 2
+        return powers
+
+    @staticmethod
+    def __search_powers(exhausts, n: int, sections: int, tolerance: float) -> np.ndarray:
+        """
+        Batched bracketing search for the smallest powers that exhaust within the targeted times. Every round
+        splits the interval of every target into given number of sections and probes all inner points at once.
+        Two sections are a bisection.
+        :param exhausts: function that returns for an n x (sections - 1) array of ascending powers per target
+        whether each exhausts within the target
+        :param n: number of targets
+        :param sections: number of sections per round
+        :param tolerance: maximal width of the final intervals in Watts
+        :return: upper ends of the final intervals
+        """
+        rows = np.arange(n)
+        lower = np.zeros(n)
+        upper = np.full(n, 1000.0)
+
+        def narrow(points):
+            # the first exhausting point is the new upper end and the point before it the new lower end
+            exhausted = exhausts(points)
+            found = np.any(exhausted, axis=1)
+            first = np.argmax(exhausted, axis=1)
+            below = np.where(first > 0, points[rows, first - 1], lower)
+            return np.where(found, below, points[:, -1]), np.where(found, points[rows, first], np.inf), found
+
+        # probe multiples of the upper ends until every target is bracketed
+        for _ in range(30):
+            new_lower, new_upper, found = narrow(upper[:, None] * 2.0 ** np.arange(sections - 1))
+            lower, upper = new_lower, np.where(found, new_upper, new_lower * 2)
+            if np.all(found):
+                break
+        else:
+            raise UserWarning("Powers for the targeted times to exhaustion could not be bracketed")
+
+        fractions = np.arange(1, sections) / sections
+        while np.any(upper - lower > tolerance):
+            new_lower, new_upper, found = narrow(lower[:, None] + (upper - lower)[:, None] * fractions)
+            lower, upper = new_lower, np.where(found, new_upper, upper)
+        return upper
+
+    @staticmethod
+    def get_wb1_state(agent, p_work: float) -> dict:
+        """
+        Simulates the WB1 exhaustion bout of the WB1 -> RB -> WB2 protocol. The returned snapshot can be passed
+        to get_recovery_ratio_wb1_wb2 to estimate multiple recovery ratios without simulating WB1 again.
+        Differential and hydraulic agents are supported.
+        :param agent: agent to exhaust. It is left in the exhausted state.
+        :param p_work: work bout intensity
+        :return: snapshot of the exhausted agent from agent.get_state()
+        """
+        agent.reset()
+        if isinstance(agent, CpODEAgentBasisLinear):
+            # constant power bouts are jumped over analytically
+            agent.perform_constant_power_steps(p_work, SimulatorBasis.step_limit, stop_at_exhaustion=True)
+        elif isinstance(agent, ThreeCompHydAgent) or isinstance(agent, TwoCompHydAgent):
+            agent.perform_power_steps([p_work] * SimulatorBasis.step_limit, stop_at_exhaustion=True)
+        else:
+            raise UserWarning("No WB1 procedure implemented for agent type {}".format(agent))
+
+        if not agent.is_exhausted():
+            raise UserWarning("exhaustion not reached!")
+        return agent.get_state()
+
+    @staticmethod
+    def _perform_constant_power_steps(agent, power: float, steps: int):
+        """
+        advances a differential or hydraulic agent by given number of steps at constant power
+        """
+        if isinstance(agent, CpODEAgentBasisLinear):
+            # constant power bouts are jumped over analytically
+            agent.perform_constant_power_steps(power, steps)
+        else:
+            agent.perform_power_steps([power] * steps)
+
+    @staticmethod
+    def _get_wb2_ratio(agent, p_work: float, wb1_t: float) -> float:
+        """
+        Simulates the WB2 bout from the current state of a differential or hydraulic agent
+        :param agent: agent at the end of the recovery bout
+        :param p_work: work bout intensity
+        :param wb1_t: duration of WB1 in seconds
+        :return: recovery ratio in percent
+        """
+        if hasattr(agent, "time_to_exhaustion"):
+            # agents with a time to exhaustion query don't need to step. Only the time is of interest.
+            wb2_t = min(agent.time_to_exhaustion(p_work), SimulatorBasis.step_limit / agent.hz)
+            return (wb2_t / wb1_t) * 100.0
+        rec_t = agent.get_time()
+        agent.perform_power_steps([p_work] * SimulatorBasis.step_limit, stop_at_exhaustion=True)
+        wb2_t = agent.get_time()
+        # return ratio of times as recovery ratio
+        return ((wb2_t - rec_t) / wb1_t) * 100.0
+
+    @staticmethod
+    def get_recovery_ratio_wb1_wb2(agent, p_work, p_rec, t_rec, wb1_state: dict = None):
         """
         Returns recovery ratio of given agent according to WB1 -> RB -> WB2 protocol.
         Recovery ratio estimations for given exp, rec intensity and time
@@ -70,10 +372,23 @@ class SimulatorBasis:
         :param p_work: work bout intensity
         :param p_rec: recovery bout intensity
         :param t_rec: recovery bout duration
+        :param wb1_state: optional snapshot of get_wb1_state with the same agent and p_work. Differential and
+        hydraulic agents continue from it instead of simulating WB1 again.
         :return: ratio in percent
         """
 
         agent.reset()
+        ratio = SimulatorBasis._cached(
+            "get_recovery_ratio_wb1_wb2", agent,
+            lambda: SimulatorBasis.__get_recovery_ratio_wb1_wb2(agent, p_work, p_rec, t_rec, wb1_state),
+            args=(float(p_work), float(p_rec), float(t_rec)))
+        return None if ratio is None else float(ratio)
+
+    @staticmethod
+    def __get_recovery_ratio_wb1_wb2(agent, p_work, p_rec, t_rec, wb1_state: dict):
+        """
+        get_recovery_ratio_wb1_wb2 of a reset agent without the cache
+        """
         hz = agent.hz
 
         # The handling agent types
@@ -88,7 +403,8 @@ class SimulatorBasis:
                           [p_rec] * t_rec + \
                           [p_work] * c_exp_tte
             # get W'bal history
-            caen_bal = SimulatorBasis.simulate_course(agent, caen_course)
+            agent.reset()
+            caen_bal = SimulatorBasis.__simulate_course(agent, caen_course)
 
             # look for the time of exhaustion in the second exercise bout
             found_i = 0
@@ -101,33 +417,34 @@ class SimulatorBasis:
             ratio = (found_i / c_exp_tte) * 100.0
             return ratio
 
-        elif isinstance(agent, CpODEAgentBasisLinear) or isinstance(agent, ThreeCompHydAgent):
-            # WB1 Exhaust...
-            agent.set_power(p_work)
-            steps = 0
-            while not agent.is_exhausted() and steps < SimulatorBasis.step_limit:
-                agent.perform_one_step()
-                steps += 1
+        elif isinstance(agent, CpODEAgentBasisLinear):
+            # constant power bouts are jumped over analytically
+            # WB1 Exhaust... or continue from the exhausted state
+            if wb1_state is None:
+                SimulatorBasis.get_wb1_state(agent, p_work)
+            else:
+                agent.set_state(wb1_state)
             wb1_t = agent.get_time()
 
-            if not agent.is_exhausted():
-                raise UserWarning("exhaustion not reached!")
+            # Recover...
+            SimulatorBasis._perform_constant_power_steps(agent, p_rec, int(t_rec * hz))
+
+            # WB2 Exhaust...
+            return SimulatorBasis._get_wb2_ratio(agent, p_work, wb1_t)
+
+        elif isinstance(agent, ThreeCompHydAgent) or isinstance(agent, TwoCompHydAgent):
+            # WB1 Exhaust... or continue from the exhausted state
+            if wb1_state is None:
+                SimulatorBasis.get_wb1_state(agent, p_work)
+            else:
+                agent.set_state(wb1_state)
+            wb1_t = agent.get_time()
 
             # Recover...
-            agent.set_power(p_rec)
-            for _ in range(0, int(t_rec * hz)):
-                agent.perform_one_step()
-            rec_t = agent.get_time()
+            SimulatorBasis._perform_constant_power_steps(agent, p_rec, int(t_rec * hz))
 
             # WB2 Exhaust...
-            agent.set_power(p_work)
-            steps = 0
-            while not agent.is_exhausted() and steps < SimulatorBasis.step_limit:
-                agent.perform_one_step()
-                steps += 1
-            wb2_t = agent.get_time()
-            # return ratio of times as recovery ratio
-            return ((wb2_t - rec_t) / wb1_t) * 100.0
+            return SimulatorBasis._get_wb2_ratio(agent, p_work, wb1_t)
         else:
             logging.warning("unknown agent type {}".format(agent))
 
@@ -137,26 +454,157 @@ class SimulatorBasis:
         Makes the given agent predict remaining energy for every time step of the given course data.
         :param agent: agent to use for predictions
         :param course_data: Expected as a list of intensities in Watts
-        :return: a history of remaining energy values. One for each time step of the simulation. Pos 0 is time step 1.
+        :return: an array of remaining energy values. One for each time step of the simulation. Pos 0 is time step 1.
         """
 
         agent.reset()
+        return SimulatorBasis._cached("simulate_course", agent,
+                                      lambda: SimulatorBasis.__simulate_course(agent, course_data),
+                                      course_data=course_data)
+
+    @staticmethod
+    def __simulate_course(agent, course_data):
+        """
+        simulate_course of a reset agent without the cache
+        """
         # estimate W' bal history for...
-        w_bal_hist = []
         # ... integral agents
         if isinstance(agent, WbalIntAgent):
-            w_bal_hist = agent.estimate_w_p_bal_to_data(course_data)
-        # ... differential agent
-        elif isinstance(agent, CpODEAgentBasisLinear) or isinstance(agent, TwoCompHydAgent):
-            for tick in course_data:
+            return np.asarray(agent.estimate_w_p_bal_to_data(course_data), dtype=float)
+        # ... differential and hydraulic agents
+        elif isinstance(agent, CpODEAgentBasisLinear) or isinstance(agent, TwoCompHydAgent) or \
+                isinstance(agent, ThreeCompHydAgent):
+            return SimulatorBasis._simulate_steps(agent, course_data)
+        return np.empty(0)
+
+    @staticmethod
+    def _simulate_steps(agent, powers) -> np.ndarray:
+        """
+        Continues the simulation of an agent from its current state by one step per given power
+        :param agent: agent to use for predictions
+        :param powers: list or array of intensities in Watts
+        :return: an array of remaining energy values after every step
+        """
+        # ... integral agents in streaming mode and differential agents
+        if isinstance(agent, WbalIntAgent) or isinstance(agent, CpODEAgentBasisLinear):
+            w_bal_hist = np.empty(len(powers))
+            for i, tick in enumerate(powers):
                 agent.set_power(tick)
                 agent.perform_one_step()
-                w_bal_hist.append(agent.get_w_p_balance())
-        # ... hydraulic agent
+                w_bal_hist[i] = agent.get_w_p_balance()
+            return w_bal_hist
+        # ... hydraulic agents
+        elif isinstance(agent, TwoCompHydAgent):
+            # segments of constant power are solved in closed form
+            h_hist = agent.perform_power_steps(powers)
+            return (1.0 - agent.psi - h_hist) / (1.0 - agent.psi) * agent.an
         elif isinstance(agent, ThreeCompHydAgent):
-            for tick in course_data:
-                agent.set_power(tick)
-                agent.perform_one_step()
-                w_bal_hist.append(agent.get_w_p_ratio())
+            h_hist, _ = agent.perform_power_steps(powers)
+            return 1.0 - h_hist
+        raise UserWarning("No procedure implemented for agent type {}".format(agent))
+
+    @staticmethod
+    def stream_course(agent, power_feed, batch_size: int = None, reset: bool = True):
+        """
+        Generator variant of simulate_course for power feeds of unknown or unbounded length, e.g., live
+        ergometer streams. Memory does not grow with the length of the feed. Integral agents are simulated in
+        their streaming mode, which approximates DCP online and therefore differs from simulate_course.
+        :param agent: agent to use for predictions
+        :param power_feed: any iterable of intensities in Watts
+        :param batch_size: if None, one remaining energy value is yielded per power sample. Otherwise, samples
+        are simulated in batches and an array of up to batch_size values is yielded per batch.
+        :param reset: whether the agent should be reset before the first sample
+        :return: remaining energy values after every step
+        """
+        if batch_size is not None and batch_size < 1:
+            raise UserWarning("Batch size has to be at least 1, got {}".format(batch_size))
+        if reset:
+            agent.reset()
+
+        if batch_size is None:
+            for power in power_feed:
+                yield float(SimulatorBasis._simulate_steps(agent, [power])[0])
+            return
+
+        batch = []
+        for power in power_feed:
+            batch.append(power)
+            if len(batch) == batch_size:
+                yield SimulatorBasis._simulate_steps(agent, batch)
+                batch = []
+        # the remaining samples of an ended feed
+        if len(batch) > 0:
+            yield SimulatorBasis._simulate_steps(agent, batch)
+
+    @staticmethod
+    async def astream_course(agent, power_feed, batch_size: int = None, reset: bool = True):
+        """
+        Asynchronous generator variant of stream_course
+        :param agent: agent to use for predictions
+        :param power_feed: async iterable or iterable of intensities in Watts
+        :param batch_size: if None, one remaining energy value is yielded per power sample. Otherwise, samples
+        are simulated in batches and an array of up to batch_size values is yielded per batch.
+        :param reset: whether the agent should be reset before the first sample
+        :return: remaining energy values after every step
+        """
+        if not hasattr(power_feed, "__aiter__"):
+            for values in SimulatorBasis.stream_course(agent, power_feed, batch_size=batch_size, reset=reset):
+                yield values
+            return
+
+        if batch_size is not None and batch_size < 1:
+            raise UserWarning("Batch size has to be at least 1, got {}".format(batch_size))
+        if reset:
+            agent.reset()
+
+        batch = []
+        async for power in power_feed:
+            batch.append(power)
+            if batch_size is None:
+                yield float(SimulatorBasis._simulate_steps(agent, batch)[0])
+                batch = []
+            elif len(batch) == batch_size:
+                yield SimulatorBasis._simulate_steps(agent, batch)
+                batch = []
+        # the remaining samples of an ended feed
+        if len(batch) > 0:
+            yield SimulatorBasis._simulate_steps(agent, batch)
+
+    @staticmethod
+    def run_length_encode(course_data):
+        """
+        Summarises a course into segments of constant power
+        :param course_data: list or array of intensities in Watts
+        :return: two arrays with the power of every segment and the number of steps of every segment
+        """
+        np_course = np.asarray(course_data, dtype=float)
+        if len(np_course) == 0:
+            return np_course, np.array([], dtype=int)
+        # a new segment starts wherever the power changes
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(np_course)) + 1))
+        counts = np.diff(np.concatenate((starts, [len(np_course)])))
+        return np_course[starts], counts
+
+    @staticmethod
+    def simulate_course_piecewise(agent: CpODEAgentBasisLinear, course_data,
+                                  stop_at_exhaustion: bool = False, reset: bool = True) -> int:
+        """
+        Simulates a course segment by segment. The course is run-length encoded and every segment of
+        constant power is jumped over analytically. The agent is left in the state at the end of the course
+        or at the point of exhaustion.
+        :param agent: differential agent to use for predictions
+        :param course_data: Expected as a list of intensities in Watts
+        :param stop_at_exhaustion: whether the simulation should stop as soon as the agent is exhausted
+        :param reset: whether the agent should be reset before the simulation
+        :return: number of simulated steps
+        """
+        if reset:
+            agent.reset()
 
-        return w_bal_hist
+        steps = 0
+        for power, count in zip(*SimulatorBasis.run_length_encode(course_data)):
+            done = agent.perform_constant_power_steps(power, int(count), stop_at_exhaustion=stop_at_exhaustion)
+            steps += done
+            if stop_at_exhaustion and done < count:
+                break
+        return steps
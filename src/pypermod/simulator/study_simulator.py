@@ -1,9 +1,23 @@
 import logging
+import math
+import os
+from concurrent.futures import Executor
+
 import numpy as np
 from pypermod import utility
+from pypermod.agents.hyd_agents.two_comp_hyd_agent import TwoCompHydAgent
+from pypermod.agents.wbal_agents.wbal_int_agent import WbalIntAgent
+from pypermod.agents.wbal_agents.wbal_ode_agent_linear import CpODEAgentBasisLinear
 from pypermod.simulator.simulator_basis import SimulatorBasis
 
 
+def _simulate_recovery_chunk(agent, p_work: float, p_rec: float, rec_times: list) -> list:
+    """
+    Recovery ratios of a chunk of recovery times. Module level function to be usable by worker processes.
+    """
+    return StudySimulator.get_recovery_ratios_wb1_wb2(agent, p_work=p_work, p_rec=p_rec, rec_times=rec_times)
+
+
 class StudySimulator(SimulatorBasis):
     """
     An extension of the standard simulator that adds convenience functions to recreate trials of studies
@@ -11,7 +25,8 @@ class StudySimulator(SimulatorBasis):
     """
 
     @staticmethod
-    def standard_comparison(agents, p_work: float, p_rec: float, rec_times: np.ndarray):
+    def standard_comparison(agents, p_work: float, p_rec: float, rec_times: np.ndarray,
+                            executor: Executor = None, chunksize: int = None):
         """
         This function employs the WB1 -> RB -> WB2 protocol proposed by Caen et al. to estimate recovery ratios.
         Recovery dynamics after a given intensity, at a given recovery intensity, and over a given time are estimated.
@@ -19,29 +34,155 @@ class StudySimulator(SimulatorBasis):
         :param p_work: intensity that leads to exhaustion
         :param p_rec: recovery intensity
         :param rec_times: recovery times to estimate
+        :param executor: optional executor, e.g., a ProcessPoolExecutor, to distribute simulations over workers.
+        Results are the same as without executor.
+        :param chunksize: maximal number of recovery times per task. See get_recovery_ratios_of_tasks for the default.
         :return: simulation results in a dictionary
         """
+        return StudySimulator.standard_comparisons(agents, conditions=[(p_work, p_rec)], rec_times=rec_times,
+                                                   executor=executor, chunksize=chunksize)[0]
+
+    @staticmethod
+    def standard_comparisons(agents, conditions: list, rec_times: np.ndarray,
+                             executor: Executor = None, chunksize: int = None) -> list:
+        """
+        standard_comparison for multiple conditions of a study. Simulations of all conditions are submitted
+        as one list of tasks, so that an executor runs them concurrently.
+        :param agents: list of agents to compare
+        :param conditions: list of (p_work, p_rec) tuples
+        :param rec_times: recovery times to estimate
+        :param executor: optional executor, e.g., a ProcessPoolExecutor, to distribute simulations over workers.
+        :param chunksize: maximal number of recovery times per task. See get_recovery_ratios_of_tasks for the default.
+        :return: list with the results dictionary of standard_comparison for every condition
+        """
+        # all simulations are run first. Results keep the order of tasks.
+        tasks = [(agent, p_work, p_rec, t_rec) for p_work, p_rec in conditions
+                 for agent in agents for t_rec in rec_times]
+        ratios = StudySimulator.get_recovery_ratios_of_tasks(tasks, executor=executor, chunksize=chunksize)
+
+        comparisons = []
+        for c, (p_work, p_rec) in enumerate(conditions):
+            # add agents dict to results
+            trial_results = {}
+
+            # estimate recovery ratios with Caen protocol
+            for i, agent in enumerate(agents):
+                # get recovery ratio for every time frame to be considered
+                start = (c * len(agents) + i) * len(rec_times)
+                agent_data = ratios[start:start + len(rec_times)]
+
+                # make use of insert function to not overwrite saved data
+                trial_results = utility.insert_with_key_enumeration(agent=agent,
+                                                                    agent_data=agent_data,
+                                                                    results=trial_results)
+                # update about progress
+                logging.info("{} simulation done".format(agent.get_name()))
+            comparisons.append(trial_results)
+
+        return comparisons
+
+    @staticmethod
+    def get_recovery_ratios_wb1_wb2(agent, p_work: float, p_rec: float, rec_times) -> list:
+        """
+        Recovery ratios for multiple recovery times according to the WB1 -> RB -> WB2 protocol in a single sweep.
+        WB1 is simulated once and a single recovery bout runs up to the longest recovery time. At every requested
+        recovery time the state is forked to run WB2. Agents that jump over constant power bouts analytically
+        fork every recovery bout from the end of WB1 instead. Results equal
+        SimulatorBasis.get_recovery_ratio_wb1_wb2 for every recovery time.
+        :param agent: agent to simulate
+        :param p_work: work bout intensity
+        :param p_rec: recovery bout intensity
+        :param rec_times: recovery times in any order
+        :return: list of ratios in percent in the order of rec_times
+        """
+        # integral agents estimate recovery with whole courses
+        if isinstance(agent, WbalIntAgent):
+            return [SimulatorBasis.get_recovery_ratio_wb1_wb2(agent, p_work=p_work, p_rec=p_rec, t_rec=t_rec)
+                    for t_rec in rec_times]
 
-        # add agents dict to results
-        trial_results = {}
+        cache = SimulatorBasis.cache
+        if cache is None:
+            return StudySimulator.__sweep_recovery_times(agent, p_work, p_rec, rec_times)
 
-        # estimate recovery ratios with Caen protocol
-        for agent in agents:
-            agent_data = []
+        # results share the cache with SimulatorBasis.get_recovery_ratio_wb1_wb2. Only missing ones are swept.
+        agent.reset()
+        keys = [SimulatorBasis._get_cache_key("get_recovery_ratio_wb1_wb2", agent,
+                                              args=(float(p_work), float(p_rec), float(t_rec)))
+                for t_rec in rec_times]
+        found = [cache.get(key) for key in keys]
+        missing = [t_rec for t_rec, ratio in zip(rec_times, found) if ratio is None]
+        swept = iter(StudySimulator.__sweep_recovery_times(agent, p_work, p_rec, missing) if missing else [])
 
-            # get recovery ratio for every time frame to be considered
-            for t_rec in rec_times:
-                ratio = SimulatorBasis.get_recovery_ratio_wb1_wb2(agent,
-                                                                  p_work=p_work,
-                                                                  p_rec=p_rec,
-                                                                  t_rec=t_rec)
-                agent_data.append(ratio)
+        ratios = []
+        for key, ratio in zip(keys, found):
+            if ratio is None:
+                ratio = next(swept)
+                cache.put(key, ratio)
+            ratios.append(float(ratio))
+        return ratios
+
+    @staticmethod
+    def __sweep_recovery_times(agent, p_work: float, p_rec: float, rec_times) -> list:
+        """
+        the single sweep of get_recovery_ratios_wb1_wb2 for differential and hydraulic agents
+        """
+        # WB1 Exhaust...
+        wb1_state = SimulatorBasis.get_wb1_state(agent, p_work=p_work)
+        wb1_t = agent.get_time()
+
+        # whether the recovery bout is advanced incrementally or solved from the end of WB1 for every recovery time
+        analytic = isinstance(agent, TwoCompHydAgent) or \
+                   (isinstance(agent, CpODEAgentBasisLinear) and agent._has_closed_form())
+
+        rec_steps = [int(t_rec * agent.hz) for t_rec in rec_times]
+        ratios = [0.0] * len(rec_steps)
+        done = 0
+        for i in np.argsort(rec_steps, kind="stable"):
+            # Recover... up to the next recovery time
+            if analytic:
+                agent.set_state(wb1_state)
+                SimulatorBasis._perform_constant_power_steps(agent, p_rec, rec_steps[i])
+            else:
+                SimulatorBasis._perform_constant_power_steps(agent, p_rec, rec_steps[i] - done)
+            done = rec_steps[i]
+
+            # WB2 Exhaust... from a fork of the recovery state
+            rec_state = agent.get_state()
+            ratios[i] = SimulatorBasis._get_wb2_ratio(agent, p_work, wb1_t)
+            agent.set_state(rec_state)
+        return ratios
+
+    @staticmethod
+    def get_recovery_ratios_of_tasks(tasks: list, executor: Executor = None, chunksize: int = None) -> list:
+        """
+        Recovery ratios according to the WB1 -> RB -> WB2 protocol for a list of independent tasks.
+        Consecutive tasks with the same agent and intensities are combined into chunks that are simulated
+        in a single sweep. If an executor is given, chunks are distributed over its workers. Agents are
+        sent to worker processes as pickled copies and the given agents are not changed in that case.
+        :param tasks: list of (agent, p_work, p_rec, t_rec) tuples
+        :param executor: optional executor, e.g., a ProcessPoolExecutor. Default runs all chunks serially.
+        :param chunksize: maximal number of tasks per chunk. Default is no limit without executor. With an executor,
+        tasks are split into at least as many chunks as there are CPUs, so that all workers receive chunks.
+        :return: list of ratios in percent in the order of tasks
+        """
+        if chunksize is not None and chunksize < 1:
+            raise UserWarning("chunksize has to be at least 1, got {}".format(chunksize))
+        if chunksize is None and executor is not None:
+            chunksize = max(1, math.ceil(len(tasks) / (os.cpu_count() or 1)))
 
-            # make use of insert function to not overwrite saved data
-            trial_results = utility.insert_with_key_enumeration(agent=agent,
-                                                                agent_data=agent_data,
-                                                                results=trial_results)
-            # update about progress
-            logging.info("{} simulation done".format(agent.get_name()))
+        chunks = []
+        for agent, p_work, p_rec, t_rec in tasks:
+            if len(chunks) > 0:
+                c_agent, c_p_work, c_p_rec, c_rec_times = chunks[-1]
+                if c_agent is agent and c_p_work == p_work and c_p_rec == p_rec and \
+                        (chunksize is None or len(c_rec_times) < chunksize):
+                    c_rec_times.append(t_rec)
+                    continue
+            chunks.append((agent, p_work, p_rec, [t_rec]))
 
-        return trial_results
+        if executor is None:
+            results = [_simulate_recovery_chunk(*chunk) for chunk in chunks]
+        else:
+            # map returns results in the order of chunks, no matter which worker finished first
+            results = executor.map(_simulate_recovery_chunk, *zip(*chunks)) if len(chunks) > 0 else []
+        return [ratio for chunk_ratios in results for ratio in chunk_ratios]
@@ -0,0 +1,190 @@
+from scipy.integrate import solve_ivp
+
+from pypermod.agents.hyd_agents.three_comp_hyd_agent import ThreeCompHydAgent
+
+
+class ThreeCompHydODESolver:
+    """
+    Integrates the ODEs of the three component hydraulic model with an adaptive step size instead of the fixed
+    Euler steps of ThreeCompHydAgent. Changes of flow regimes are detected as events and integration is restarted
+    at each of them, so that the solver never steps across a kink of the flows. Detected events are:
+    * LF crossing the pipe exit of U (h = 1 - phi)
+    * LF meeting the level of LS (h = g + theta)
+    * LF crossing the pipe exit of LS (h = 1 - gamma)
+    * LS running full (g = 0) or empty (g = height of LS)
+    * exhaustion (h = 1)
+    Results converge to those of a ThreeCompHydAgent with a very high hz.
+    """
+
+    # event values below this tolerance at the start of an integration are considered already handled
+    event_tolerance = 1e-9
+
+    def __init__(self, agent: ThreeCompHydAgent, method: str = "LSODA", rtol: float = 1e-8, atol: float = 1e-10):
+        """
+        :param agent: hydraulic agent whose configuration is integrated
+        :param method: integration method of scipy.integrate.solve_ivp
+        :param rtol: relative tolerance of the integration
+        :param atol: absolute tolerance of the integration
+        """
+        self._agent = agent
+        self._method = method
+        self._rtol = rtol
+        self._atol = atol
+
+        # the number of right hand side evaluations since creation
+        self.n_evaluations = 0
+        # a log of detected events as (time, event name) tuples of the last integration
+        self.event_log = []
+
+        a = agent
+        self.__events = [
+            self.__event("lf_u_exit", lambda t, y: y[0] - (1 - a.phi), 0),
+            self.__event("lf_meets_ls", lambda t, y: y[0] - (y[1] + a.theta), 0),
+            self.__event("lf_ls_exit", lambda t, y: y[0] - (1 - a.gamma), 0),
+            self.__event("ls_full", lambda t, y: y[1], -1),
+            self.__event("ls_empty", lambda t, y: y[1] - a.height_ls, 1),
+            self.__event("exhaustion", lambda t, y: y[0] - 1.0, 1)
+        ]
+
+    @staticmethod
+    def __event(name: str, func, direction: int):
+        """
+        turns given function into a terminal event for solve_ivp
+        """
+        func.name = name
+        func.terminal = True
+        func.direction = direction
+        return func
+
+    def __get_flows(self, p: float, h: float, g: float):
+        """
+        continuous flows of the three component hydraulic model
+        :return: change of h and g per second
+        """
+        a = self._agent
+        # flow from U scales with LF level above the pipe exit
+        if h < 1 - a.phi:
+            p_u = a.m_u * h / (1 - a.phi)
+        else:
+            p_u = a.m_u
+
+        # flow between LS and LF
+        if h < g + a.theta:
+            # [restore] only if LS is not full
+            p_l = -a.m_lf * (g + a.theta - h) / (1 - a.gamma) if g > 0 else 0.0
+        elif h < 1 - a.gamma:
+            # [utilise]
+            p_l = a.m_ls * (h - g - a.theta) / a.height_ls
+        else:
+            # [utilise max] pressure depends on remaining liquid in LS
+            p_l = a.m_ls * (a.height_ls - g) / a.height_ls
+
+        dh = (p - p_u - p_l) / a.lf
+        if h >= 1.0 and dh > 0:
+            # LF is empty and cannot be depleted further
+            dh = 0.0
+        return dh, p_l / a.ls
+
+    def integrate(self, p: float, h: float, g: float, duration: float, stop_at_exhaustion: bool = True):
+        """
+        Integrates the model at constant power from given fill-levels.
+        :param p: constant power demand in Watts
+        :param h: state of depletion of vessel LF at start
+        :param g: state of depletion of vessel LS at start
+        :param duration: time in seconds to integrate
+        :param stop_at_exhaustion: whether integration should stop when LF is empty
+        :return: h, g, and the integrated time in seconds
+        """
+        a = self._agent
+        t = 0.0
+        self.event_log = []
+        while t < duration:
+            # an LF within the event tolerance of its bottom is empty
+            if h >= 1.0 - self.event_tolerance:
+                h = 1.0
+                if stop_at_exhaustion:
+                    break
+
+            # events that fired at the current state are not checked again right away. Exhaustion is always
+            # checked while LF is not empty, because other events can fire right at its boundary (e.g. gamma = 0)
+            events = [e for e in self.__events
+                      if abs(e(t, [h, g])) > self.event_tolerance or (e.name == "exhaustion" and h < 1.0)]
+
+            sol = solve_ivp(lambda _, y: self.__get_flows(p, y[0], y[1]), (t, duration), [h, g],
+                            method=self._method, events=events, rtol=self._rtol, atol=self._atol)
+            self.n_evaluations += sol.nfev
+            if sol.status == -1:
+                raise UserWarning("Integration failed: {}".format(sol.message))
+
+            t = float(sol.t[-1])
+            h, g = float(sol.y[0, -1]), float(sol.y[1, -1])
+
+            # snap onto the boundary of the detected event
+            for event, t_events in zip(events, sol.t_events):
+                if len(t_events) > 0:
+                    self.event_log.append((t, event.name))
+                    if event.name == "exhaustion":
+                        h = 1.0
+                    elif event.name == "ls_full":
+                        g = 0.0
+                    elif event.name == "ls_empty":
+                        g = a.height_ls
+
+            # tanks cannot be fuller than full or emptier than empty
+            g = min(max(g, 0.0), a.height_ls)
+            h = min(max(h, 0.0), 1.0)
+
+        return h, g, t
+
+    def perform_one_step(self) -> float:
+        """
+        Advances the agent by one of its time steps (1/hz) with the adaptive integrator. Can be passed to
+        ThreeCompHydSimulator functions as step_function. Flows of the agent are not updated.
+        :return: power output
+        """
+        a = self._agent
+        h, g, _ = self.integrate(a.get_power(), a.get_h(), a.get_g(), 1.0 / a.hz, stop_at_exhaustion=False)
+        a.set_h(h)
+        a.set_g(g)
+        a.advance_time()
+        return a.get_power()
+
+    def tte(self, p_work: float, start_h: float = 0, start_g: float = 0, t_max: float = 5000) -> float:
+        """
+        time to exhaustion with the exact time at which LF is empty
+        :param p_work: constant expenditure intensity for TTE
+        :param start_h: fill level of LF at start
+        :param start_g: fill level of LS at start
+        :param t_max: maximal time in seconds until warning "exhaustion not reached" is raised
+        :return: time to exhaustion in seconds
+        """
+        h, _, t = self.integrate(p_work, start_h, start_g, t_max)
+        if h < 1.0:
+            raise UserWarning("exhaustion not reached!")
+        return t
+
+    def get_recovery_ratio_wb1_wb2(self, p_work: float, p_rec: float, t_rec: float,
+                                   start_h: float = 0, start_g: float = 0, t_max: float = 5000) -> float:
+        """
+        Recovery ratio according to WB1 -> RB -> WB2 protocol with exact times of exhaustion
+        :param p_work: work bout intensity
+        :param p_rec: recovery bout intensity
+        :param t_rec: recovery bout duration
+        :param start_h: fill level of LF at start
+        :param start_g: fill level of LS at start
+        :param t_max: maximal time in seconds until warning "exhaustion not reached" is raised
+        :return: ratio in percent
+        """
+        # WB1 Exhaust...
+        h, g, wb1_t = self.integrate(p_work, start_h, start_g, t_max)
+        if h < 1.0:
+            raise UserWarning("exhaustion not reached!")
+
+        # Recover...
+        h, g, _ = self.integrate(p_rec, h, g, t_rec, stop_at_exhaustion=False)
+
+        # WB2 Exhaust...
+        _, _, wb2_t = self.integrate(p_work, h, g, t_max)
+
+        # return ratio of times as recovery ratio
+        return (wb2_t / wb1_t) * 100.0
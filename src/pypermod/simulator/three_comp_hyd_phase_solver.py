@@ -0,0 +1,381 @@
+import math
+
+import numpy as np
+from scipy.linalg import expm
+from scipy.optimize import brentq
+
+from pypermod.agents.hyd_agents.three_comp_hyd_agent import ThreeCompHydAgent
+
+
+class _PhaseTrajectory:
+    """
+    Closed-form solution of the linear system dy/dt = A y + b with y = (h, g). In the eigenbasis of A every
+    coordinate is a constant plus either an exponential or, for eigenvalues of zero, a linear term.
+    Falls back to the matrix exponential of the augmented system if A can't be diagonalised.
+    """
+
+    def __init__(self, a: np.ndarray, b: np.ndarray, y0: np.ndarray):
+        self._m = np.zeros((3, 3))
+        self._m[:2, :2] = a
+        self._m[:2, 2] = b
+        self._z0 = np.append(y0, 1.0)
+
+        w, v = np.linalg.eig(a)
+        if np.all(np.isreal(w)) and np.linalg.cond(v) < 1e8:
+            self._v = v.real
+            x0 = np.linalg.solve(self._v, y0)
+            bx = np.linalg.solve(self._v, b)
+            self._rates = w.real
+            zero = np.abs(self._rates) <= 1e-12 * max(np.abs(a).max(), 1e-300)
+            safe = np.where(zero, 1.0, self._rates)
+            # per coordinate: const + lin * t + coef * e^(rate * t)
+            self._const = np.where(zero, x0, -bx / safe)
+            self._lin = np.where(zero, bx, 0.0)
+            self._coef = np.where(zero, 0.0, x0 + bx / safe)
+            self._rates = np.where(zero, 0.0, self._rates)
+        else:
+            self._v = None
+
+    def at(self, t: float) -> np.ndarray:
+        """:return: z = (h, g, 1) after t seconds"""
+        if self._v is not None:
+            x = self._const + self._lin * t + self._coef * np.exp(self._rates * t)
+            return np.append(self._v @ x, 1.0)
+        return expm(self._m * t) @ self._z0
+
+    def get_function(self, c: np.ndarray):
+        """
+        :return: functions of time for the linear function c of z and its derivative, and the time of its
+        extremum if it is known in closed form (None otherwise)
+        """
+        if self._v is None:
+            cm = c @ self._m
+            return (lambda t: float(c @ self.at(t))), (lambda t: float(cm @ self.at(t))), None
+
+        cv = c[:2] @ self._v
+        alpha = float(c[2] + cv @ self._const)
+        beta = float(cv @ self._lin)
+        terms = [(float(a), float(w)) for a, w in zip(cv * self._coef, self._rates) if a != 0 and w != 0]
+
+        def f(t):
+            return alpha + beta * t + sum([a * math.exp(w * t) for a, w in terms])
+
+        def df(t):
+            return beta + sum([a * w * math.exp(w * t) for a, w in terms])
+
+        # the derivative has at most one root
+        extremum = math.inf
+        if beta == 0 and len(terms) == 2 and terms[0][1] != terms[1][1]:
+            ratio = -(terms[1][0] * terms[1][1]) / (terms[0][0] * terms[0][1])
+            if ratio > 0:
+                extremum = math.log(ratio) / (terms[0][1] - terms[1][1])
+        elif beta != 0 and len(terms) == 1:
+            ratio = -beta / (terms[0][0] * terms[0][1])
+            if ratio > 0:
+                extremum = math.log(ratio) / terms[0][1]
+        elif beta != 0 and len(terms) > 1:
+            extremum = None
+        return f, df, extremum
+
+
+class ThreeCompHydPhaseSolver:
+    """
+    Solves the ODEs of the three component hydraulic model at constant power phase by phase. Within a phase the
+    flow from U is either scaled by the level of LF or at its maximum, and the flow between LS and LF is one of
+    [LS full], [restore], [utilise], or [utilise max] as enumerated by ThreeCompHydAgent. Every combination is a
+    linear system with a closed-form solution. The solver jumps from phase boundary to phase boundary and only
+    needs root finding on sums of exponentials to locate the boundaries. Results converge to those of a
+    ThreeCompHydAgent with a very high hz.
+    """
+
+    # event values below this tolerance are considered to be on the boundary
+    boundary_tolerance = 1e-12
+
+    def __init__(self, agent: ThreeCompHydAgent):
+        """
+        :param agent: hydraulic agent whose configuration is solved
+        """
+        a = agent
+        self._agent = agent
+        # flow coefficients
+        self._c_u = a.m_u / (1 - a.phi)
+        self._k_r = a.m_lf / (1 - a.gamma)
+        self._k_u = a.m_ls / a.height_ls
+
+        # the number of solved phases since creation
+        self.n_phases = 0
+
+    def __get_flows(self, p: float, regime: tuple):
+        """
+        linear coefficients of flows of given regime with respect to z = (h, g, 1)
+        :return: coefficients of p_u, p_l, dh/dt and dg/dt
+        """
+        a = self._agent
+        u, l, lf_empty = regime
+        p_u = np.array([self._c_u, 0.0, 0.0]) if u == "u_scaled" else np.array([0.0, 0.0, a.m_u])
+        if l == "ls_full":
+            p_l = np.zeros(3)
+        elif l == "restore":
+            p_l = np.array([self._k_r, -self._k_r, -self._k_r * a.theta])
+        elif l == "utilise":
+            p_l = np.array([self._k_u, -self._k_u, -self._k_u * a.theta])
+        else:
+            p_l = np.array([0.0, -self._k_u, self._k_u * a.height_ls])
+
+        dh = (np.array([0.0, 0.0, p]) - p_u - p_l) / a.lf
+        dg = p_l / a.ls
+        if lf_empty:
+            dh = np.zeros(3)
+        return p_u, p_l, dh, dg
+
+    def __get_events(self, p: float, regime: tuple, stop_at_exhaustion: bool) -> list:
+        """
+        boundaries of the regime as (name, coefficients c of z, sign of c.z outside the regime, next regime)
+        """
+        a = self._agent
+        u, l, lf_empty = regime
+        events = []
+        if u == "u_scaled":
+            events.append(("lf_u_exit", np.array([1.0, 0.0, -(1 - a.phi)]), 1, ("u_max", l, lf_empty)))
+        else:
+            events.append(("lf_u_exit", np.array([1.0, 0.0, -(1 - a.phi)]), -1, ("u_scaled", l, lf_empty)))
+
+        lf_meets_ls = np.array([1.0, -1.0, -a.theta])
+        lf_ls_exit = np.array([1.0, 0.0, -(1 - a.gamma)])
+        if l == "ls_full":
+            events.append(("lf_meets_ls", np.array([1.0, 0.0, -a.theta]), 1, (u, "utilise", lf_empty)))
+        elif l == "restore":
+            events.append(("lf_meets_ls", lf_meets_ls, 1, (u, "utilise", lf_empty)))
+            events.append(("ls_full", np.array([0.0, 1.0, 0.0]), -1, (u, "ls_full", lf_empty)))
+        elif l == "utilise":
+            events.append(("lf_meets_ls", lf_meets_ls, -1, (u, "restore", lf_empty)))
+            events.append(("lf_ls_exit", lf_ls_exit, 1, (u, "utilise_max", lf_empty)))
+        else:
+            events.append(("lf_ls_exit", lf_ls_exit, -1, (u, "utilise", lf_empty)))
+
+        if stop_at_exhaustion:
+            events.append(("exhaustion", np.array([1.0, 0.0, -1.0]), 1, None))
+        elif lf_empty:
+            # LF stays empty as long as the power demand exceeds the inflows
+            dh = self.__get_flows(p, (u, l, False))[2]
+            events.append(("lf_refills", dh, -1, (u, l, False)))
+        else:
+            events.append(("lf_empty", np.array([1.0, 0.0, -1.0]), 1, (u, l, True)))
+        return events
+
+    def __classify(self, p: float, h: float, g: float, stop_at_exhaustion: bool) -> tuple:
+        """
+        Determines the regime of given fill-levels. States on a boundary are assigned to the regime they move into.
+        """
+        a = self._agent
+        u = "u_scaled" if h < 1 - a.phi else "u_max"
+        if g <= 0 and h <= a.theta:
+            l = "ls_full"
+        elif h < g + a.theta:
+            l = "restore"
+        elif h < 1 - a.gamma:
+            l = "utilise"
+        else:
+            l = "utilise_max"
+        regime = (u, l, False)
+        if not stop_at_exhaustion and h >= 1.0 and self.__get_flows(p, regime)[2] @ [h, g, 1.0] > 0:
+            regime = (u, l, True)
+
+        # the flows are continuous across boundaries. Their direction tells which side the state moves to.
+        z = np.array([h, g, 1.0])
+        for _ in range(6):
+            _, _, dh, dg = self.__get_flows(p, regime)
+            m = np.vstack([dh, dg, np.zeros(3)])
+            switched = False
+            for name, c, outside, next_regime in self.__get_events(p, regime, stop_at_exhaustion):
+                if next_regime is None:
+                    continue
+                if abs(c @ z) < self.boundary_tolerance and outside * (c @ (m @ z)) > 0:
+                    regime = next_regime
+                    switched = True
+                    break
+            if not switched:
+                break
+        return regime
+
+    @staticmethod
+    def __first_crossing(trajectory: _PhaseTrajectory, c: np.ndarray, outside: int, t_end: float):
+        """
+        Finds the first time c.z reaches the outside of the regime. c.z is a sum of up to two exponentials and a
+        constant, so that it has at most one extremum. The interval is split there into monotonic pieces.
+        :return: time of the crossing or None
+        """
+
+        value, slope, extremum = trajectory.get_function(c)
+
+        def f(t):
+            return outside * value(t)
+
+        bounds = [0.0]
+        if extremum is None:
+            # locate the extremum numerically
+            if slope(0.0) * slope(t_end) < 0:
+                bounds.append(brentq(slope, 0.0, t_end, xtol=1e-14))
+        elif 0.0 < extremum < t_end:
+            bounds.append(extremum)
+        bounds.append(t_end)
+
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            f_start, f_end = f(start), f(end)
+            if f_start < 0 <= f_end:
+                return brentq(f, start, end, xtol=1e-12)
+        return None
+
+    def __get_phase(self, p: float, h: float, g: float, stop_at_exhaustion: bool):
+        """
+        :return: regime, its trajectory from (h, g), and its events
+        """
+        regime = self.__classify(p, h, g, stop_at_exhaustion)
+        _, _, dh, dg = self.__get_flows(p, regime)
+        trajectory = _PhaseTrajectory(np.array([dh[:2], dg[:2]]), np.array([dh[2], dg[2]]), np.array([h, g]))
+        return regime, trajectory, self.__get_events(p, regime, stop_at_exhaustion)
+
+    def integrate(self, p: float, h: float, g: float, duration: float, stop_at_exhaustion: bool = True):
+        """
+        Solves the model at constant power from given fill-levels.
+        :param p: constant power demand in Watts
+        :param h: state of depletion of vessel LF at start
+        :param g: state of depletion of vessel LS at start
+        :param duration: time in seconds to solve for
+        :param stop_at_exhaustion: whether to stop when LF is empty
+        :return: h, g, and the solved time in seconds
+        """
+        if p < 0:
+            raise UserWarning("The phase solver requires non-negative power demands")
+        a = self._agent
+        t = 0.0
+        while t < duration:
+            if stop_at_exhaustion and h >= 1.0:
+                break
+            _, trajectory, events = self.__get_phase(p, h, g, stop_at_exhaustion)
+            self.n_phases += 1
+
+            # the first boundary that is reached ends the phase
+            t_hit, hit = duration - t, None
+            for event in events:
+                crossing = self.__first_crossing(trajectory, event[1], event[2], duration - t)
+                if crossing is not None and crossing < t_hit:
+                    t_hit, hit = crossing, event
+
+            h, g, _ = trajectory.at(t_hit)
+            t = duration if hit is None else t + t_hit
+
+            # snap onto the boundary of the event
+            if hit is not None:
+                name, c = hit[0], hit[1]
+                if name in ["lf_u_exit", "lf_ls_exit", "exhaustion", "lf_empty"]:
+                    h = -c[2]
+                elif name == "ls_full":
+                    g = 0.0
+                elif name == "lf_meets_ls" and c[1] == 0:
+                    h = a.theta
+
+            # tanks cannot be fuller than full or emptier than empty
+            g = min(max(g, 0.0), a.height_ls)
+            h = min(max(h, 0.0), 1.0)
+        return h, g, t
+
+    def time_to_equilibrium(self, p: float, h: float, g: float, t_max: float, tolerance: float = 0.1) -> float:
+        """
+        First time at which the flow from U meets the power demand and LS neither contributes nor drains.
+        The check equals ThreeCompHydAgent.is_equilibrium with flows in Watts.
+        :param p: constant power demand in Watts
+        :param h: state of depletion of vessel LF at start
+        :param g: state of depletion of vessel LS at start
+        :param t_max: maximal time in seconds to look for the equilibrium
+        :param tolerance: tolerance in Watts
+        :return: time in seconds or t_max if equilibrium is not reached
+        """
+        a = self._agent
+        t = 0.0
+        while t < t_max:
+            regime, trajectory, events = self.__get_phase(p, h, g, stop_at_exhaustion=False)
+            self.n_phases += 1
+            p_u, p_l, _, _ = self.__get_flows(p, regime)
+            d_u = p_u - np.array([0.0, 0.0, p])
+
+            # end of the phase
+            t_end = t_max - t
+            for event in events:
+                crossing = self.__first_crossing(trajectory, event[1], event[2], t_end)
+                if crossing is not None and crossing < t_end:
+                    t_end = crossing
+
+            # candidate times are the start and all crossings of the tolerance bands within the phase
+            candidates = [0.0]
+            for c in [d_u, p_l]:
+                for band in [tolerance, -tolerance]:
+                    shifted = c - np.array([0.0, 0.0, band])
+                    for outside in [1, -1]:
+                        crossing = self.__first_crossing(trajectory, shifted, outside, t_end)
+                        if crossing is not None:
+                            candidates.append(crossing)
+            for candidate in sorted(candidates):
+                z = trajectory.at(candidate)
+                if abs(d_u @ z) <= tolerance * (1 + 1e-9) and abs(p_l @ z) <= tolerance * (1 + 1e-9):
+                    return t + candidate
+
+            h, g, _ = trajectory.at(t_end)
+            g = min(max(g, 0.0), a.height_ls)
+            h = min(max(h, 0.0), 1.0)
+            t += t_end
+        return t_max
+
+    def tte(self, p_work: float, start_h: float = 0, start_g: float = 0, t_max: float = 5000) -> float:
+        """
+        time to exhaustion with the exact time at which LF is empty
+        :param p_work: constant expenditure intensity for TTE
+        :param start_h: fill level of LF at start
+        :param start_g: fill level of LS at start
+        :param t_max: maximal time in seconds until warning "exhaustion not reached" is raised
+        :return: time to exhaustion in seconds
+        """
+        h, _, t = self.integrate(p_work, start_h, start_g, t_max)
+        if h < 1.0:
+            raise UserWarning("exhaustion not reached!")
+        return t
+
+    def tte_with_recovery(self, p_work: float, p_rec: float, t_max_work: float = 10000,
+                          t_max_rec: float = 20000):
+        """
+        The time until exhaustion at given power and the time until recovery to an equilibrium afterwards
+        :param p_work: expenditure intensity
+        :param p_rec: recovery intensity
+        :param t_max_work: maximal time in seconds for the expenditure
+        :param t_max_rec: maximal time in seconds for the recovery
+        :return: tte, ttr
+        """
+        h, g, tte = self.integrate(p_work, 0.0, 0.0, t_max_work)
+        ttr = self.time_to_equilibrium(p_rec, h, g, t_max_rec)
+        return tte, ttr
+
+    def get_recovery_ratio_wb1_wb2(self, p_work: float, p_rec: float, t_rec: float,
+                                   start_h: float = 0, start_g: float = 0, t_max: float = 5000) -> float:
+        """
+        Recovery ratio according to WB1 -> RB -> WB2 protocol with exact times of exhaustion
+        :param p_work: work bout intensity
+        :param p_rec: recovery bout intensity
+        :param t_rec: recovery bout duration
+        :param start_h: fill level of LF at start
+        :param start_g: fill level of LS at start
+        :param t_max: maximal time in seconds until warning "exhaustion not reached" is raised
+        :return: ratio in percent
+        """
+        # WB1 Exhaust...
+        h, g, wb1_t = self.integrate(p_work, start_h, start_g, t_max)
+        if h < 1.0:
+            raise UserWarning("exhaustion not reached!")
+
+        # Recover...
+        h, g, _ = self.integrate(p_rec, h, g, t_rec, stop_at_exhaustion=False)
+
+        # WB2 Exhaust...
+        _, _, wb2_t = self.integrate(p_work, h, g, t_max)
+
+        # return ratio of times as recovery ratio
+        return (wb2_t / wb1_t) * 100.0
@@ -0,0 +1,91 @@
+import numpy as np
+
+from pypermod.agents.hyd_agents.three_comp_hyd_agent_population import ThreeCompHydAgentPopulation
+
+
+class ThreeCompHydPopulationSimulator:
+    """
+    Counterpart of ThreeCompHydSimulator for populations of three component hydraulic configurations.
+    All configurations are simulated at once and results are returned as arrays with one entry per configuration.
+    Configurations that don't reach exhaustion or that fail in an unhandled state get NaN instead of raising a warning.
+    """
+
+    @staticmethod
+    def __exhaust(population: ThreeCompHydAgentPopulation, p_work, step_limit: float, mask: np.ndarray):
+        """
+        steps masked configurations at p_work until they are exhausted or the step limit is reached
+        """
+        population.set_power(p_work)
+        steps = 0
+        active = mask & ~population.is_exhausted() & ~population.is_failed()
+        while np.any(active) and steps < step_limit:
+            population.perform_one_step(mask=active)
+            steps += 1
+            active = active & ~population.is_exhausted() & ~population.is_failed()
+
+    @staticmethod
+    def tte(population: ThreeCompHydAgentPopulation, p_work, start_h: float = 0,
+            start_g: float = 0, t_max: float = 5000) -> np.ndarray:
+        """
+        simulates a standard time to exhaustion test with every configuration
+        :param population: population of hydraulic configurations
+        :param p_work: constant expenditure intensity for TTE. One for all or one per configuration.
+        :param start_h: fill level of LF at start
+        :param start_g: fill level of LS at start
+        :param t_max: maximal time in seconds until exhaustion is considered not reached
+        :return: times to exhaustion in seconds. NaN where exhaustion was not reached.
+        """
+        population.reset()
+        population.set_h(start_h)
+        population.set_g(start_g)
+
+        step_limit = t_max * population.hz
+
+        # Exhaust...
+        ThreeCompHydPopulationSimulator.__exhaust(population, p_work, step_limit, np.ones(len(population), dtype=bool))
+        tte = population.get_time()
+
+        reached = population.is_exhausted() & ~population.is_failed()
+        return np.where(reached, tte, np.nan)
+
+    @staticmethod
+    def get_recovery_ratio_wb1_wb2(population: ThreeCompHydAgentPopulation, p_work, p_rec,
+                                   t_rec: float, start_h: float = 0, start_g: float = 0,
+                                   t_max: float = 5000) -> np.ndarray:
+        """
+        Returns recovery ratios of all configurations according to WB1 -> RB -> WB2 protocol.
+        :param population: population of hydraulic configurations
+        :param p_work: work bout intensity. One for all or one per configuration.
+        :param p_rec: recovery bout intensity. One for all or one per configuration.
+        :param t_rec: recovery bout duration
+        :param start_h: fill level of LF at start
+        :param start_g: fill level of LS at start
+        :param t_max: maximal time in seconds until exhaustion is considered not reached
+        :return: ratios in percent. NaN where WB1 didn't reach exhaustion.
+        """
+        hz = population.hz
+        population.reset()
+        population.set_h(start_h)
+        population.set_g(start_g)
+
+        step_limit = t_max * hz
+
+        # WB1 Exhaust...
+        ThreeCompHydPopulationSimulator.__exhaust(population, p_work, step_limit, np.ones(len(population), dtype=bool))
+        wb1_t = population.get_time()
+        valid = population.is_exhausted() & ~population.is_failed()
+
+        # Recover...
+        population.set_power(p_rec)
+        for _ in range(0, int(round(t_rec * hz))):
+            population.perform_one_step(mask=valid)
+        rec_t = population.get_time()
+
+        # WB2 Exhaust...
+        ThreeCompHydPopulationSimulator.__exhaust(population, p_work, step_limit, valid)
+        wb2_t = population.get_time()
+
+        # return ratio of times as recovery ratio
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = ((wb2_t - rec_t) / wb1_t) * 100.0
+        return np.where(valid & ~population.is_failed(), ratio, np.nan)
@@ -1,7 +1,12 @@
 import logging
+import math
+
 import numpy as np
 
 from pypermod.agents.hyd_agents.three_comp_hyd_agent import ThreeCompHydAgent
+from pypermod.simulator.three_comp_hyd_ode_solver import ThreeCompHydODESolver
+from pypermod.simulator.three_comp_hyd_phase_solver import ThreeCompHydPhaseSolver
+from pypermod.simulator.recorder import SimulationRecorder
 import matplotlib.pyplot as plt
 
 
@@ -11,9 +16,28 @@ class ThreeCompHydSimulator:
     TTE tests, and recovery estimation protocols
     """
 
+    # state variables that detailed simulations can record
+    channels = ("h", "g", "lf", "ls", "p_u", "p_l", "m_flow", "w_p_bal")
+    # number of steps that are simulated at once before they are passed on to a recorder
+    recorder_block_size = 36000
+
+    @staticmethod
+    def __get_solver(agent: ThreeCompHydAgent, solver: str):
+        """
+        :return: None for fixed steps of the agent or the requested solver instance. Raises a warning for unknown
+        solvers.
+        """
+        if solver == "euler":
+            return None
+        elif solver == "adaptive":
+            return ThreeCompHydODESolver(agent)
+        elif solver == "analytic":
+            return ThreeCompHydPhaseSolver(agent)
+        raise UserWarning("Unknown solver {}. Use 'euler', 'adaptive', or 'analytic'".format(solver))
+
     @staticmethod
     def tte(agent: ThreeCompHydAgent, p_work: float, start_h: float = 0,
-            start_g: float = 0, t_max: float = 5000, step_function=None) -> float:
+            start_g: float = 0, t_max: float = 5000, step_function=None, solver: str = "euler") -> float:
         """
         simulates a standard time to exhaustion test
         :param agent: hydraulic agent
@@ -22,8 +46,14 @@ class ThreeCompHydSimulator:
         :param start_g: fill level of LS at start
         :param t_max: maximal time in seconds until warning "exhaustion not reached" is raised
         :param step_function: function of agent to estimate one time step. Default is perform_one_step.
+        :param solver: "euler" for fixed steps of the agent, "adaptive" for ThreeCompHydODESolver,
+        or "analytic" for ThreeCompHydPhaseSolver
         :return: time to exhaustion in seconds
         """
+        solver = ThreeCompHydSimulator.__get_solver(agent, solver)
+        if solver is not None:
+            return solver.tte(p_work, start_h=start_h, start_g=start_g, t_max=t_max)
+
         agent.reset()
         agent.set_h(start_h)
         agent.set_g(start_g)
@@ -47,29 +77,25 @@ class ThreeCompHydSimulator:
         return tte
 
     @staticmethod
-    def get_recovery_ratio_wb1_wb2(agent: ThreeCompHydAgent, p_work: float, p_rec: float,
-                                   t_rec: float, start_h: float = 0, start_g: float = 0,
-                                   t_max: float = 5000, step_function=None) -> float:
+    def get_wb1_state(agent: ThreeCompHydAgent, p_work: float, start_h: float = 0, start_g: float = 0,
+                      t_max: float = 5000, step_function=None) -> dict:
         """
-        Returns recovery ratio of given agent according to WB1 -> RB -> WB2 protocol.
-        Recovery ratio estimations for given exp, rec intensity and time
-        :param agent: three component hydraulic agent to use
+        Simulates the WB1 exhaustion bout of the WB1 -> RB -> WB2 protocol with fixed steps. The returned snapshot
+        can be passed to get_recovery_ratio_wb1_wb2 to estimate multiple recovery ratios without simulating
+        WB1 again.
+        :param agent: hydraulic agent. It is left in the exhausted state.
         :param p_work: work bout intensity
-        :param p_rec: recovery bout intensity
-        :param t_rec: recovery bout duration
         :param start_h: fill level of LF at start
         :param start_g: fill level of LS at start
         :param t_max: maximal time in seconds until warning "exhaustion not reached" is raised
         :param step_function: function of agent to estimate one time step. Default is perform_one_step.
-        :return: ratio in percent
+        :return: snapshot of the exhausted agent from agent.get_state()
         """
-
-        hz = agent.hz
         agent.reset()
         agent.set_h(start_h)
         agent.set_g(start_g)
 
-        step_limit = t_max * hz
+        step_limit = t_max * agent.hz
 
         if step_function is None:
             step_function = agent.perform_one_step
@@ -80,10 +106,51 @@ class ThreeCompHydSimulator:
         while not agent.is_exhausted() and steps < step_limit:
             step_function()
             steps += 1
-        wb1_t = agent.get_time()
 
         if not agent.is_exhausted():
             raise UserWarning("exhaustion not reached!")
+        return agent.get_state()
+
+    @staticmethod
+    def get_recovery_ratio_wb1_wb2(agent: ThreeCompHydAgent, p_work: float, p_rec: float,
+                                   t_rec: float, start_h: float = 0, start_g: float = 0,
+                                   t_max: float = 5000, step_function=None, solver: str = "euler",
+                                   wb1_state: dict = None) -> float:
+        """
+        Returns recovery ratio of given agent according to WB1 -> RB -> WB2 protocol.
+        Recovery ratio estimations for given exp, rec intensity and time
+        :param agent: three component hydraulic agent to use
+        :param p_work: work bout intensity
+        :param p_rec: recovery bout intensity
+        :param t_rec: recovery bout duration
+        :param start_h: fill level of LF at start
+        :param start_g: fill level of LS at start
+        :param t_max: maximal time in seconds until warning "exhaustion not reached" is raised
+        :param step_function: function of agent to estimate one time step. Default is perform_one_step.
+        :param solver: "euler" for fixed steps of the agent, "adaptive" for ThreeCompHydODESolver,
+        or "analytic" for ThreeCompHydPhaseSolver
+        :param wb1_state: optional snapshot of get_wb1_state with the same agent, p_work, and start levels.
+        The euler solver continues from it instead of simulating WB1 again.
+        :return: ratio in percent
+        """
+        solver = ThreeCompHydSimulator.__get_solver(agent, solver)
+        if solver is not None:
+            return solver.get_recovery_ratio_wb1_wb2(p_work=p_work, p_rec=p_rec, t_rec=t_rec,
+                                                     start_h=start_h, start_g=start_g, t_max=t_max)
+
+        hz = agent.hz
+        step_limit = t_max * hz
+
+        if step_function is None:
+            step_function = agent.perform_one_step
+
+        # WB1 Exhaust... or continue from the exhausted state
+        if wb1_state is None:
+            ThreeCompHydSimulator.get_wb1_state(agent, p_work, start_h=start_h, start_g=start_g,
+                                                t_max=t_max, step_function=step_function)
+        else:
+            agent.set_state(wb1_state)
+        wb1_t = agent.get_time()
 
         # Recover...
         agent.set_power(p_rec)
@@ -102,53 +169,133 @@ class ThreeCompHydSimulator:
         # return ratio of times as recovery ratio
         return ((wb2_t - rec_t) / wb1_t) * 100.0
 
+    @staticmethod
+    def __get_channels(channels) -> tuple:
+        """
+        :return: given channels as a tuple or all channels if None. Raises a warning for unknown channels.
+        """
+        if channels is None:
+            return ThreeCompHydSimulator.channels
+        channels = tuple(channels)
+        unknown = [c for c in channels if c not in ThreeCompHydSimulator.channels]
+        if len(unknown) > 0:
+            raise UserWarning("Unknown channels {}. Available are {}".format(unknown, ThreeCompHydSimulator.channels))
+        return channels
+
+    @staticmethod
+    def __record_steps(agent: ThreeCompHydAgent, powers, channels: tuple, step_function,
+                       stop_at_exhaustion: bool) -> dict:
+        """
+        Performs one step per power demand and records given channels after every step into preallocated arrays.
+        Without a custom step function all steps are performed in a single call of agent.perform_power_steps_detail.
+        :return: dict with one array per channel
+        """
+        if step_function is None:
+            h, g, p_u, p_l, m_flow = agent.perform_power_steps_detail(powers, stop_at_exhaustion=stop_at_exhaustion)
+            record = {"h": h, "g": g, "p_u": p_u, "p_l": p_l, "m_flow": m_flow}
+            # fill levels are only derived if required
+            if "lf" in channels:
+                record["lf"] = 1 - h
+            if "ls" in channels:
+                record["ls"] = (agent.height_ls - g) / agent.height_ls
+            if "w_p_bal" in channels:
+                record["w_p_bal"] = 1.0 - h
+            return {c: record[c] for c in channels}
+
+        getters = {"h": agent.get_h,
+                   "g": agent.get_g,
+                   "lf": agent.get_fill_lf,
+                   "ls": agent.get_fill_ls,
+                   "p_u": agent.get_p_u,
+                   "p_l": agent.get_p_l,
+                   "m_flow": agent.get_m_flow,
+                   "w_p_bal": agent.get_w_p_ratio}
+        getters = [getters[c] for c in channels]
+        record = np.empty((len(channels), len(powers)))
+
+        steps = 0
+        for power in powers:
+            if stop_at_exhaustion and agent.is_exhausted():
+                break
+            # we don't include values of time step 0
+            # perform current power step
+            agent.set_power(power)
+            step_function()
+            # ... then collect observed values
+            for i, getter in enumerate(getters):
+                record[i, steps] = getter()
+            steps += 1
+        return {c: record[i, :steps] for i, c in enumerate(channels)}
+
+    @staticmethod
+    def __record_blocks(agent: ThreeCompHydAgent, powers, steps: int, recorder: SimulationRecorder,
+                        step_function, stop_at_exhaustion: bool):
+        """
+        Performs steps block by block and passes the channels of every block on to the recorder. Memory of
+        histories is thus bounded by the block size and the recorder.
+        :param powers: one power demand per step or a single constant power
+        :param steps: number of steps to perform
+        """
+        channels = ThreeCompHydSimulator.__get_channels(recorder.channels)
+        block_size = ThreeCompHydSimulator.recorder_block_size
+        for start in range(0, steps, block_size):
+            end = min(start + block_size, steps)
+            if np.isscalar(powers):
+                block = np.full(end - start, float(powers))
+            else:
+                block = powers[start:end]
+            recorder.record(ThreeCompHydSimulator.__record_steps(agent, block, channels, step_function,
+                                                                 stop_at_exhaustion=stop_at_exhaustion))
+            if stop_at_exhaustion and agent.is_exhausted():
+                break
+        recorder.flush()
+
     @staticmethod
     def simulate_course_detail(agent: ThreeCompHydAgent, powers,
-                               step_function=None, plot: bool = False):
+                               step_function=None, plot: bool = False, channels=None,
+                               recorder: SimulationRecorder = None):
         """
         simulates a whole course with given agent
         :param agent:
         :param powers: list or array
         :param plot: displays a plot of some of the state variables over time
         :param step_function: function of agent to estimate one time step. Default is perform_one_step.
-        :return all state variables throughout for every
-        time step of the course [h, g, lf, ls, p_u, p_l, m_flow, w_p_bal]. Pos 0 is time step 1.
+        :param channels: state variables to record out of ThreeCompHydSimulator.channels. Default is all of them.
+        :param recorder: optional SimulationRecorder that receives its channels block by block instead of full
+        resolution histories. Its channels replace the channels parameter and plots are not supported.
+        :return: one array per channel with its values throughout every time step of the course.
+        Default order is [h, g, lf, ls, p_u, p_l, m_flow, w_p_bal]. Pos 0 is time step 1.
+        The recorder is returned instead if one is given.
         """
 
         agent.reset()
-        h, g, lf, ls, p_u, p_l, m_flow, w_p_bal = [], [], [], [], [], [], [], []
+        if recorder is not None:
+            if plot is True:
+                raise UserWarning("Plots require full resolution histories and cannot be used with a recorder")
+            ThreeCompHydSimulator.__record_blocks(agent, powers, len(powers), recorder, step_function,
+                                                  stop_at_exhaustion=False)
+            return recorder
 
-        if step_function is None:
-            step_function = agent.perform_one_step
+        channels = ThreeCompHydSimulator.__get_channels(channels)
+        # plots require the flows and fill levels
+        recorded = ThreeCompHydSimulator.channels if plot is True else channels
 
-        # let the agent simulate the list of power demands
-        for step in powers:
-            # we don't include values of time step 0
-            # perform current power step
-            agent.set_power(step)
-            step_function()
-            # ... then collect observed values
-            h.append(agent.get_h())
-            g.append(agent.get_g())
-            lf.append(agent.get_fill_lf())
-            ls.append(agent.get_fill_ls())
-            p_u.append(agent.get_p_u())
-            p_l.append(agent.get_p_l())
-            m_flow.append(agent.get_m_flow())
-            w_p_bal.append(agent.get_w_p_ratio())
+        record = ThreeCompHydSimulator.__record_steps(agent, powers, recorded, step_function,
+                                                      stop_at_exhaustion=False)
 
         # an investigation and debug plot if you want to
         if plot is True:
             ThreeCompHydSimulator.plot_dynamics(t=np.arange(len(powers)), p=powers,
-                                                lf=lf, ls=ls, p_u=p_u, p_l=p_l)
+                                                lf=record["lf"], ls=record["ls"],
+                                                p_u=record["p_u"], p_l=record["p_l"])
 
         # return parameters
-        return h, g, lf, ls, p_u, p_l, m_flow, w_p_bal
+        return tuple(record[c] for c in channels)
 
     @staticmethod
     def tte_detail(agent: ThreeCompHydAgent, p_work: float, start_h: float = 0,
                    start_g: float = 0, t_max: float = 5000, step_function=None,
-                   plot: bool = False):
+                   plot: bool = False, channels=None, recorder: SimulationRecorder = None):
         """
         simulates a standard time to exhaustion test and collects all state variables of the hydraulic agent in
         every time step.
@@ -159,60 +306,64 @@ class ThreeCompHydSimulator:
         :param t_max: maximal time in seconds until warning "exhaustion not reached" is raised
         :param step_function: function of agent to estimate one time step. Default is perform_one_step.
         :param plot: whether state variables over time should be plotted
-        :return: all state variables all state variables throughout for every
-        time step of the TTE [h, g, lf, ls, p_u, p_l, m_flow, w_p_bal]. Pos 0 is time step 1.
+        :param channels: state variables to record out of ThreeCompHydSimulator.channels. Default is all of them.
+        :param recorder: optional SimulationRecorder that receives its channels block by block instead of full
+        resolution histories. Its channels replace the channels parameter and plots are not supported.
+        :return: one array per channel with its values throughout every time step of the TTE.
+        Default order is [h, g, lf, ls, p_u, p_l, m_flow, w_p_bal]. Pos 0 is time step 1.
+        The recorder is returned instead if one is given.
         """
 
         agent.reset()
         agent.set_h(start_h)
         agent.set_g(start_g)
-        step_limit = t_max * agent.hz
-
-        if step_function is None:
-            step_function = agent.perform_one_step
+        step_limit = int(math.ceil(t_max * agent.hz))
 
-        # all state variables are logged
-        t, ps = [], []
-        lf, ls, h, g, p_u, p_l, m_flow, w_p_bal = [], [], [], [], [], [], [], []
+        if recorder is not None:
+            if plot is True:
+                raise UserWarning("Plots require full resolution histories and cannot be used with a recorder")
+            ThreeCompHydSimulator.__record_blocks(agent, p_work, step_limit, recorder, step_function,
+                                                  stop_at_exhaustion=True)
+            return recorder
 
-        steps = 0
-        agent.set_power(p_work)
+        channels = ThreeCompHydSimulator.__get_channels(channels)
+        # plots require the flows and fill levels
+        recorded = ThreeCompHydSimulator.channels if plot is True else channels
 
         # perform steps until agent is exhausted or step limit is reached
-        while not agent.is_exhausted() and steps < step_limit:
-            # we don't include values of time step 0
-            # perform current power step
-            step_function()
-            steps += 1
-            # ... then collect observed values
-            t.append(agent.get_time())
-            ps.append(agent.get_power())
-            h.append(agent.get_h())
-            g.append(agent.get_g())
-            lf.append(agent.get_fill_lf())
-            ls.append(agent.get_fill_ls())
-            p_u.append(agent.get_p_u())
-            p_l.append(agent.get_p_l())
-            m_flow.append(agent.get_m_flow())
-            w_p_bal.append(agent.get_w_p_ratio())
+        record = ThreeCompHydSimulator.__record_steps(agent, np.full(step_limit, float(p_work)), recorded,
+                                                      step_function, stop_at_exhaustion=True)
 
         # a investigation and debug plot if you want to
         if plot is True:
-            ThreeCompHydSimulator.plot_dynamics(t=t, p=ps, lf=lf, ls=ls, p_u=p_u, p_l=p_l)
+            steps = len(record["h"])
+            ThreeCompHydSimulator.plot_dynamics(t=np.arange(1, steps + 1) / agent.hz, p=np.full(steps, p_work),
+                                                lf=record["lf"], ls=record["ls"],
+                                                p_u=record["p_u"], p_l=record["p_l"])
 
         # return parameters
-        return h, g, h, g, p_u, p_l, m_flow, w_p_bal
+        return tuple(record[c] for c in channels)
 
     @staticmethod
-    def tte_detail_with_recovery(agent: ThreeCompHydAgent, p_work, p_rec, plot=False):
+    def tte_detail_with_recovery(agent: ThreeCompHydAgent, p_work, p_rec, plot=False, solver: str = "euler"):
         """
         The time the agent takes till exhaustion at given power and time till recovery
         :param agent: agent instance to use
         :param p_work: expenditure intensity
         :param p_rec: recovery intensity
         :param plot: displays a plot of some of the state variables over time
+        :param solver: "euler" for fixed steps of the agent or "analytic" for ThreeCompHydPhaseSolver, which
+        considers flows in Watts for the equilibrium check and does not support plots
         :returns: tte, ttr
         """
+        if solver == "analytic":
+            if plot is True:
+                raise UserWarning("The analytic solver does not collect state variables to plot")
+            return ThreeCompHydPhaseSolver(agent).tte_with_recovery(p_work, p_rec,
+                                                                    t_max_work=10000 / agent.hz,
+                                                                    t_max_rec=20000 / agent.hz)
+        elif solver != "euler":
+            raise UserWarning("Unknown solver {}. Use 'euler' or 'analytic'".format(solver))
 
         agent.reset()
         t, p, lf, ls, p_u, p_l, m_flow = [], [], [], [], [], [], []
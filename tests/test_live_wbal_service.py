@@ -0,0 +1,77 @@
+import asyncio
+import json
+import os
+
+import numpy as np
+
+from pypermod.agents.hyd_agents.three_comp_hyd_agent import ThreeCompHydAgent
+from pypermod.agents.wbal_agents.wbal_ode_agent_bartram import WbalODEAgentBartram
+from pypermod.agents.wbal_agents.wbal_ode_agent_skiba import WbalODEAgentSkiba
+from pypermod.data_structure.activities.activity_types import ActivityTypes
+from pypermod.data_structure.activities.protocol_types import ProtocolTypes
+from pypermod.data_structure.athlete import Athlete
+from pypermod.service.live_wbal_service import LiveWbalService, replay_courses
+
+HYD_CONFIG = [11532.5, 23240.3, 249.8, 286.3, 8.0, 0.255, 0.269, 0.282]
+
+
+def test_replayed_live_wbal(tmp_path):
+    athlete = Athlete(os.path.join(str(tmp_path), "rider_c"))
+    athlete.set_hydraulic_fitting_of_type_and_protocol(HYD_CONFIG, a_type=ActivityTypes.SRM_BBB_TEST,
+                                                       p_type=ProtocolTypes.TTE)
+    courses = {"rider_a": [400.0, 380.0], "rider_b": [150.0], "rider_c": [350.0]}
+    ticks = 30
+
+    async def scenario():
+        service = LiveWbalService(hz=1)
+        service.add_agent("rider_a", WbalODEAgentSkiba(w_p=18000, cp=250))
+        service.add_agent("rider_b", WbalODEAgentBartram(w_p=20000, cp=240))
+        service.add_athlete(athlete, a_type=ActivityTypes.SRM_BBB_TEST, hydraulic=True)
+        port = await service.start_tcp_server()
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        # malformed messages are skipped without closing the connection or applying any of their samples
+        writer.write(b'{"athlete": "rider_a", "power": "x"}\n{"powers": [1]}\n[1, 2]\nnot json\n'
+                     b'{"powers": {"rider_a": 900, "rider_b": null}}\n')
+        # so is a message beyond the stream limit of 64 KiB
+        writer.write(b'{"powers": {"rider_a": 900}, "pad": "' + b"x" * 200000 + b'"}\n')
+        writer.write(b'{"subscribe": true}\n')
+        await writer.drain()
+        await replay_courses(courses, port=port)
+        # wait until the last samples arrived
+        for _ in range(100):
+            if service.get_power("rider_a") == 380.0 and service.get_power("rider_c") == 350.0:
+                break
+            await asyncio.sleep(0.01)
+
+        for _ in range(ticks):
+            service.tick()
+        await service.publish()
+        publication = json.loads(await reader.readline())
+        writer.close()
+        await service.close()
+        return publication
+
+    publication = asyncio.run(scenario())
+    assert publication["time"] == ticks
+    assert list(publication["athletes"]) == ["rider_a", "rider_b", "rider_c"]
+
+    # single agents stepped with the last received powers
+    agents = {"rider_a": WbalODEAgentSkiba(w_p=18000, cp=250), "rider_b": WbalODEAgentBartram(w_p=20000, cp=240),
+              "rider_c": ThreeCompHydAgent(1, *HYD_CONFIG)}
+    for athlete_id, agent in agents.items():
+        entry = publication["athletes"][athlete_id]
+        assert entry["power"] == courses[athlete_id][-1]
+        for _ in range(ticks):
+            agent.set_power(courses[athlete_id][-1])
+            agent.perform_one_step()
+        if isinstance(agent, ThreeCompHydAgent):
+            assert np.isclose(entry["w_bal"], agent.get_w_p_ratio(), rtol=0, atol=1e-12)
+        else:
+            assert np.isclose(entry["w_bal"], agent.get_w_p_balance(), rtol=0, atol=1e-9)
+        # the predicted TTE equals stepping until exhaustion within the horizon
+        steps = 0
+        while not agent.is_exhausted() and steps <= 600:
+            agent.perform_one_step()
+            steps += 1
+        assert entry["tte"] == (None if steps > 600 else steps)
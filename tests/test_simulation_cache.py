@@ -0,0 +1,67 @@
+import numpy as np
+
+from pypermod.agents.hyd_agents.three_comp_hyd_agent import ThreeCompHydAgent
+from pypermod.agents.wbal_agents.wbal_int_agent_skiba import WbalIntAgentSkiba
+from pypermod.agents.wbal_agents.wbal_ode_agent_skiba import WbalODEAgentSkiba
+from pypermod.simulator.simulation_cache import SimulationCache
+from pypermod.simulator.simulator_basis import SimulatorBasis
+from pypermod.simulator.study_simulator import StudySimulator
+
+
+def create_agents():
+    return [WbalODEAgentSkiba(w_p=18000, cp=250, hz=2),
+            WbalIntAgentSkiba(w_p=18000, cp=250),
+            ThreeCompHydAgent(10, 11532.5, 23240.3, 249.8, 286.3, 8.0, 0.255, 0.269, 0.282)]
+
+
+def run_simulations(agents):
+    course = np.repeat([300, 100, 450, 200], 60)
+    results = []
+    for agent in agents:
+        results.append(SimulatorBasis.simulate_course(agent, course))
+        results.append(SimulatorBasis.get_tte_dynamics(agent, p_work=400))
+        results.append(SimulatorBasis.get_recovery_ratio_wb1_wb2(agent, p_work=400, p_rec=150, t_rec=60))
+        results.append(StudySimulator.get_recovery_ratios_wb1_wb2(agent, p_work=400, p_rec=150,
+                                                                  rec_times=[60, 120, 240]))
+    return results
+
+
+def test_cached_simulations(tmp_path):
+    expected = run_simulations(create_agents())
+    format_version = SimulationCache.format_version
+    try:
+        SimulatorBasis.cache = SimulationCache(str(tmp_path))
+        assert all(np.array_equal(a, b) for a, b in zip(run_simulations(create_agents()), expected))
+        misses = SimulatorBasis.cache.misses
+        assert SimulatorBasis.cache.hits == 3  # recovery time 60 is shared by both recovery functions
+
+        # a new cache instance finds the stored results of the previous one
+        SimulatorBasis.cache = SimulationCache(str(tmp_path))
+        cached = run_simulations(create_agents())
+        assert SimulatorBasis.cache.hits == misses + 3 and SimulatorBasis.cache.misses == 0
+        assert all(np.array_equal(a, b) for a, b in zip(cached, expected))
+        assert isinstance(cached[0], np.memmap)
+
+        # different parameters are different simulations
+        SimulatorBasis.get_tte_dynamics(WbalODEAgentSkiba(w_p=18001, cp=250, hz=2), p_work=400)
+        assert SimulatorBasis.cache.misses == 1
+
+        # results of another cache format are not reused
+        SimulationCache.format_version += 1
+        SimulatorBasis.get_tte_dynamics(WbalODEAgentSkiba(w_p=18000, cp=250, hz=2), p_work=400)
+        assert SimulatorBasis.cache.misses == 2
+    finally:
+        SimulatorBasis.cache = None
+        SimulationCache.format_version = format_version
+
+
+def test_cache_eviction(tmp_path):
+    # room for two results
+    cache = SimulationCache(str(tmp_path), max_bytes=2000)
+    cache.put("0", np.zeros(100))
+    cache.put("1", np.ones(100))
+    # the first result is used again and outlives the second one
+    assert cache.get("0")[0] == 0
+    cache.put("2", np.full(100, 2.0))
+    assert len(cache) == 2 and cache.get_size() <= 2000
+    assert cache.get("0") is not None and cache.get("1") is None and cache.get("2")[0] == 2
@@ -0,0 +1,170 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from pypermod import config
+from pypermod.agents.hyd_agents.three_comp_hyd_agent import ThreeCompHydAgent
+from pypermod.agents.hyd_agents.two_comp_hyd_agent import TwoCompHydAgent
+from pypermod.agents.wbal_agents.wbal_int_agent_skiba import WbalIntAgentSkiba
+from pypermod.agents.wbal_agents.wbal_ode_agent_bartram import WbalODEAgentBartram
+from pypermod.agents.wbal_agents.wbal_ode_agent_skiba import WbalODEAgentSkiba
+from pypermod.agents.wbal_agents.wbal_ode_agent_weigend import WbalODEAgentWeigend
+from pypermod.simulator.simulator_basis import SimulatorBasis
+from pypermod.simulator.study_simulator import StudySimulator
+
+
+def create_agents():
+    """
+    agents of all simulated types with two agents of the same type to check name enumeration
+    """
+    return [WbalODEAgentSkiba(w_p=18000, cp=250, hz=2),
+            WbalODEAgentBartram(w_p=18000, cp=250, hz=2),
+            WbalODEAgentSkiba(w_p=22000, cp=240, hz=2),
+            WbalIntAgentSkiba(w_p=18000, cp=250),
+            TwoCompHydAgent(an=18000, cp=250, phi=0.5, psi=0.2, hz=2),
+            ThreeCompHydAgent(10, 11532.5, 23240.3, 249.8, 286.3, 8.0, 0.255, 0.269, 0.282)]
+
+
+def test_parallel_standard_comparison():
+    rec_times = np.arange(0, 400, 30)
+    serial = StudySimulator.standard_comparison(create_agents(), p_work=400, p_rec=150, rec_times=rec_times)
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        for chunksize in [None, 1, 4]:
+            parallel = StudySimulator.standard_comparison(create_agents(), p_work=400, p_rec=150,
+                                                          rec_times=rec_times, executor=executor,
+                                                          chunksize=chunksize)
+            # same keys in the same order and identical results
+            assert list(parallel.items()) == list(serial.items())
+
+        # all conditions of a study are submitted at once
+        conditions = [(400, 150), (450, 100)]
+        comparisons = StudySimulator.standard_comparisons(create_agents(), conditions=conditions,
+                                                          rec_times=rec_times, executor=executor)
+        assert len(comparisons) == 2 and list(comparisons[0].items()) == list(serial.items())
+        second = StudySimulator.standard_comparison(create_agents(), p_work=450, p_rec=100, rec_times=rec_times)
+        assert list(comparisons[1].items()) == list(second.items())
+
+
+def test_default_chunks_spread_over_workers(monkeypatch):
+    class CountingExecutor(ThreadPoolExecutor):
+        def map(self, fn, *iterables, **kwargs):
+            self.chunks = len(iterables[0])
+            return super().map(fn, *iterables, **kwargs)
+
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    agents = create_agents()[:2]
+    tasks = [(agent, 400, 150, t_rec) for agent in agents for t_rec in np.arange(0, 400, 10)]
+    with CountingExecutor(max_workers=2) as executor:
+        ratios = StudySimulator.get_recovery_ratios_of_tasks(tasks, executor=executor)
+    assert ratios == StudySimulator.get_recovery_ratios_of_tasks(tasks)
+    # two agents are split into at least one chunk per CPU
+    assert executor.chunks >= 8
+
+
+def test_stream_course():
+    rng = np.random.default_rng(4)
+    course = np.repeat(rng.integers(0, 500, 30), rng.integers(1, 40, 30)).astype(float)
+
+    async def feed():
+        for power in course:
+            yield power
+
+    async def collect(agent, batch_size):
+        return [values async for values in SimulatorBasis.astream_course(agent, feed(), batch_size=batch_size)]
+
+    for agent in create_agents():
+        # integral agents stream with an online DCP estimation and are compared to their own stream
+        if isinstance(agent, WbalIntAgentSkiba):
+            full = np.array(list(SimulatorBasis.stream_course(agent, iter(course))))
+        else:
+            full = SimulatorBasis.simulate_course(agent, course)
+        ticks = list(SimulatorBasis.stream_course(agent, iter(course)))
+        assert len(ticks) == len(course) and np.allclose(ticks, full, rtol=0, atol=1e-9)
+        batches = list(SimulatorBasis.stream_course(agent, iter(course), batch_size=64))
+        assert all(len(b) == 64 for b in batches[:-1])
+        assert np.allclose(np.concatenate(batches), full, rtol=0, atol=1e-9)
+        assert np.allclose(asyncio.run(collect(agent, None)), full, rtol=0, atol=1e-9)
+        assert np.allclose(np.concatenate(asyncio.run(collect(agent, 50))), full, rtol=0, atol=1e-9)
+
+
+def test_tte_curve():
+    powers = np.linspace(200, 800, 25)
+    for agent in create_agents():
+        for jit in [True, False]:
+            config.three_comp_jit = jit
+            try:
+                curve = SimulatorBasis.tte_curve(agent, powers)
+            finally:
+                config.three_comp_jit = True
+            for p, tte in zip(powers, curve):
+                if isinstance(agent, TwoCompHydAgent):
+                    # compare to single steps
+                    agent.reset()
+                    agent.set_power(p)
+                    steps = 0
+                    while not agent.is_exhausted() and steps < SimulatorBasis.step_limit:
+                        agent.perform_one_step()
+                        steps += 1
+                    expected = steps / agent.hz if agent.is_exhausted() else np.nan
+                else:
+                    try:
+                        expected = len(SimulatorBasis.get_tte_dynamics(agent, p)) / agent.hz
+                    except (UserWarning, TypeError):
+                        expected = np.nan
+                assert tte == expected or (np.isnan(tte) and np.isnan(expected))
+
+    # differential agents at 10 Hz, where rounding of stepped expenditure decides about the last step
+    powers = np.append(np.linspace(300, 900, 61), [416, 826])
+    for agent in [WbalODEAgentWeigend(w_p=17589, cp=293, hz=10), WbalODEAgentSkiba(w_p=17589, cp=293, hz=10)]:
+        curve = SimulatorBasis.tte_curve(agent, powers)
+        for p, tte in zip(powers, curve):
+            try:
+                expected = len(SimulatorBasis.get_tte_dynamics(agent, p)) / agent.hz
+            except UserWarning:
+                expected = np.nan
+            assert tte == expected or (np.isnan(tte) and np.isnan(expected))
+
+
+def test_power_for_tte():
+    targets = np.array([20, 60, 150])
+    for agent in create_agents():
+        for jit in [True, False]:
+            config.three_comp_jit = jit
+            try:
+                powers = SimulatorBasis.power_for_tte(agent, targets)
+                ttes = SimulatorBasis.tte_curve(agent, powers)
+                # the smallest powers that exhaust within the targets
+                weaker = SimulatorBasis.tte_curve(agent, powers - 0.01)
+            finally:
+                config.three_comp_jit = True
+            assert np.all(ttes <= targets) and np.all(weaker > targets)
+            if not isinstance(agent, ThreeCompHydAgent):
+                assert np.array_equal(ttes, targets)
+
+    # differential agents are checked by stepping, including long targets at 10 Hz
+    targets = np.array([20, 60, 150, 300])
+    for agent in [WbalODEAgentSkiba(w_p=17589, cp=293, hz=1), WbalODEAgentWeigend(w_p=17589, cp=293, hz=10)]:
+        powers = SimulatorBasis.power_for_tte(agent, targets)
+        for p, target in zip(powers, targets):
+            assert len(SimulatorBasis.get_tte_dynamics(agent, p)) == target * agent.hz
+            assert len(SimulatorBasis.get_tte_dynamics(agent, p - 0.01)) > target * agent.hz
+
+    # from the state after a work bout
+    for agent in [create_agents()[0], create_agents()[-1]]:
+        agent.reset()
+        SimulatorBasis._perform_constant_power_steps(agent, 400, 30 * agent.hz)
+        state = agent.get_state()
+        powers = SimulatorBasis.power_for_tte(agent, targets, state=state)
+        for p, target in zip(powers, targets):
+            agent.set_state(state)
+            if isinstance(agent, ThreeCompHydAgent):
+                steps = len(agent.perform_power_steps(np.full(400 * agent.hz, p), stop_at_exhaustion=True)[0])
+            else:
+                steps = 0
+                while not agent.is_exhausted():
+                    agent.set_power(p)
+                    agent.perform_one_step()
+                    steps += 1
+            assert steps == target * agent.hz or (isinstance(agent, ThreeCompHydAgent) and steps < target * agent.hz)
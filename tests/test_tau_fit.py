@@ -0,0 +1,26 @@
+import numpy as np
+
+from pypermod.agents.wbal_agents.wbal_int_agent_fix_tau import WbalIntAgentFixTau
+from pypermod.agents.wbal_agents.wbal_ode_agent_fix_tau import WbalODEAgentFixTau
+from pypermod.fitter.tau_fit import TauFitter
+from pypermod.simulator.simulator_basis import SimulatorBasis
+
+
+def test_w_p_bal_for_taus_equals_single_simulations():
+    course = ([329] * 60 + [95] * 30) * 20
+    taus = np.linspace(100, 500, 9)
+    for agent in [WbalODEAgentFixTau(w_p=21100, cp=241), WbalIntAgentFixTau(w_p=21100, cp=241)]:
+        bal_matrix = agent.estimate_w_p_bal_for_taus(course, taus)
+        assert bal_matrix.shape == (len(taus), len(course))
+        for k, tau in enumerate(taus):
+            agent.set_tau(tau)
+            assert np.array_equal(bal_matrix[k], SimulatorBasis.simulate_course(agent, course))
+
+
+def test_chidnok_objective_for_taus():
+    taus = np.linspace(100, 500, 9)
+    for agent, f in [(WbalODEAgentFixTau(w_p=21100, cp=241), TauFitter.f_chidnok_ode),
+                     (WbalIntAgentFixTau(w_p=21100, cp=241), TauFitter.f_chidnok_int)]:
+        batched = TauFitter.f_chidnok_for_taus(taus, agent, 329, 95, 759)
+        single = [f(tau, agent, 329, 95, 759) for tau in taus]
+        assert np.array_equal(batched, single)
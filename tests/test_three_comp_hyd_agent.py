@@ -0,0 +1,235 @@
+import numpy as np
+
+from pypermod import config
+from pypermod.agents.hyd_agents.three_comp_hyd_agent import ThreeCompHydAgent
+from pypermod.agents.hyd_agents.three_comp_hyd_agent_population import ThreeCompHydAgentPopulation
+from pypermod.simulator.recorder import SimulationRecorder
+from pypermod.simulator.simulator_basis import SimulatorBasis
+from pypermod.simulator.study_simulator import StudySimulator
+from pypermod.simulator.three_comp_hyd_ode_solver import ThreeCompHydODESolver
+from pypermod.simulator.three_comp_hyd_population_simulator import ThreeCompHydPopulationSimulator
+from pypermod.simulator.three_comp_hyd_simulator import ThreeCompHydSimulator
+
+# fitted parameters of two example athletes
+PARAMS = [
+    [11532.526538727172, 23240.257042239595, 249.7641585019016, 286.26673813946095,
+     7.988078323028352, 0.25486842730772163, 0.26874299216869681, 0.2815471411228945],
+    [15101.24769778409, 86209.27743067988, 252.71702367096788, 363.2970828395908,
+     38.27073086773415, 0.14892228099402588, 0.3524379644134216, 0.1580228306857272]
+]
+
+
+def test_step_kernel_matches_single_steps():
+    rng = np.random.default_rng(0)
+    course = np.repeat(rng.integers(0, 700, 100), rng.integers(1, 200, 100)).astype(float)
+    jit_flag = config.three_comp_jit
+    try:
+        for use_jit in [False, True]:
+            config.three_comp_jit = use_jit
+            for params in PARAMS:
+                stepped = ThreeCompHydAgent(10, *params)
+                h_hist, g_hist = [], []
+                for p in course:
+                    stepped.set_power(p)
+                    stepped.perform_one_step()
+                    h_hist.append(stepped.get_h())
+                    g_hist.append(stepped.get_g())
+
+                kernel = ThreeCompHydAgent(10, *params)
+                h_kernel, g_kernel = kernel.perform_power_steps(course)
+                # bit-compatible with the branch logic of single steps
+                assert np.array_equal(h_kernel, h_hist)
+                assert np.array_equal(g_kernel, g_hist)
+                assert kernel.get_p_l() == stepped.get_p_l()
+                assert kernel.get_m_flow() == stepped.get_m_flow()
+                assert kernel.get_time() == stepped.get_time()
+
+                # stop at the first exhausted step
+                kernel.reset()
+                h_kernel, _ = kernel.perform_power_steps([600] * 5000, stop_at_exhaustion=True)
+                assert kernel.is_exhausted() and h_kernel[-1] >= 1.0 and np.all(h_kernel[:-1] < 1.0)
+    finally:
+        config.three_comp_jit = jit_flag
+
+
+def test_population_matches_single_agents():
+    rng = np.random.default_rng(3)
+    n = 20
+    configs = np.column_stack([rng.uniform(5000, 50000, n), rng.uniform(5000, 100000, n),
+                               rng.uniform(100, 400, n), rng.uniform(100, 600, n), rng.uniform(1, 100, n),
+                               rng.uniform(0, 0.45, n), rng.uniform(0, 0.45, n), rng.uniform(0, 0.9, n)])
+    configs = np.vstack([PARAMS, configs])
+    population = ThreeCompHydAgentPopulation(hz=1, configs=configs)
+    ttes = ThreeCompHydPopulationSimulator.tte(population, p_work=400, t_max=2000)
+    ratios = ThreeCompHydPopulationSimulator.get_recovery_ratio_wb1_wb2(population, p_work=400, p_rec=100,
+                                                                         t_rec=120, t_max=2000)
+    assert ttes.shape == ratios.shape == (len(configs),)
+
+    for i in range(len(configs)):
+        agent = population.get_agent(i)
+        try:
+            assert ThreeCompHydSimulator.tte(agent, p_work=400, t_max=2000) == ttes[i]
+            assert ThreeCompHydSimulator.get_recovery_ratio_wb1_wb2(agent, p_work=400, p_rec=100, t_rec=120,
+                                                                    t_max=2000) == ratios[i]
+        except UserWarning:
+            # exhaustion not reached
+            assert np.isnan(ttes[i]) and np.isnan(ratios[i])
+
+
+def test_adaptive_solver_converges_to_fine_steps():
+    for params in PARAMS:
+        # a very fine fixed step as reference
+        fine = ThreeCompHydAgent(2000, *params)
+        fine.perform_power_steps([400] * 2000 * 1000, stop_at_exhaustion=True)
+        wb1_t = fine.get_time()
+        fine.perform_power_steps([100] * 2000 * 120)
+        rec_t = fine.get_time()
+        fine.perform_power_steps([400] * 2000 * 1000, stop_at_exhaustion=True)
+        ratio = (fine.get_time() - rec_t) / wb1_t * 100.0
+
+        agent = ThreeCompHydAgent(1, *params)
+        tte = ThreeCompHydSimulator.tte(agent, p_work=400, solver="adaptive")
+        assert abs(tte - wb1_t) < 0.01
+        adaptive_ratio = ThreeCompHydSimulator.get_recovery_ratio_wb1_wb2(agent, p_work=400, p_rec=100, t_rec=120,
+                                                                          solver="adaptive")
+        assert abs(adaptive_ratio - ratio) < 0.01
+        # far closer than the default 10 Hz
+        euler_ratio = ThreeCompHydSimulator.get_recovery_ratio_wb1_wb2(ThreeCompHydAgent(10, *params), p_work=400,
+                                                                       p_rec=100, t_rec=120)
+        assert abs(adaptive_ratio - ratio) < abs(euler_ratio - ratio)
+
+        # single adaptive steps advance the time of the agent
+        agent = ThreeCompHydAgent(2, *params)
+        agent.set_power(400)
+        solver = ThreeCompHydODESolver(agent)
+        for _ in range(3):
+            solver.perform_one_step()
+        assert agent.get_time() == 1.5 and 0 < agent.get_h() < 1
+
+
+def test_adaptive_solver_with_lf_ls_exit_at_bottom():
+    # with gamma = 0 the pipe exit of LS is at the bottom of LF and fires right at exhaustion
+    agent = ThreeCompHydAgent(1, 15101.24, 86900, 252, 363, 38.3, 0.708, 0.0, 0.252)
+    for p_work, p_rec, t_rec in [(600, 0, 120), (600, 200, 360)]:
+        adaptive = ThreeCompHydSimulator.get_recovery_ratio_wb1_wb2(agent, p_work=p_work, p_rec=p_rec,
+                                                                    t_rec=t_rec, solver="adaptive")
+        analytic = ThreeCompHydSimulator.get_recovery_ratio_wb1_wb2(agent, p_work=p_work, p_rec=p_rec,
+                                                                    t_rec=t_rec, solver="analytic")
+        assert abs(adaptive - analytic) < 1e-3
+
+    # without stopping at exhaustion, LF stays empty
+    h, _, t = ThreeCompHydODESolver(agent).integrate(600, 0, 0, 100, stop_at_exhaustion=False)
+    assert h == 1.0 and t == 100
+
+
+def test_analytic_solver_matches_adaptive_solver():
+    for params in PARAMS:
+        agent = ThreeCompHydAgent(1, *params)
+        for p_work, p_rec, t_rec in [(400, 100, 120), (700, 0, 30), (350, 200, 600)]:
+            adaptive = ThreeCompHydSimulator.get_recovery_ratio_wb1_wb2(agent, p_work=p_work, p_rec=p_rec,
+                                                                        t_rec=t_rec, solver="adaptive")
+            analytic = ThreeCompHydSimulator.get_recovery_ratio_wb1_wb2(agent, p_work=p_work, p_rec=p_rec,
+                                                                        t_rec=t_rec, solver="analytic")
+            assert abs(adaptive - analytic) < 1e-3
+            assert abs(ThreeCompHydSimulator.tte(agent, p_work, solver="adaptive") -
+                       ThreeCompHydSimulator.tte(agent, p_work, solver="analytic")) < 1e-3
+
+        # time to recovery is close to the one of single steps at 1 Hz
+        tte, ttr = ThreeCompHydSimulator.tte_detail_with_recovery(agent, p_work=400, p_rec=0, solver="analytic")
+        step_tte, step_ttr = ThreeCompHydSimulator.tte_detail_with_recovery(agent, p_work=400, p_rec=0)
+        assert abs(tte - step_tte) < 5 and abs(ttr - step_ttr) / step_ttr < 0.02
+
+
+def test_state_snapshot_forks_recovery_trials():
+    agent = ThreeCompHydAgent(10, *PARAMS[0])
+    wb1_state = ThreeCompHydSimulator.get_wb1_state(agent, p_work=400)
+    assert wb1_state == agent.get_state()
+    for t_rec in [10, 120, 600]:
+        ratio = ThreeCompHydSimulator.get_recovery_ratio_wb1_wb2(agent, p_work=400, p_rec=150, t_rec=t_rec)
+        forked = ThreeCompHydSimulator.get_recovery_ratio_wb1_wb2(agent, p_work=400, p_rec=150, t_rec=t_rec,
+                                                                  wb1_state=wb1_state)
+        assert forked == ratio
+
+    # a restored agent continues exactly like the original
+    agent.set_state(wb1_state)
+    restored = ThreeCompHydAgent(10, *PARAMS[0])
+    restored.set_state(wb1_state)
+    h_hist, g_hist = agent.perform_power_steps([200] * 500)
+    assert np.array_equal(restored.perform_power_steps([200] * 500)[0], h_hist)
+    assert restored.get_time() == agent.get_time()
+
+
+def test_single_pass_recovery_sweep():
+    rec_times = [240, 10, 60, 60, 0, 600]
+    for params in PARAMS:
+        agent = ThreeCompHydAgent(10, *params)
+        ratios = StudySimulator.get_recovery_ratios_wb1_wb2(agent, p_work=400, p_rec=100, rec_times=rec_times)
+        assert ratios == [SimulatorBasis.get_recovery_ratio_wb1_wb2(agent, p_work=400, p_rec=100, t_rec=t_rec)
+                          for t_rec in rec_times]
+
+
+def test_no_recovery_above_m_u():
+    # the exhausted agent can't recover at a power above m_u and mustn't take an extra step at WB2
+    for hz in [1, 10]:
+        agent = ThreeCompHydAgent(hz, *PARAMS[0])
+        for t_rec in [60, 120, 240]:
+            assert SimulatorBasis.get_recovery_ratio_wb1_wb2(agent, p_work=400, p_rec=280, t_rec=t_rec) == 0.0
+        assert StudySimulator.get_recovery_ratios_wb1_wb2(agent, p_work=400, p_rec=280,
+                                                          rec_times=[60, 120, 240]) == [0.0] * 3
+
+
+def test_course_detail_channels():
+    rng = np.random.default_rng(2)
+    course = np.repeat(rng.integers(0, 600, 50), rng.integers(1, 100, 50)).astype(float)
+    agent = ThreeCompHydAgent(10, *PARAMS[0])
+    stepped = ThreeCompHydSimulator.simulate_course_detail(agent, course, step_function=agent.perform_one_step)
+    recorded = ThreeCompHydSimulator.simulate_course_detail(agent, course)
+    assert len(recorded) == len(ThreeCompHydSimulator.channels)
+    for a, b in zip(stepped, recorded):
+        assert isinstance(b, np.ndarray) and np.array_equal(a, b)
+
+    # only selected channels are returned in the requested order
+    p_l, w_p_bal = ThreeCompHydSimulator.simulate_course_detail(agent, course, channels=["p_l", "w_p_bal"])
+    assert np.array_equal(p_l, stepped[5]) and np.array_equal(w_p_bal, stepped[7])
+    h, = ThreeCompHydSimulator.tte_detail(agent, 400, channels=["h"], step_function=agent.perform_one_step)
+    assert h[-1] == 1.0 and np.array_equal(h, ThreeCompHydSimulator.tte_detail(agent, 400, channels=["h"])[0])
+
+    # lf and ls are the fill levels of the tanks, not the levels h and g (returned in their place before)
+    h, g, lf, ls = ThreeCompHydSimulator.tte_detail(agent, 400, channels=["h", "g", "lf", "ls"])
+    agent.reset()
+    agent.set_power(400)
+    for _ in range(len(h)):
+        agent.perform_one_step()
+    assert lf[-1] == agent.get_fill_lf() and ls[-1] == agent.get_fill_ls()
+    assert not np.array_equal(lf, h) and not np.array_equal(ls, g)
+
+
+def test_course_recorder():
+    rng = np.random.default_rng(3)
+    course = np.repeat(rng.integers(0, 600, 50), rng.integers(1, 100, 50)).astype(float)
+    agent = ThreeCompHydAgent(10, *PARAMS[0])
+    p_l, h = ThreeCompHydSimulator.simulate_course_detail(agent, course, channels=["p_l", "h"])
+
+    # blocks of the simulation don't line up with decimation windows
+    ThreeCompHydSimulator.recorder_block_size = 777
+    try:
+        rec = ThreeCompHydSimulator.simulate_course_detail(agent, course, recorder=SimulationRecorder(["h", "p_l"]))
+        assert np.array_equal(rec.get("h"), h) and np.array_equal(rec.get("p_l"), p_l)
+
+        rec = SimulationRecorder(["h", "p_l"], decimation=10, aggregate="mean")
+        ThreeCompHydSimulator.simulate_course_detail(agent, course, recorder=rec)
+        windows = np.array_split(p_l, np.arange(10, len(p_l), 10))
+        assert np.allclose(rec.get("p_l"), [w.mean() for w in windows])
+        assert rec.get_steps()[-1] == len(course)
+
+        # a ring buffer keeps the latest samples only
+        rec = SimulationRecorder(["h"], decimation=10, aggregate="min", ring_size=25)
+        ThreeCompHydSimulator.simulate_course_detail(agent, course, recorder=rec)
+        assert len(rec) == 25 and np.array_equal(rec.get("h"), [w.min() for w in np.array_split(
+            h, np.arange(10, len(h), 10))][-25:])
+
+        rec = ThreeCompHydSimulator.tte_detail(agent, 400, recorder=SimulationRecorder(["h"], decimation=7))
+        tte_h, = ThreeCompHydSimulator.tte_detail(agent, 400, channels=["h"])
+        assert rec.get("h")[-1] == 1.0 and rec.get_steps()[-1] == len(tte_h)
+    finally:
+        ThreeCompHydSimulator.recorder_block_size = 36000
@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+
+from pypermod.agents.hyd_agents.three_comp_hyd_agent import ThreeCompHydAgent
+from pypermod.data_structure.helper.simple_time_power_pairs import SimpleTimePowerPairs
+from pypermod.fitter.three_comp_hyd_fit import ThreeCompHydFitter
+from pypermod.simulator.three_comp_hyd_simulator import ThreeCompHydSimulator
+
+CONFIG = [11532.526538727172, 23240.257042239595, 249.7641585019016, 286.26673813946095,
+          7.988078323028352, 0.25486842730772163, 0.26874299216869681, 0.2815471411228945]
+
+
+def create_fitter(**kwargs):
+    """
+    a fitter with TTEs and a recovery ratio of a known configuration
+    """
+    agent = ThreeCompHydAgent(1, *CONFIG)
+    powers = [350, 450, 600]
+    ttes = SimpleTimePowerPairs(times=[ThreeCompHydSimulator.tte(agent, p) for p in powers], powers=powers)
+    ratio = ThreeCompHydSimulator.get_recovery_ratio_wb1_wb2(agent, p_work=450, p_rec=100, t_rec=120)
+    return ThreeCompHydFitter(ttes=ttes, recovery_trials=[(450, 100, 120, ratio)], pop_size=8, seed=3, **kwargs)
+
+
+def test_known_configuration_has_no_loss():
+    fitter = create_fitter()
+    losses = fitter.evaluate([CONFIG, [1, 1, 1, 1, 1, 0.6, 0.6, 0.5]])
+    assert losses[0] == 0
+    # LS with negative height
+    assert losses[1] == ThreeCompHydFitter.penalty
+
+
+def test_workers_and_checkpoint_resume(tmp_path):
+    best, loss = create_fitter().fit(generations=4)
+    assert len(best) == 8
+
+    # spreading evaluations across processes does not change results
+    assert create_fitter(workers=2).fit(generations=4) == (best, loss)
+
+    # an interrupted fitting resumes from its checkpoint
+    checkpoint = os.path.join(tmp_path, "fit.npz")
+    create_fitter(checkpoint_path=checkpoint).fit(generations=2)
+    assert create_fitter(checkpoint_path=checkpoint).fit(generations=4) == (best, loss)
+    assert int(np.load(checkpoint)["generation"]) == 4
@@ -0,0 +1,56 @@
+import math
+
+import numpy as np
+
+from pypermod.agents.hyd_agents.two_comp_hyd_agent import TwoCompHydAgent
+
+
+def test_time_to_exhaustion_query():
+    for phi, psi in [(0.5, 0.0), (0.2, 0.3), (0.0, 0.0), (0.7, 0.3)]:
+        agent = TwoCompHydAgent(an=18000, cp=250, phi=phi, psi=psi, hz=10)
+        # the level of An settles above the pipe exit
+        assert agent.time_to_exhaustion(200) == math.inf
+        assert agent.time_to_exhaustion(0) == math.inf
+
+        agent.set_power(350)
+        for _ in range(500):
+            agent.perform_one_step()
+        for p in [260, 400, 900]:
+            expected = agent.time_to_exhaustion(p)
+            assert expected < agent.time_to_exhaustion(p, from_current_state=False)
+
+            # stepping a copy from the same state takes exactly as long
+            stepped = TwoCompHydAgent(an=18000, cp=250, phi=phi, psi=psi, hz=10)
+            stepped.set_power(350)
+            for _ in range(500):
+                stepped.perform_one_step()
+            stepped.set_power(p)
+            steps = 0
+            while not stepped.is_exhausted():
+                stepped.perform_one_step()
+                steps += 1
+            assert steps / stepped.hz == expected
+
+
+def test_power_steps_match_single_steps():
+    course = [300] * 1200 + [0] * 600 + [250] * 300 + [900] * 800 + [100] * 500
+    for phi, psi in [(0.5, 0.0), (0.2, 0.3), (0.7, 0.3)]:
+        stepped = TwoCompHydAgent(an=18000, cp=250, phi=phi, psi=psi, hz=10)
+        h_hist = []
+        for p in course:
+            stepped.set_power(p)
+            stepped.perform_one_step()
+            h_hist.append(stepped.get_h())
+
+        agent = TwoCompHydAgent(an=18000, cp=250, phi=phi, psi=psi, hz=10)
+        levels = agent.perform_power_steps(course)
+        assert len(levels) == len(course)
+        assert np.allclose(levels, h_hist, rtol=0, atol=1e-12)
+        assert agent.get_time() == stepped.get_time()
+        assert math.isclose(agent.get_p_ae(), stepped.get_p_ae(), abs_tol=1e-12)
+
+        # the segment that exhausts the agent is the last one
+        agent.reset()
+        levels = agent.perform_power_steps(course, stop_at_exhaustion=True)
+        assert agent.is_exhausted()
+        assert len(levels) == h_hist.index(1.0 - psi) + 1
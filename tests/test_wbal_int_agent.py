@@ -0,0 +1,88 @@
+import numpy as np
+
+from pypermod.agents.wbal_agents.wbal_int_agent_fix_tau import WbalIntAgentFixTau
+from pypermod.agents.wbal_agents.wbal_int_agent_skiba import WbalIntAgentSkiba
+
+
+def create_intermittent_course():
+    """
+    an intermittent course with work bouts above and recovery bouts below CP
+    """
+    course = ([400] * 60 + [100] * 30) * 8 + [450] * 120 + [0] * 100
+    return np.array(course, dtype=float)
+
+
+def test_recursive_engine_matches_convolution():
+    course = create_intermittent_course()
+    for recursive_agent, convolution_agent in [
+        (WbalIntAgentSkiba(w_p=20000, cp=250), WbalIntAgentSkiba(w_p=20000, cp=250, recursive=False)),
+        (WbalIntAgentFixTau(w_p=15000, cp=200, tau=300), WbalIntAgentFixTau(w_p=15000, cp=200, tau=300,
+                                                                          recursive=False))
+    ]:
+        rec = recursive_agent.estimate_w_p_bal_to_data(course)
+        conv = convolution_agent.estimate_w_p_bal_to_data(course)
+        assert type(rec) is list
+        assert len(rec) == len(conv)
+        assert np.allclose(rec, conv, rtol=0, atol=1e-6)
+        # exhaustion points are found at the same time steps
+        assert (np.array(rec) == 0).tolist() == (np.array(conv) == 0).tolist()
+
+
+def test_closed_form_expenditure_dynamics():
+    agent = WbalIntAgentSkiba(w_p=20000, cp=250)
+    tau = agent._get_tau_to_dcp(0)
+    for p_exp in [300, 350, 600]:
+        # reference: the convolution sum of a constant W'exp
+        w_bal_hist = []
+        t = 0
+        while not w_bal_hist or w_bal_hist[-1] > 0:
+            sum_t = sum([(p_exp - agent.cp) * pow(np.e, -(t - u) / tau) for u in range(0, t + 1)])
+            w_bal_hist.append(agent.w_p - min(sum_t, agent.w_p))
+            t += 1
+        dynamics = agent.get_expenditure_dynamics(p_exp)
+        assert len(dynamics) == len(w_bal_hist) == agent.get_tte(p_exp)
+        assert np.allclose(dynamics, w_bal_hist, rtol=0, atol=1e-6)
+        assert dynamics[-1] == 0
+
+    # the geometric series converges below W'
+    try:
+        agent.get_tte(260)
+        assert False
+    except UserWarning:
+        pass
+
+
+def test_vectorized_recovery_dynamics():
+    agent = WbalIntAgentSkiba(w_p=20000, cp=250)
+    curves = agent.get_recovery_dynamics(np.array([0, 100, 200, 300]), max_steps=600)
+    assert curves.shape == (4, 600)
+    for i, p_rec in enumerate([0, 100, 200]):
+        assert np.allclose(curves[i], agent.get_recovery_dynamics(p_rec, max_steps=600))
+    # no recovery above CP
+    assert np.all(np.isnan(curves[3]))
+
+
+def test_streaming_mode_with_fix_tau():
+    course = create_intermittent_course()
+    agent = WbalIntAgentFixTau(w_p=15000, cp=200, tau=300)
+    offline = agent.estimate_w_p_bal_to_data(course)
+
+    agent.reset()
+    streamed = []
+    for p in course:
+        agent.set_power(p)
+        agent.perform_one_step()
+        streamed.append(agent.get_w_p_balance())
+    assert np.allclose(streamed, offline, rtol=0, atol=1e-6)
+    assert agent.get_time() == len(course)
+
+    # at other hz settings the streamed W'bal only approximates the per-second W'bal of estimate_w_p_bal_to_data
+    agent = WbalIntAgentFixTau(w_p=15000, cp=200, tau=300, hz=2)
+    streamed = []
+    for p in np.repeat(course, 2):
+        agent.set_power(p)
+        agent.perform_one_step()
+        streamed.append(agent.get_w_p_balance())
+    assert agent.get_time() == len(course)
+    assert not np.allclose(streamed[1::2], offline, rtol=0, atol=1e-6)
+    assert np.allclose(streamed[1::2], offline, rtol=0, atol=50)
@@ -0,0 +1,163 @@
+import numpy as np
+
+from pypermod.agents.wbal_agents.wbal_ode_agent_bartram import WbalODEAgentBartram
+from pypermod.agents.wbal_agents.wbal_ode_agent_exponential import WbalODEAgentExponential
+from pypermod.agents.wbal_agents.wbal_ode_agent_fix_tau import WbalODEAgentFixTau
+from pypermod.agents.wbal_agents.wbal_ode_agent_linear import CpODEAgentBasisLinear
+from pypermod.agents.wbal_agents.wbal_ode_agent_population import WbalODEAgentPopulation
+from pypermod.agents.wbal_agents.wbal_ode_agent_skiba import WbalODEAgentSkiba
+from pypermod.agents.wbal_agents.wbal_ode_agent_weigend import WbalODEAgentWeigend
+from pypermod.simulator.simulator_basis import SimulatorBasis
+from pypermod.simulator.study_simulator import StudySimulator
+
+
+def create_agents(hz: int = 1):
+    """
+    two agents of every differential agent type with different parameters
+    """
+    agents = []
+    for agent_type in [CpODEAgentBasisLinear, WbalODEAgentSkiba, WbalODEAgentBartram,
+                       WbalODEAgentWeigend, WbalODEAgentFixTau]:
+        agents.append(agent_type(w_p=18000, cp=240, hz=hz))
+        agents.append(agent_type(w_p=24000, cp=280, hz=hz))
+    return agents
+
+
+def test_population_reproduces_single_agents():
+    rng = np.random.default_rng(1)
+    course = np.repeat(rng.integers(0, 600, 60), 20).astype(float)
+    agents = create_agents(hz=10)
+    population = WbalODEAgentPopulation(agents)
+    # all taus are estimated with vectorized functions
+    assert population.looped_types == []
+    w_bal_hist = population.simulate_course(course)
+    assert w_bal_hist.shape == (len(agents), len(course))
+    for i, agent in enumerate(agents):
+        single = SimulatorBasis.simulate_course(agent, course)
+        assert np.allclose(w_bal_hist[i], single, rtol=0, atol=1e-6)
+        # clamping and exhaustion at the same time steps
+        assert np.array_equal(w_bal_hist[i] == 0, np.array(single) == 0)
+
+
+def test_population_with_custom_tau_estimation():
+    class WbalODEAgentCustom(WbalODEAgentExponential):
+        def _get_tau_to_dcp(self, dcp: float):
+            return 300.0 + dcp
+
+    agents = [WbalODEAgentCustom(w_p=20000, cp=250), WbalODEAgentSkiba(w_p=20000, cp=250)]
+    population = WbalODEAgentPopulation(agents)
+    assert population.looped_types == [WbalODEAgentCustom]
+    course = [400] * 60 + [100] * 120
+    w_bal_hist = population.simulate_course(course)
+    for i, agent in enumerate(agents):
+        assert np.allclose(w_bal_hist[i], SimulatorBasis.simulate_course(agent, course), rtol=0, atol=1e-6)
+
+
+def test_population_with_individual_courses():
+    agents = create_agents()
+    courses = np.array([[300 + 10 * i] * 100 + [100] * 100 for i in range(len(agents))], dtype=float)
+    w_bal_hist = WbalODEAgentPopulation(agents).simulate_course(courses)
+    for i, agent in enumerate(agents):
+        assert np.allclose(w_bal_hist[i], SimulatorBasis.simulate_course(agent, courses[i]), rtol=0, atol=1e-6)
+
+
+def test_piecewise_course_simulation():
+    rng = np.random.default_rng(2)
+    course = np.repeat(rng.integers(0, 600, 40), rng.integers(1, 100, 40)).astype(float)
+    for agent in create_agents(hz=10):
+        w_bal_hist = SimulatorBasis.simulate_course(agent, course)
+        steps = SimulatorBasis.simulate_course_piecewise(agent, course)
+        assert steps == len(course)
+        assert abs(agent.get_w_p_balance() - w_bal_hist[-1]) < 1e-6
+
+        # stop at the first point of exhaustion
+        exhausted = np.flatnonzero(np.array(w_bal_hist) == 0)
+        if len(exhausted) > 0:
+            steps = SimulatorBasis.simulate_course_piecewise(agent, course, stop_at_exhaustion=True)
+            assert steps == exhausted[0] + 1
+            assert agent.is_exhausted()
+
+
+def test_constant_power_steps_match_stepping():
+    # rounding errors of repeated subtractions decide about the last step, e.g. at 416 W
+    stepped_agent = CpODEAgentBasisLinear(w_p=17589, cp=293, hz=10)
+    agent = CpODEAgentBasisLinear(w_p=17589, cp=293, hz=10)
+    for p in list(range(300, 1000, 3)) + [416, 416.5]:
+        stepped_agent.reset()
+        w_bal_hist = []
+        while not stepped_agent.is_exhausted():
+            stepped_agent.set_power(p)
+            stepped_agent.perform_one_step()
+            w_bal_hist.append(stepped_agent.get_w_p_balance())
+
+        agent.reset()
+        assert agent.perform_constant_power_steps(p, len(w_bal_hist) - 1) == len(w_bal_hist) - 1
+        assert agent.get_w_p_balance() == w_bal_hist[-2] and not agent.is_exhausted()
+        assert agent.perform_constant_power_steps(p, 10 ** 6, stop_at_exhaustion=True) == 1
+        assert agent.is_exhausted() and agent.get_power() == stepped_agent.get_power()
+
+
+def test_time_to_exhaustion_query():
+    for agent in create_agents(hz=10):
+        assert agent.time_to_exhaustion(agent.cp) == np.inf
+        for p in [300, 450, 800]:
+            agent.reset()
+            agent.set_power(400)
+            for _ in range(300):
+                agent.perform_one_step()
+            expected = agent.time_to_exhaustion(p)
+            assert expected < agent.time_to_exhaustion(p, from_current_state=False)
+
+            # stepping from the current state takes exactly as long
+            start = agent.get_time()
+            agent.set_power(p)
+            while not agent.is_exhausted():
+                agent.perform_one_step()
+            assert round((agent.get_time() - start) * agent.hz) == round(expected * agent.hz)
+            assert agent.time_to_exhaustion(p) == 0
+
+    # the closed form equals stepping from a fully recovered W' over a range of powers at 10 Hz
+    for agent in [WbalODEAgentSkiba(w_p=17589, cp=293, hz=10), WbalODEAgentWeigend(w_p=21100, cp=241.5, hz=10)]:
+        for p in range(int(agent.cp) + 10, 1000, 7):
+            tte = agent.time_to_exhaustion(p, from_current_state=False)
+            agent.reset()
+            steps = 0
+            while not agent.is_exhausted():
+                agent.set_power(p)
+                agent.perform_one_step()
+                steps += 1
+            assert tte == steps / agent.hz
+
+
+def test_decay_table_lookup():
+    agent = WbalODEAgentFixTau(w_p=18000, cp=240, hz=10, tau=300)
+    for p in [0, 100, 239, 120.5]:
+        assert agent._get_decay(p) == pow(np.e, (-1 / 300) * 0.1)
+    # changed tau invalidates the table
+    agent.set_tau(150)
+    assert agent._get_decay(100) == pow(np.e, (-1 / 150) * 0.1)
+
+    agent = WbalODEAgentWeigend(w_p=18000, cp=240, hz=1)
+    for p in [0, 100, 239, 120.5]:
+        tau = agent._get_tau_to_dcp(agent.cp - p)
+        assert agent._get_decay(p) == pow(np.e, (-1 / tau))
+    # tau estimation still accepts arrays
+    dcps = agent.cp - np.array([0, 100, 239, 120.5])
+    assert np.array_equal(agent._get_tau_to_dcp(dcps), [agent._get_tau_to_dcp(dcp) for dcp in dcps])
+
+
+def test_recovery_ratios_from_wb1_snapshot():
+    for agent in create_agents(hz=2):
+        wb1_state = SimulatorBasis.get_wb1_state(agent, p_work=400)
+        for t_rec in [30, 200]:
+            ratio = SimulatorBasis.get_recovery_ratio_wb1_wb2(agent, p_work=400, p_rec=100, t_rec=t_rec)
+            assert SimulatorBasis.get_recovery_ratio_wb1_wb2(agent, p_work=400, p_rec=100, t_rec=t_rec,
+                                                             wb1_state=wb1_state) == ratio
+
+
+def test_single_pass_recovery_sweep():
+    rec_times = [240, 10, 60, 60, 0, 600]
+    for agent in create_agents(hz=2):
+        ratios = StudySimulator.get_recovery_ratios_wb1_wb2(agent, p_work=400, p_rec=100, rec_times=rec_times)
+        assert ratios == [SimulatorBasis.get_recovery_ratio_wb1_wb2(agent, p_work=400, p_rec=100, t_rec=t_rec)
+                          for t_rec in rec_times]